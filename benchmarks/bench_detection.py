@@ -0,0 +1,76 @@
+"""Compares the scalar skip and full listen detection of the engine with the batch detector. Run from the root of
+the repository with python -m benchmarks.bench_detection [sessions]
+"""
+
+import random
+import sys
+import timeit
+
+from spotify_playlist_additions import detection
+from spotify_playlist_additions.detection import detect_batch
+from spotify_playlist_additions.playback import PlaybackState
+from spotify_playlist_additions.spotify_playlist_additions import (_detect_fully_listened_track,
+                                                                   _detect_skipped_track)
+
+BUFFER = 200
+
+
+def _frames(sessions: int):
+    """One frame per session, along with the frame before it."""
+    generator = random.Random(0)
+    previous, current = [], []
+    for _ in range(sessions):
+        duration = generator.randint(120000, 300000)
+        previous_number = generator.randint(0, 999)
+        current_number = previous_number if generator.random() < 0.9 else generator.randint(0, 999)
+        previous.append(PlaybackState.from_api({
+            "progress_ms": generator.randint(0, duration),
+            "item": {"id": "id%d" % previous_number, "name": "Track %d" % previous_number, "duration_ms": duration},
+        }))
+        current.append(PlaybackState.from_api({
+            "progress_ms": 0,
+            "item": {"id": "id%d" % current_number, "name": "Track %d" % current_number, "duration_ms": duration},
+        }))
+    return previous, current
+
+
+def _scalar(previous, current):
+    """Detection as the engine does it, one session at a time."""
+    results = []
+    for previous_track, track in zip(previous, current):
+        remaining_duration = previous_track.remaining_ms
+        if _detect_skipped_track(remaining_duration, BUFFER, track, previous_track):
+            results.append(1)
+        elif _detect_fully_listened_track(remaining_duration, BUFFER):
+            results.append(2)
+        else:
+            results.append(0)
+    return results
+
+
+def main() -> int:
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    previous, current = _frames(sessions)
+
+    columns = ([state.track.name for state in previous], [state.track.name for state in current],
+               [state.progress_ms for state in previous], [state.track.duration_ms for state in previous])
+    candidates = {"scalar": lambda: _scalar(previous, current)}
+    candidates["batch, pure python"] = lambda: detect_batch(*columns, BUFFER, use_numpy=False)
+    if detection.numpy is not None:
+        numpy = detection.numpy
+        arrays = [numpy.asarray(column) for column in columns]
+        candidates["batch, numpy"] = lambda: detect_batch(*columns, BUFFER, use_numpy=True)
+        candidates["batch, numpy, columns already arrays"] = lambda: detect_batch(*arrays, BUFFER, use_numpy=True)
+
+    print("%d sessions per tick" % sessions)
+    baseline = None
+    for name, candidate in candidates.items():
+        runs, total = timeit.Timer(candidate).autorange()
+        per_tick = total / runs
+        baseline = baseline or per_tick
+        print("%-40s %8.3fms per tick, %5.1fx" % (name, per_tick * 1000, baseline / per_tick))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Contains an offline stand-in for the blocking spotipy client and a scheduler that polls as fast as it can, so the
+engine can be benchmarked without a network or a user
+"""
+
+import asyncio
+from typing import List, Optional
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playback import PlaybackState
+from spotify_playlist_additions.rate_limit import TokenBucket
+from spotify_playlist_additions.scheduler import PollScheduler
+
+PLAYLIST_ID = "playlist"
+
+# The shortest track of the listening session, in milliseconds
+DURATION_MS = 180000
+
+
+def listening_session(tracks: int, frames_per_track: int = 4, catalogue: int = 1000) -> List[dict]:
+    """The payloads of the currently playing endpoint for a session in which every other track is skipped halfway and
+    the rest are listened to the end.
+
+    Args:
+        tracks: How many tracks are played.
+        frames_per_track: How many frames each track is seen on.
+        catalogue: How many different tracks are played. Tracks below half of it are in the playlist of StubSpotify
+            when its playlist is at least that large.
+
+    Returns:
+        List[dict]: The payloads, one per frame.
+    """
+
+    payloads = []
+    for play in range(tracks):
+        number = (play * 7919) % catalogue
+        item = {"id": "id%d" % number, "uri": "spotify:track:id%d" % number, "name": "Track %d" % number,
+                "duration_ms": DURATION_MS + number}
+        last_progress = item["duration_ms"] - 100 if play % 2 else item["duration_ms"] // 2
+        for frame in range(frames_per_track):
+            progress = last_progress * frame // max(frames_per_track - 1, 1)
+            payloads.append({"is_playing": True, "progress_ms": progress, "item": item})
+    return payloads
+
+
+class StubSpotify:
+    """Serves a playlist and a listening session from memory, in place of spotipy.Spotify."""
+    def __init__(self, playlist_size: int, payloads: List[dict]):
+        """Initializer for a StubSpotify.
+
+        Args:
+            playlist_size: How many tracks the playlist has.
+            payloads: The payloads of the currently playing endpoint, served in a loop.
+        """
+
+        self.playlist_size = playlist_size
+        self.payloads = payloads
+        self.frame = 0
+        self.snapshot_id = "snapshot"
+
+    def current_user(self) -> dict:
+        return {"id": "user"}
+
+    def playlist(self, playlist_id: str, fields: str = None) -> dict:
+        return {"id": playlist_id, "name": "Benchmark", "snapshot_id": self.snapshot_id}
+
+    def playlist_tracks(self, playlist_id: str, fields: str = None, offset: int = 0, limit: int = 100) -> dict:
+        return {"items": [{"track": {"id": "id%d" % number, "uri": "spotify:track:id%d" % number}}
+                          for number in range(offset, min(offset + limit, self.playlist_size))],
+                "total": self.playlist_size}
+
+    def currently_playing(self, *args, **kwargs) -> Optional[dict]:
+        payload = self.payloads[self.frame % len(self.payloads)]
+        self.frame += 1
+        return payload
+
+    def user_playlist_add_tracks(self, user_id: str, playlist_id: str, tracks: List[str]) -> dict:
+        self.snapshot_id += "+"
+        return {"snapshot_id": self.snapshot_id}
+
+    def user_playlist_remove_all_occurrences_of_tracks(self, user_id: str, playlist_id: str,
+                                                       tracks: List[str]) -> dict:
+        self.snapshot_id += "-"
+        return {"snapshot_id": self.snapshot_id}
+
+
+def stub_client(spotify: StubSpotify) -> AsyncSpotify:
+    """Wraps a stub in an AsyncSpotify whose rate limiter never makes it wait.
+
+    Args:
+        spotify: The stub.
+
+    Returns:
+        AsyncSpotify: The client.
+    """
+
+    return AsyncSpotify(spotify, max_workers=4, rate_limiter=TokenBucket(rate=1e9, capacity=1e9))
+
+
+class CountingScheduler(PollScheduler):
+    """Polls again straight away, and tells when a set amount of frames have been polled."""
+    def __init__(self, frames: int):
+        """Initializer for a CountingScheduler.
+
+        Args:
+            frames: After how many frames done is resolved.
+        """
+
+        super().__init__()
+        self.frames = frames
+        self.polled = 0
+        self.first_frame_at: float = None
+        self.last_frame_at: float = None
+        self.done = asyncio.get_event_loop().create_future()
+
+    def next_wait(self, track: Optional[PlaybackState]) -> float:
+        loop = asyncio.get_event_loop()
+        self.polled += 1
+        if self.polled == 1:
+            self.first_frame_at = loop.time()
+        if self.polled == self.frames:
+            self.last_frame_at = loop.time()
+            self.done.set_result(None)
+        return 0
+
+    @property
+    def seconds_per_frame(self) -> float:
+        """How long each frame after the first took, once done"""
+
+        return (self.last_frame_at - self.first_frame_at) / max(self.frames - 1, 1)
@@ -0,0 +1,255 @@
+"""Runs the benchmarks of the engine offline against a stubbed client and compares them with a stored baseline, failing
+when a result has regressed past a threshold. Run from the root of the repository with python -m benchmarks.suite, or
+make bench. Timings are the best of several repeats, and only compare with a baseline recorded on the same machine, so
+record a new one with --save (make bench-baseline) wherever the comparison runs.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.bench_detection import BUFFER, _frames, _scalar
+from benchmarks.stubs import DURATION_MS, PLAYLIST_ID, CountingScheduler, StubSpotify, listening_session, stub_client
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlists.abstract import AbstractPlaylist
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.playlists.autoremove import AutoRemovePlaylist
+from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Loose enough for a shared machine, where timings vary by a third between runs; a result that scales worse with the
+# playlist or the amount of addons regresses by far more than this
+DEFAULT_THRESHOLD = 0.5
+
+class _IdleAddon(AbstractPlaylist):
+    """An addon that ignores every event, for the cost of the engine on its own"""
+
+    scope = ""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def handle_skipped_track(self, track: Track):
+        pass
+
+    async def handle_fully_listened_track(self, track: Track):
+        pass
+
+
+def _best(function: Callable[[], object], repeat: int = 7) -> float:
+    """Times a function.
+
+    Args:
+        function: The function.
+        repeat: How many times to time it.
+
+    Returns:
+        float: The fastest run, in seconds.
+    """
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def bench_detection(sessions: int = 10000) -> Dict[str, dict]:
+    """The skip and full listen detection the engine does on every frame."""
+    previous, current = _frames(sessions)
+    per_tick = _best(lambda: _scalar(previous, current))
+    return {"detection.scalar": {"value": per_tick / sessions * 1e9, "unit": "ns"}}
+
+
+def bench_playlist_contains(sizes: List[int] = (100, 10000, 100000)) -> Dict[str, dict]:
+    """AutoAddPlaylist._playlist_contains_track at different playlist sizes, half of the lookups hitting."""
+    results = {}
+    playlist = {"id": PLAYLIST_ID, "name": "Benchmark"}
+    for size in sizes:
+        index = PlaylistIndex(None, playlist)
+        index.update({"id": "id%d" % number, "uri": "spotify:track:id%d" % number} for number in range(size))
+        addon = AutoAddPlaylist(None, playlist, "user", index, None)
+        tracks = [Track("id%d" % number, "spotify:track:id%d" % number, "Track", DURATION_MS)
+                  for number in range(0, 2 * size, max(2 * size // 1000, 1))]
+
+        def lookups():
+            for track in tracks:
+                addon._playlist_contains_track(track)
+
+        results["playlist_contains_track[%d]" % size] = {"value": _best(lookups) / len(tracks) * 1e9, "unit": "ns"}
+    return results
+
+
+async def _run_engine(addons: list, frames: int, playlist_size: int = 1000) -> float:
+    """Runs an engine against a stubbed client until it has polled a number of frames.
+
+    Returns:
+        float: How long each frame took, in seconds.
+    """
+
+    spotify = StubSpotify(playlist_size, listening_session(frames // 4 + 1))
+    client = stub_client(spotify)
+    scheduler = CountingScheduler(frames)
+    engine = SpotifyPlaylistEngine(search_wait=BUFFER,
+                                   playlists=[{"id": PLAYLIST_ID}],
+                                   scheduler=scheduler,
+                                   spotify_client=client,
+                                   addons=addons)
+    task = asyncio.ensure_future(engine.start())
+    await asyncio.wait([task, scheduler.done], return_when=asyncio.FIRST_COMPLETED)
+    await engine.stop()
+    await task
+    client.close()
+    return scheduler.seconds_per_frame
+
+
+def bench_engine_frames(frames: int = 400, repeat: int = 5) -> Dict[str, dict]:
+    """The cost of a frame of SpotifyPlaylistEngine.start, including handing its events to the addons."""
+    configurations = {
+        "idle addon": [_IdleAddon],
+        "autoadd+autoremove": [AutoAddPlaylist, AutoRemovePlaylist],
+        "8 addons": [AutoAddPlaylist, AutoRemovePlaylist] * 4,
+    }
+
+    results = {}
+    for name, addons in configurations.items():
+        best = min(_run_fresh(_run_engine(addons, frames)) for _ in range(repeat))
+        results["engine.frame[%s]" % name] = {"value": best * 1e6, "unit": "us"}
+    return results
+
+
+def bench_session_memory(sessions: int = 10, frames: int = 40, playlist_size: int = 1000) -> Dict[str, dict]:
+    """The memory a running session holds on to, with a playlist of playlist_size tracks."""
+    async def run_sessions():
+        payloads = listening_session(frames // 4 + 1)
+        stubs = [StubSpotify(playlist_size, payloads) for _ in range(sessions)]
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        clients = [stub_client(spotify) for spotify in stubs]
+        schedulers = [CountingScheduler(frames) for _ in stubs]
+        engines = [
+            SpotifyPlaylistEngine(search_wait=BUFFER, playlists=[{"id": PLAYLIST_ID}], scheduler=scheduler,
+                                  spotify_client=client, addons=[AutoAddPlaylist, AutoRemovePlaylist])
+            for client, scheduler in zip(clients, schedulers)
+        ]
+        tasks = [asyncio.ensure_future(engine.start()) for engine in engines]
+        await asyncio.gather(*[scheduler.done for scheduler in schedulers])
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        for engine, client in zip(engines, clients):
+            await engine.stop()
+            client.close()
+        await asyncio.gather(*tasks)
+        return held / sessions
+
+    return {"session.memory": {"value": _run_fresh(run_sessions()) / 1024, "unit": "KiB"}}
+
+
+def _run_fresh(coroutine) -> object:
+    """Runs a coroutine on a new event loop, so that no benchmark is slowed down by what an earlier one left behind."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+BENCHMARKS = [bench_detection, bench_playlist_contains, bench_engine_frames, bench_session_memory]
+
+
+def run_benchmarks() -> dict:
+    """Runs every benchmark.
+
+    Returns:
+        dict: The Python version and every result, by name, in the format of the baseline.
+    """
+
+    results = {}
+    for benchmark in BENCHMARKS:
+        results.update(benchmark())
+    return {"python": platform.python_version(), "results": results}
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[tuple]:
+    """Compares results with a baseline. Every result is lower is better.
+
+    Args:
+        baseline: The baseline, see run_benchmarks.
+        current: The results, see run_benchmarks.
+        threshold: How much worse than the baseline a result can be before it counts as a regression, as a fraction.
+
+    Returns:
+        List[tuple]: The name, baseline value, current value, unit, relative change and whether it regressed, of every
+            current result. The baseline value and change are None for results the baseline does not have.
+    """
+
+    rows = []
+    for name, result in current["results"].items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            rows.append((name, None, result["value"], result["unit"], None, False))
+            continue
+        change = result["value"] / expected["value"] - 1
+        rows.append((name, expected["value"], result["value"], result["unit"], change, change > threshold))
+    return rows
+
+
+def main() -> int:
+    """Console entry point for the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE, help="the baseline to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline instead of comparing")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help="how much slower or larger than the baseline a result can be, as a fraction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    current = run_benchmarks()
+
+    if args.save or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(current, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("Saved the baseline to %s" % args.baseline)
+        for name, result in sorted(current["results"].items()):
+            print("%-40s %12.1f %s" % (name, result["value"], result["unit"]))
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline["python"] != current["python"]:
+        print("The baseline was recorded on Python %s, timings may not compare" % baseline["python"])
+
+    regressions = 0
+    print("%-40s %12s %12s %8s" % ("benchmark", "baseline", "now", "change"))
+    for name, expected, value, unit, change, regressed in compare(baseline, current, args.threshold):
+        regressions += regressed
+        if change is None:
+            print("%-40s %12s %12.1f %-4s (not in the baseline)" % (name, "", value, unit))
+        else:
+            print("%-40s %12.1f %12.1f %-4s %+6.0f%%%s" % (name, expected, value, unit, change * 100,
+                                                            "  REGRESSED" if regressed else ""))
+
+    if regressions:
+        print("%d benchmarks regressed by more than %.0f%%" % (regressions, args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
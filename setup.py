@@ -37,9 +37,13 @@ setup(
     entry_points={
         'console_scripts': [
             'spotify_playlist_additions=spotify_playlist_additions.cli:main',
+            'spotify_playlist_additions_supervisor=spotify_playlist_additions.cli:supervise',
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'fast': ['numpy'],
+    },
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
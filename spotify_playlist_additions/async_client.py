@@ -0,0 +1,334 @@
+"""Contains an asyncio wrapper around the blocking spotipy client"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+import requests
+from spotipy import Spotify, SpotifyException
+
+from spotify_playlist_additions.metadata import DEFAULT_MAX_BYTES, MetadataService
+from spotify_playlist_additions.metrics import (SPOTIFY_ERRORS, SPOTIFY_PARSE_SECONDS, SPOTIFY_REQUEST_SECONDS,
+                                                SPOTIFY_RESPONSE_BYTES, SPOTIFY_RESPONSES)
+from spotify_playlist_additions.rate_limit import CircuitBreaker, TokenBucket, jittered_backoff
+
+LOG = logging.getLogger(__name__)
+
+# Returned by PollingSpotify.currently_playing when the currently playing endpoint answered 304 Not Modified
+NOT_MODIFIED = object()
+
+
+def _retry_after(exception: SpotifyException) -> float:
+    """Reads how long the API asked us to wait from a 429 response, defaulting to a second if it didn't say.
+
+    Args:
+        exception: The exception raised by spotipy for the 429 response.
+
+    Returns:
+        float: How many seconds to wait.
+    """
+
+    try:
+        return float((exception.headers or {}).get("Retry-After", 1))
+    except ValueError:
+        return 1
+
+
+class _EndpointMetrics:
+    """The metric children of a single endpoint, looked up once so that recording a request allocates nothing"""
+
+    __slots__ = ("latency", "rate_limited", "server_error", "timeout", "connection_error")
+
+    def __init__(self, endpoint: str):
+        self.latency = SPOTIFY_REQUEST_SECONDS.labels(endpoint)
+        self.rate_limited = SPOTIFY_ERRORS.labels(endpoint, "rate_limited")
+        self.server_error = SPOTIFY_ERRORS.labels(endpoint, "server_error")
+        self.timeout = SPOTIFY_ERRORS.labels(endpoint, "timeout")
+        self.connection_error = SPOTIFY_ERRORS.labels(endpoint, "connection_error")
+
+
+class PollingSpotify(Spotify):
+    """A spotipy client that makes the currently playing endpoint, which is polled many times a minute, as cheap as the
+    API allows. The ETag of the last response is sent back as If-None-Match, so that a poll where nothing has changed
+    is answered with an empty 304, and a 204 while nothing is playing is read as None without trying to parse it.
+
+    The currently playing endpoint has no fields filter, so the response is trimmed by asking for tracks only, which
+    leaves episodes as an empty item. The size and parse time of every response is recorded in the metrics.
+    """
+    def __init__(self, *args, **kwargs):
+        """Initializer for a PollingSpotify. Takes the same arguments as Spotify."""
+
+        super().__init__(*args, **kwargs)
+        self._etag = None
+        self._ok = SPOTIFY_RESPONSES.labels("currently_playing", "ok")
+        self._not_modified = SPOTIFY_RESPONSES.labels("currently_playing", "not_modified")
+        self._no_content = SPOTIFY_RESPONSES.labels("currently_playing", "no_content")
+        self._bytes = SPOTIFY_RESPONSE_BYTES.labels("currently_playing")
+        self._parse_seconds = SPOTIFY_PARSE_SECONDS.labels("currently_playing")
+
+    def currently_playing(self, market: str = None, additional_types: str = "track") -> Any:
+        """See Spotify.currently_playing
+
+        Raises:
+            SpotifyException: If the API answered with an error.
+
+        Returns:
+            Any: The payload, None if nothing is playing, or NOT_MODIFIED if nothing has changed since the last call.
+        """
+
+        params = {"additional_types": additional_types}
+        if market:
+            params["market"] = market
+        headers = self._auth_headers()
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+
+        response = self._session.get(self.prefix + "me/player/currently-playing",
+                                     headers=headers,
+                                     params=params,
+                                     proxies=self.proxies,
+                                     timeout=self.requests_timeout)
+        if response.status_code == 304:
+            self._not_modified.inc()
+            return NOT_MODIFIED
+        if response.status_code >= 400:
+            raise SpotifyException(response.status_code,
+                                   -1,
+                                   "%s:\n %s" % (response.url, response.text or None),
+                                   headers=response.headers)
+
+        self._bytes.inc(len(response.content))
+        if response.status_code == 204 or not response.content:
+            self._no_content.inc()
+            self._etag = None
+            return None
+
+        parse_started = time.perf_counter()
+        payload = response.json()
+        parse_seconds = time.perf_counter() - parse_started
+        self._parse_seconds.observe(parse_seconds)
+        self._ok.inc()
+        self._etag = response.headers.get("ETag")
+
+        LOG.debug("Currently playing: %s bytes, parsed in %.3fms", len(response.content), parse_seconds * 1000)
+        return payload
+
+
+class AsyncSpotify:
+    """Makes Spotify API calls without blocking the event loop. spotipy only offers a blocking client, so every call is
+    run on a bounded pool of worker threads and awaited from the event loop. The size of the pool is the maximum amount
+    of requests that can be running at once.
+
+    Every request goes through a token bucket rate limiter and a circuit breaker. A 429 response pauses every request
+    for as long as its Retry-After header asks, while timeouts, connection errors and 5xx responses are retried with a
+    jittered exponential backoff. The wrapped client should not retry on its own, see create_session.
+    """
+    def __init__(self,
+                 spotify_client: Spotify,
+                 max_workers: int = 8,
+                 rate_limiter: TokenBucket = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 max_retries: int = 3,
+                 executor: ThreadPoolExecutor = None,
+                 metadata_cache_bytes: int = DEFAULT_MAX_BYTES):
+        """Initializer for an AsyncSpotify.
+
+        Args:
+            spotify_client: The blocking spotipy client that makes the actual requests.
+            max_workers: The maximum amount of requests that can be running at once.
+            rate_limiter: Limits the rate of requests. Can be shared between clients.
+            circuit_breaker: Stops requests while the API is failing. Can be shared between clients.
+            max_retries: How many times a failed request is retried before its error is raised.
+            executor: The worker pool to make requests on, shared with other clients. The client creates and owns a
+                pool of max_workers threads if this is not given.
+            metadata_cache_bytes: The approximate size the cache of the metadata service is bounded to, see metadata.
+        """
+
+        self._spotify_client = spotify_client
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="spotify")
+        self._rate_limiter = rate_limiter or TokenBucket()
+        self._circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._max_retries = max_retries
+        self._endpoint_metrics = {}
+        self._metadata_cache_bytes = metadata_cache_bytes
+        self._metadata: MetadataService = None
+
+    @staticmethod
+    def create_session() -> requests.Session:
+        """Creates a requests session for a spotipy client that does not retry on its own. spotipy's default session
+        sleeps through retries inside the worker threads and drops the Retry-After header of the final 429.
+
+        Returns:
+            requests.Session: The session to pass to spotipy.
+        """
+
+        return requests.Session()
+
+    @property
+    def sync(self) -> Spotify:
+        """The wrapped blocking client, for code that runs before the event loop has been started.
+
+        Returns:
+            Spotify: The spotipy client.
+        """
+
+        return self._spotify_client
+
+    @property
+    def metadata(self) -> MetadataService:
+        """Looks metadata up in batches and caches it, for every addon that uses this client. Created the first time it
+        is used.
+
+        Returns:
+            MetadataService: The metadata service.
+        """
+
+        if self._metadata is None:
+            self._metadata = MetadataService(self, max_bytes=self._metadata_cache_bytes)
+        return self._metadata
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Calls a method of the spotipy client on the worker pool, retrying it if it fails in a way that is likely to
+        be temporary.
+
+        Args:
+            method: The name of the spotipy method to call.
+            *args: Positional arguments passed on to the method.
+            **kwargs: Keyword arguments passed on to the method.
+
+        Raises:
+            CircuitOpenError: If the API has been failing and requests are paused.
+
+        Returns:
+            Any: Whatever the spotipy method returned.
+        """
+
+        function = functools.partial(getattr(self._spotify_client, method), *args, **kwargs)
+        metrics = self._endpoint_metrics.get(method)
+        if metrics is None:
+            metrics = self._endpoint_metrics[method] = _EndpointMetrics(method)
+
+        attempt = 0
+        while True:
+            self._circuit_breaker.check()
+            await self._rate_limiter.acquire()
+
+            request_started = time.monotonic()
+            try:
+                result = await asyncio.get_event_loop().run_in_executor(self._executor, function)
+            except SpotifyException as e:
+                metrics.latency.observe(time.monotonic() - request_started)
+                if e.http_status == 429:
+                    metrics.rate_limited.inc()
+                    delay = _retry_after(e)
+                    LOG.warning("Rate limited by Spotify during %s, pausing requests for %s seconds", method, delay)
+                    self._rate_limiter.pause(delay)
+                    # Being rate limited says nothing about whether the API is healthy, so it is not a failure
+                    delay = 0
+                elif e.http_status >= 500:
+                    metrics.server_error.inc()
+                    self._circuit_breaker.record_failure()
+                    delay = jittered_backoff(attempt)
+                else:
+                    raise
+                if attempt >= self._max_retries:
+                    raise
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    metrics.timeout.inc()
+                else:
+                    metrics.connection_error.inc()
+                self._circuit_breaker.record_failure()
+                if attempt >= self._max_retries:
+                    raise
+                delay = jittered_backoff(attempt)
+                LOG.debug("%s failed with %s, retrying in %.2f seconds", method, e, delay)
+            else:
+                metrics.latency.observe(time.monotonic() - request_started)
+                self._circuit_breaker.record_success()
+                return result
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def current_user(self) -> dict:
+        """See Spotify.current_user"""
+
+        return await self.call("current_user")
+
+    async def currently_playing(self) -> Any:
+        """See Spotify.currently_playing, and PollingSpotify.currently_playing for what the wrapped client can return"""
+
+        return await self.call("currently_playing")
+
+    async def current_user_recently_played(self, limit: int = 50, after: int = None) -> dict:
+        """See Spotify.current_user_recently_played"""
+
+        return await self.call("current_user_recently_played", limit=limit, after=after)
+
+    async def current_user_playlists(self, limit: int = 50, offset: int = 0) -> dict:
+        """See Spotify.current_user_playlists"""
+
+        return await self.call("current_user_playlists", limit=limit, offset=offset)
+
+    async def current_user_saved_tracks(self, limit: int = 20, offset: int = 0) -> dict:
+        """See Spotify.current_user_saved_tracks"""
+
+        return await self.call("current_user_saved_tracks", limit=limit, offset=offset)
+
+    async def playlist(self, playlist_id: str, fields: str = None) -> dict:
+        """See Spotify.playlist"""
+
+        return await self.call("playlist", playlist_id, fields=fields)
+
+    async def playlist_tracks(self, playlist_id: str, fields: str = None, offset: int = 0, limit: int = 100) -> dict:
+        """See Spotify.playlist_tracks"""
+
+        return await self.call("playlist_tracks", playlist_id, fields=fields, offset=offset, limit=limit)
+
+    async def track(self, track_id: str) -> dict:
+        """See Spotify.track"""
+
+        return await self.call("track", track_id)
+
+    async def tracks(self, track_ids: List[str]) -> dict:
+        """See Spotify.tracks"""
+
+        return await self.call("tracks", track_ids)
+
+    async def artists(self, artist_ids: List[str]) -> dict:
+        """See Spotify.artists"""
+
+        return await self.call("artists", artist_ids)
+
+    async def albums(self, album_ids: List[str]) -> dict:
+        """See Spotify.albums"""
+
+        return await self.call("albums", album_ids)
+
+    async def audio_features(self, track_ids: List[str]) -> List[Optional[dict]]:
+        """See Spotify.audio_features"""
+
+        return await self.call("audio_features", track_ids)
+
+    async def user_playlist_add_tracks(self, user_id: str, playlist_id: str, tracks: List[str]) -> dict:
+        """See Spotify.user_playlist_add_tracks"""
+
+        return await self.call("user_playlist_add_tracks", user_id, playlist_id, tracks)
+
+    async def user_playlist_remove_all_occurrences_of_tracks(self, user_id: str, playlist_id: str,
+                                                             tracks: List[str]) -> dict:
+        """See Spotify.user_playlist_remove_all_occurrences_of_tracks"""
+
+        return await self.call("user_playlist_remove_all_occurrences_of_tracks", user_id, playlist_id, tracks)
+
+    def close(self) -> None:
+        """Stops the worker pool, unless it is shared. Requests that are already running are allowed to finish.
+        """
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,220 @@
+"""Contains the token manager, which keeps the OAuth tokens of a user in memory and refreshes them before they expire"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Optional
+
+from spotipy.cache_handler import CacheFileHandler, CacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+
+from spotify_playlist_additions.rate_limit import jittered_backoff
+
+LOG = logging.getLogger(__name__)
+
+# How long before a token expires it is refreshed. spotipy refreshes a token itself, inside whatever request is being
+# made, once it is within 60 seconds of expiring, so this has to be comfortably more than that.
+REFRESH_MARGIN = 300
+
+
+class TokenStore(ABC):
+    """Where the tokens of one or more users are kept between runs. Only read when a TokenManager starts and written
+    when a token changes, so it can be as slow as it needs to be.
+    """
+    @abstractmethod
+    def load(self, key: str) -> Optional[dict]:
+        """Reads the token of a user.
+
+        Args:
+            key: Identifies the user.
+
+        Returns:
+            Optional[dict]: The token, in the format spotipy caches it in, or None if there is none.
+        """
+
+    @abstractmethod
+    def save(self, key: str, token: dict) -> None:
+        """Writes the token of a user, replacing whatever was there before.
+
+        Args:
+            key: Identifies the user.
+            token: The token, in the format spotipy caches it in.
+        """
+
+
+class FileTokenStore(TokenStore):
+    """Keeps the token of a single user in a file, in the same format spotipy's own cache file uses, so existing token
+    files keep working. The key is ignored.
+    """
+    def __init__(self, path: str = ".tokens.txt"):
+        """Initializer for a FileTokenStore.
+
+        Args:
+            path: Where the token is kept.
+        """
+
+        self._cache_file = CacheFileHandler(cache_path=path)
+
+    def load(self, key: str) -> Optional[dict]:
+        return self._cache_file.get_cached_token()
+
+    def save(self, key: str, token: dict) -> None:
+        self._cache_file.save_token_to_cache(token)
+
+
+class SQLiteTokenStore(TokenStore):
+    """Keeps the tokens of many users in a single SQLite database, which every process of a deployment can share
+    """
+    def __init__(self, path: str = "tokens.sqlite3"):
+        """Initializer for a SQLiteTokenStore. Creates the database if it does not exist yet.
+
+        Args:
+            path: Where the database is kept.
+        """
+
+        # Tokens are saved from whichever thread refreshed them
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, token TEXT NOT NULL)")
+
+    def load(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT token FROM tokens WHERE key = ?", (key, )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key: str, token: dict) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO tokens (key, token) VALUES (?, ?)",
+                                     (key, json.dumps(token)))
+
+    def close(self) -> None:
+        """Closes the database
+        """
+
+        self._connection.close()
+
+
+class TokenManager(CacheHandler):
+    """A spotipy cache handler that keeps the token of a user in memory, so that authenticating a request never touches
+    the disk. The token is read from its store once, when the manager starts, and only written back when it changes.
+
+    Once started, the token is refreshed in the background REFRESH_MARGIN seconds before it expires, so that spotipy
+    never has to refresh it in the middle of a request. If a background refresh keeps failing, spotipy still refreshes
+    the token itself once it is about to expire.
+    """
+    def __init__(self, token_store: TokenStore = None, key: str = "default", refresh_margin: float = REFRESH_MARGIN):
+        """Initializer for a TokenManager.
+
+        Args:
+            token_store: Where the token is kept between runs. Defaults to the .tokens.txt file.
+            key: Identifies the user in the token store.
+            refresh_margin: How many seconds before the token expires it is refreshed.
+        """
+
+        self._token_store = token_store or FileTokenStore()
+        self._key = key
+        self._refresh_margin = refresh_margin
+
+        self._token: Optional[dict] = None
+        self._loaded = False
+        self._refresher: Optional[asyncio.Future] = None
+        self._token_changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get_cached_token(self) -> Optional[dict]:
+        """See CacheHandler.get_cached_token"""
+
+        if not self._loaded:
+            self._load()
+        return self._token
+
+    def save_token_to_cache(self, token_info: dict) -> None:
+        """See CacheHandler.save_token_to_cache"""
+
+        self._loaded = True
+        if token_info == self._token:
+            return
+
+        self._token = token_info
+        self._token_store.save(self._key, token_info)
+        if self._loop is not None:
+            # Called from whichever thread spotipy authenticated in
+            self._loop.call_soon_threadsafe(self._token_changed.set)
+
+    def start(self, auth_manager: SpotifyOAuth, executor: Executor = None) -> None:
+        """Reads the token from its store and starts refreshing it in the background.
+
+        Args:
+            auth_manager: Refreshes the token. Must use this manager as its cache handler.
+            executor: Runs the refresh requests. Defaults to the default executor of the event loop.
+        """
+
+        if self._refresher is not None:
+            return
+        if not self._loaded:
+            self._load()
+
+        self._loop = asyncio.get_event_loop()
+        self._token_changed = asyncio.Event()
+        self._refresher = asyncio.ensure_future(self._refresh(auth_manager, executor))
+
+    async def stop(self) -> None:
+        """Stops refreshing the token
+        """
+
+        if self._refresher is None:
+            return
+        self._refresher.cancel()
+        await asyncio.gather(self._refresher, return_exceptions=True)
+        self._refresher = None
+        self._loop = None
+
+    def _load(self) -> None:
+        self._token = self._token_store.load(self._key)
+        self._loaded = True
+
+    async def _refresh(self, auth_manager: SpotifyOAuth, executor: Optional[Executor]) -> None:
+        """Refreshes the token shortly before it expires, for as long as the manager runs.
+
+        Args:
+            auth_manager: Refreshes the token.
+            executor: Runs the refresh requests.
+        """
+
+        failures = 0
+        while True:
+            self._token_changed.clear()
+            token = self._token
+            if not token or "refresh_token" not in token:
+                # Nothing to refresh until the user has authorized the application
+                await self._token_changed.wait()
+                continue
+
+            delay = token["expires_at"] - self._refresh_margin - time.time()
+            if delay > 0:
+                # Woken early if the token is replaced, by spotipy or another process, in the meantime. The wait is
+                # seen through to the end even when stopped, unlike with wait_for, so it is never left pending
+                changed = asyncio.ensure_future(self._token_changed.wait())
+                try:
+                    await asyncio.wait([changed], timeout=delay)
+                finally:
+                    changed.cancel()
+                    await asyncio.gather(changed, return_exceptions=True)
+                if not changed.cancelled():
+                    continue
+
+            try:
+                await asyncio.get_event_loop().run_in_executor(executor, auth_manager.refresh_access_token,
+                                                               token["refresh_token"])
+                failures = 0
+                LOG.debug("Refreshed the token of %s", self._key)
+            except Exception as e:
+                failures += 1
+                LOG.warning("Failed to refresh the token of %s: %s", self._key, e)
+                await asyncio.sleep(jittered_backoff(failures - 1, base=1, cap=60))
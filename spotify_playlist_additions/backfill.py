@@ -0,0 +1,123 @@
+"""Contains the backfill, which finds the fully listened tracks the poll loop missed in the listening history of the
+user"""
+
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.state import StateStore
+
+LOG = logging.getLogger(__name__)
+
+# The scope the recently played endpoint needs
+SCOPE = "user-read-recently-played"
+
+# The recently played endpoint only ever returns the last 50 plays
+PAGE_SIZE = 50
+
+# How much longer than the track the time between the ends of two plays can be for the second one to still count as
+# fully listened. Covers short pauses, a longer gap may just as well have been a break before a skipped track.
+MAX_GAP_MS = 30000
+
+
+def _played_at_ms(played_at: str) -> int:
+    """Parses the played_at timestamp of a play, such as 2016-12-13T20:44:04.589Z.
+
+    Args:
+        played_at: The timestamp.
+
+    Returns:
+        int: The timestamp in milliseconds since the epoch.
+    """
+
+    played_at = played_at.replace("Z", "+0000")
+    try:
+        parsed = datetime.strptime(played_at, "%Y-%m-%dT%H:%M:%S.%f%z")
+    except ValueError:
+        parsed = datetime.strptime(played_at, "%Y-%m-%dT%H:%M:%S%z")
+    return int(parsed.timestamp() * 1000)
+
+
+def fully_listened_plays(items: List[dict], previous_end_ms: Optional[int], end_of_track_buffer: float,
+                         max_gap_ms: float = MAX_GAP_MS) -> List[Track]:
+    """Works out which plays of the recently played endpoint were fully listened. Spotify only records when a play
+    ended, so a play counts as fully listened if the previous one ended about a track length before it did.
+
+    Args:
+        items: The plays, in the format of the recently played endpoint, in any order.
+        previous_end_ms: When the play before the oldest of items ended, if it is known. The oldest play can't be judged
+            without it.
+        end_of_track_buffer: How much of the end of a track can be missed for it to still count as fully listened, in
+            milliseconds.
+        max_gap_ms: How much longer than the track the time between the two ends can be, see MAX_GAP_MS.
+
+    Returns:
+        List[Track]: The fully listened tracks, oldest first.
+    """
+
+    tracks = []
+    plays = sorted((_played_at_ms(item["played_at"]), position, item) for position, item in enumerate(items))
+    for ended_ms, _, item in plays:
+        duration_ms = item["track"]["duration_ms"]
+        if previous_end_ms is not None and \
+                duration_ms - end_of_track_buffer <= ended_ms - previous_end_ms <= duration_ms + max_gap_ms:
+            tracks.append(Track.from_api(item["track"]))
+        previous_end_ms = ended_ms
+    return tracks
+
+
+class RecentlyPlayedBackfill:
+    """Reads the plays the user made since the last backfill from the recently played endpoint and finds the fully
+    listened ones among them, so that they reach the addons even if the engine was not running or polling too slowly
+    to notice them.
+
+    A cursor, the end of the newest play that has been handed on, is kept in the state store so that every play is
+    handed on only once, across restarts too. Only the last 50 plays are available, so a backfill covers a few hours of
+    listening at most.
+    """
+    def __init__(self, spotify_client: AsyncSpotify, end_of_track_buffer: float, state_store: StateStore = None):
+        """Initializer for a RecentlyPlayedBackfill.
+
+        Args:
+            spotify_client: The client to read the recently played endpoint with.
+            end_of_track_buffer: How much of the end of a track can be missed for it to still count as fully listened,
+                in milliseconds.
+            state_store: Keeps the cursor between runs. Defaults to only keeping it in memory.
+        """
+
+        self._spotify_client = spotify_client
+        self._end_of_track_buffer = end_of_track_buffer
+        self._state_store = state_store
+        self._cursor: Optional[int] = state_store.get("backfill_cursor") if state_store else None
+
+    async def fetch(self) -> Tuple[List[Track], Optional[int]]:
+        """Reads the plays since the cursor.
+
+        Returns:
+            Tuple[List[Track], Optional[int]]: The fully listened tracks, oldest first, and the cursor to commit once
+                they have been handed on.
+        """
+
+        page = await self._spotify_client.current_user_recently_played(limit=PAGE_SIZE, after=self._cursor)
+        items = page["items"] if page else []
+        if not items:
+            return [], self._cursor
+
+        tracks = fully_listened_plays(items, self._cursor, self._end_of_track_buffer)
+        LOG.debug("Backfill found %s fully listened tracks in %s plays", len(tracks), len(items))
+        return tracks, max(_played_at_ms(item["played_at"]) for item in items)
+
+    def commit(self, cursor: Optional[int]) -> None:
+        """Moves the cursor past the plays that have been handed on.
+
+        Args:
+            cursor: The cursor returned by fetch.
+        """
+
+        if cursor == self._cursor:
+            return
+        self._cursor = cursor
+        if self._state_store:
+            self._state_store.set("backfill_cursor", cursor)
@@ -1,31 +1,165 @@
-"""Console script for spotify_playlist_additions."""
+"""Console script for spotify_playlist_additions.
+
+Only what parsing the arguments needs is imported up front. spotipy, requests and the engine are imported once it is
+known which of them the command needs, so --help answers straight away and every run reaches its first poll sooner.
+"""
 import argparse
 import sys
 import logging
-import asyncio
+import time
 
-from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+# Taken before anything heavy is imported, for measuring how long it takes until the first poll
+STARTED_AT = time.monotonic()
 
 log_format = '%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s'
-logging.basicConfig(format=log_format,
-                    datefmt='%Y-%m-%d:%H:%M:%S',
-                    level=logging.INFO)
 LOG = logging.getLogger(__name__)
 
 
+def _configure_logging():
+    logging.basicConfig(format=log_format,
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        level=logging.INFO)
+
+
 def main():
     """Console script for spotify_playlist_additions."""
     parser = argparse.ArgumentParser()
     parser.add_argument('_', nargs='*')
+    parser.add_argument('--metrics-port',
+                        type=int,
+                        help="serve runtime metrics in the Prometheus text format on this local port")
+    parser.add_argument('--state',
+                        default=".state.sqlite3",
+                        help="where to keep state between runs, so that a restart picks up where it left off")
+    parser.add_argument('--choose-playlist',
+                        action='store_true',
+                        help="choose the playlist again instead of using the one from the last run")
+    parser.add_argument('--playlist',
+                        metavar='PLAYLIST',
+                        help="run on the playlist with this ID, URI, link or name instead of choosing one")
+    parser.add_argument('--refresh-playlists',
+                        action='store_true',
+                        help="download the list of your playlists to choose from even if a recent one is saved")
+    parser.add_argument('--backfill-interval',
+                        type=float,
+                        metavar='SECONDS',
+                        help="look for fully listened tracks that were missed in the recently played tracks this often")
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help="print the changes that would be made to the playlist instead of making them")
+    parser.add_argument('--fingerprint-library',
+                        action='store_true',
+                        help="don't auto-add another release of a recording that is already in your library")
+    parser.add_argument('--listening-log',
+                        metavar='DIR',
+                        help="log every skip and full listen here, and only auto-remove a song after a few skips")
+    parser.add_argument('--profile',
+                        metavar='DIR',
+                        help="profile the poll loop into this directory: slow callbacks, cProfile captures of a few "
+                        "frames and memory snapshots")
+    parser.add_argument('--profile-frames',
+                        type=int,
+                        default=50,
+                        metavar='N',
+                        help="how many consecutive frames each cProfile capture covers, one capture every 1000 frames")
+    parser.add_argument('--host',
+                        metavar='CONFIG',
+                        help="run every user session in a JSON config file in this process, see EngineHost.from_config")
     args = parser.parse_args()
 
+    _configure_logging()
     LOG.info("Arguments: " + str(args._))
 
-    engine = SpotifyPlaylistEngine(search_wait=200)
-    engine.choose_playlist_cli()
+    if args.host:
+        return host(args)
+
+    import asyncio
+
+    from spotify_playlist_additions.listening_log import ListeningLog
+    from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+    from spotify_playlist_additions.state import StateStore
+
+    loop = asyncio.get_event_loop()
+    profiler = _start_profiler(args, loop)
+
+    engine = SpotifyPlaylistEngine(search_wait=200,
+                                   metrics_port=args.metrics_port,
+                                   state_store=StateStore(args.state),
+                                   backfill_interval=args.backfill_interval,
+                                   dry_run=args.dry_run,
+                                   fingerprint_library=args.fingerprint_library,
+                                   listening_log=ListeningLog(args.listening_log) if args.listening_log else None,
+                                   started_at=STARTED_AT,
+                                   profiler=profiler)
+
+    if args.playlist:
+        try:
+            loop.run_until_complete(engine.use_playlist(args.playlist))
+        except ValueError as e:
+            LOG.error(e)
+            return 1
+    elif args.choose_playlist or args.refresh_playlists or not engine.playlists:
+        loop.run_until_complete(engine.choose_playlist(refresh=args.refresh_playlists))
+
+    try:
+        loop.run_until_complete(engine.start())
+    except KeyboardInterrupt:
+        LOG.info("Stopping, sending any queued playlist changes")
+        if profiler:
+            loop.run_until_complete(profiler.stop())
+        loop.run_until_complete(engine.stop())
+    return 0
+
+
+def _start_profiler(args, loop):
+    """Starts profiling if --profile was given. The profiler is not even imported otherwise."""
+    if not args.profile:
+        return None
+
+    from spotify_playlist_additions.profiling import Profiler
+
+    profiler = Profiler(args.profile, frames=args.profile_frames)
+    profiler.start(loop)
+    return profiler
+
+
+def host(args) -> int:
+    """Runs many user sessions in a single process."""
+    import asyncio
+
+    from spotify_playlist_additions.host import EngineHost
 
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(engine.start())
+    profiler = _start_profiler(args, loop)
+    engine_host = EngineHost.from_config(args.host, metrics_port=args.metrics_port, profiler=profiler)
+
+    try:
+        loop.run_until_complete(engine_host.run())
+    except KeyboardInterrupt:
+        LOG.info("Stopping every session, sending any queued playlist changes")
+        if profiler:
+            loop.run_until_complete(profiler.stop())
+        loop.run_until_complete(engine_host.stop())
+    finally:
+        engine_host.close()
+    return 0
+
+
+def supervise():
+    """Console script that spreads the user sessions of a config file over worker processes."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', help="the JSON config file of the user sessions, see EngineHost.from_config")
+    parser.add_argument('--workers', type=int, help="how many worker processes to run, defaults to the amount of cores")
+    parser.add_argument('--rate',
+                        type=float,
+                        default=10,
+                        help="the average amount of Spotify API requests per second, across every worker")
+    args = parser.parse_args()
+
+    _configure_logging()
+    from spotify_playlist_additions.supervisor import Supervisor
+
+    Supervisor(args.config, workers=args.workers, rate=args.rate).run()
     return 0
 
 
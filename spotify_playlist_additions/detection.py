@@ -0,0 +1,82 @@
+"""Contains the batch detector, which judges how the previous track of many sessions ended in a single pass. A library
+utility for callers that hold the frames of many sessions column-wise; the engine itself polls every session on its
+own schedule and detects one session at a time.
+"""
+
+import logging
+from typing import Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+LOG = logging.getLogger(__name__)
+
+
+def _detect_python(previous_ids: Sequence[str], current_ids: Sequence[str], progress_ms: Sequence[float],
+                   duration_ms: Sequence[float], end_of_track_buffer: float,
+                   is_playing: Optional[Sequence[bool]]) -> Tuple[list, list]:
+    skipped = []
+    fully_listened = []
+    for previous_id, current_id, progress, duration in zip(previous_ids, current_ids, progress_ms, duration_ms):
+        remaining_duration = duration - progress
+        skip = remaining_duration > end_of_track_buffer and previous_id != current_id
+        skipped.append(skip)
+        fully_listened.append(not skip and remaining_duration < end_of_track_buffer)
+
+    if is_playing is not None:
+        skipped = [skip and bool(playing) for skip, playing in zip(skipped, is_playing)]
+        fully_listened = [full and bool(playing) for full, playing in zip(fully_listened, is_playing)]
+    return skipped, fully_listened
+
+
+def _detect_numpy(previous_ids: Sequence[str], current_ids: Sequence[str], progress_ms: Sequence[float],
+                  duration_ms: Sequence[float], end_of_track_buffer: float,
+                  is_playing: Optional[Sequence[bool]]) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+    remaining_duration = numpy.asarray(duration_ms) - numpy.asarray(progress_ms)
+    skipped = (remaining_duration > end_of_track_buffer) & (numpy.asarray(previous_ids) != numpy.asarray(current_ids))
+    fully_listened = ~skipped & (remaining_duration < end_of_track_buffer)
+    if is_playing is not None:
+        playing = numpy.asarray(is_playing, dtype=bool)
+        skipped &= playing
+        fully_listened &= playing
+    return skipped, fully_listened
+
+
+def detect_batch(previous_ids: Sequence[str],
+                 current_ids: Sequence[str],
+                 progress_ms: Sequence[float],
+                 duration_ms: Sequence[float],
+                 end_of_track_buffer: float,
+                 is_playing: Sequence[bool] = None,
+                 use_numpy: bool = None) -> Tuple[Sequence[bool], Sequence[bool]]:
+    """Performs the skip and full listen detection of many sessions at once. Each argument is a column, with one row
+    per session. Without is_playing, the result of every row is exactly what _detect_skipped_track and
+    _detect_fully_listened_track give for that session.
+
+    The IDs are only compared for equality. The engine compares track names, so pass names rather than IDs to get the
+    same results as the engine where two tracks share a name.
+
+    Args:
+        previous_ids: The track seen on the previous frame of every session.
+        current_ids: The track seen on this frame of every session.
+        progress_ms: How far into the previous track every session was on the previous frame.
+        duration_ms: How long the previous track of every session is.
+        end_of_track_buffer: The amount of milliseconds at the end of a track that still count as fully listened.
+        is_playing: Whether playback is running on this frame of every session. A paused session is left undecided,
+            neither skipped nor fully listened, so that its previous frame can be kept and judged once it resumes.
+            The scalar functions have no such input.
+        use_numpy: Whether to use numpy. Defaults to using it when the columns are already numpy arrays, as turning
+            lists into arrays costs more than the pure Python pass saves.
+
+    Returns:
+        Tuple[Sequence[bool], Sequence[bool]]: Whether the previous track of every session was skipped, and whether it
+            was fully listened. numpy arrays if numpy was used, lists otherwise.
+    """
+
+    if use_numpy is None:
+        use_numpy = numpy is not None and isinstance(progress_ms, numpy.ndarray)
+    if use_numpy:
+        return _detect_numpy(previous_ids, current_ids, progress_ms, duration_ms, end_of_track_buffer, is_playing)
+    return _detect_python(previous_ids, current_ids, progress_ms, duration_ms, end_of_track_buffer, is_playing)
@@ -0,0 +1,217 @@
+"""Contains the events the poll loop detects and the event bus that delivers them to the playlist addons"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from spotify_playlist_additions.metrics import ADDON_HANDLER_SECONDS, EVENTS_DROPPED
+from spotify_playlist_additions.playback import Track
+
+LOG = logging.getLogger(__name__)
+
+# What a full addon queue does with a new event
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class TrackEvent:
+    """Something the poll loop detected about a track. Subclasses name the addon method that handles them."""
+
+    __slots__ = ("track", "detected_at")
+
+    handler = ""
+
+    def __init__(self, track: Track):
+        """Initializer for a TrackEvent.
+
+        Args:
+            track: The track the event is about.
+        """
+
+        self.track = track
+        self.detected_at = time.monotonic()
+
+    def __repr__(self) -> str:
+        return "%s(%s)" % (type(self).__name__, self.track.name)
+
+
+class TrackStarted(TrackEvent):
+    """A new track started playing"""
+
+    __slots__ = ()
+
+    handler = "handle_track_start"
+
+
+class TrackSkipped(TrackEvent):
+    """The previous track was skipped"""
+
+    __slots__ = ()
+
+    handler = "handle_skipped_track"
+
+
+class TrackFullyListened(TrackEvent):
+    """The previous track was listened to the end"""
+
+    __slots__ = ()
+
+    handler = "handle_fully_listened_track"
+
+
+class TracksBackfilled(TrackEvent):
+    """Tracks that were fully listened while the poll loop was not watching, found in the listening history of the user
+    and handed on in one batch. track is the list of tracks, oldest first.
+    """
+
+    __slots__ = ()
+
+    handler = "handle_backfilled_tracks"
+
+    def __repr__(self) -> str:
+        return "%s(%s tracks)" % (type(self).__name__, len(self.track))
+
+
+class _Subscription:
+    """The queue of a single addon and the worker that drains it"""
+    def __init__(self, addon, maxsize: int, overflow_policy: str):
+        if overflow_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("Unknown overflow policy %s" % overflow_policy)
+
+        name = type(addon).__name__
+        self.addon = addon
+        self.name = name
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflow_policy = overflow_policy
+        self.handler_seconds = ADDON_HANDLER_SECONDS.labels(name)
+        self.dropped = EVENTS_DROPPED.labels(name)
+        self.worker: Optional[asyncio.Future] = None
+
+
+class EventBus:
+    """Delivers events from the poll loop to the playlist addons without ever making the poll loop wait.
+
+    Events are published onto a single inbox. A router takes them off it in order, runs the prepare step (the engine
+    uses it to bring the playlist index up to date) and copies them onto the bounded queue of each addon. Every addon
+    has its own worker, so addons see events in the order they were detected but never wait on each other. When an
+    addon falls so far behind that its queue is full, its overflow policy decides whether the oldest queued event or
+    the new one is dropped.
+    """
+    def __init__(self, prepare: Callable[[TrackEvent], Awaitable[None]] = None):
+        """Initializer for an EventBus. Does nothing until start is called.
+
+        Args:
+            prepare: Awaited for each event before it is handed to any addon.
+        """
+
+        self._prepare = prepare
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._subscriptions: List[_Subscription] = []
+        self._router: Optional[asyncio.Future] = None
+
+    def subscribe(self, addon, maxsize: int = 100, overflow_policy: str = DROP_OLDEST) -> None:
+        """Registers an addon to receive every event. Must be called before start.
+
+        Args:
+            addon: The addon. Handles an event with the method named by the handler of the event.
+            maxsize: How many events can wait in the queue of the addon.
+            overflow_policy: DROP_OLDEST or DROP_NEWEST, what to do with a new event when the queue is full.
+        """
+
+        self._subscriptions.append(_Subscription(addon, maxsize, overflow_policy))
+
+    def start(self) -> None:
+        """Starts the router and the worker of every addon
+        """
+
+        self._router = asyncio.ensure_future(self._route())
+        for subscription in self._subscriptions:
+            subscription.worker = asyncio.ensure_future(self._work(subscription))
+
+    def publish(self, event: TrackEvent) -> None:
+        """Queues an event for every addon. Never blocks, however slow the addons are.
+
+        Args:
+            event: The event.
+        """
+
+        self._inbox.put_nowait(event)
+
+    async def close(self) -> None:
+        """Waits for every event that has been published to be handled, then stops the router and the workers
+        """
+
+        if self._router is None:
+            return
+
+        await self._inbox.join()
+        for subscription in self._subscriptions:
+            await subscription.queue.join()
+
+        for task in [self._router] + [subscription.worker for subscription in self._subscriptions]:
+            task.cancel()
+        await asyncio.gather(self._router, *[subscription.worker for subscription in self._subscriptions],
+                             return_exceptions=True)
+        self._router = None
+
+    async def _route(self) -> None:
+        """Moves events from the inbox onto the queue of every addon, in the order they were published
+        """
+
+        while True:
+            event = await self._inbox.get()
+            try:
+                try:
+                    if self._prepare:
+                        await self._prepare(event)
+                except Exception as e:
+                    LOG.error("Failed to prepare %s: %s", event, e)
+
+                for subscription in self._subscriptions:
+                    self._offer(subscription, event)
+            except Exception as e:
+                # Anything that escapes would stop the router, leaving every addon without events and close waiting on
+                # the inbox forever
+                LOG.error("Failed to deliver %s: %s", event, e)
+            finally:
+                self._inbox.task_done()
+
+    @staticmethod
+    def _offer(subscription: _Subscription, event: TrackEvent) -> None:
+        """Puts an event on the queue of an addon, applying its overflow policy if the queue is full.
+
+        Args:
+            subscription: The addon to give the event to.
+            event: The event.
+        """
+
+        queue = subscription.queue
+        if queue.full():
+            subscription.dropped.inc()
+            if subscription.overflow_policy == DROP_NEWEST:
+                LOG.warning("%s is falling behind, dropped %s", subscription.name, event)
+                return
+            dropped = queue.get_nowait()
+            queue.task_done()
+            LOG.warning("%s is falling behind, dropped %s", subscription.name, dropped)
+        queue.put_nowait(event)
+
+    @staticmethod
+    async def _work(subscription: _Subscription) -> None:
+        """Hands the events on the queue of an addon to it, one at a time.
+
+        Args:
+            subscription: The addon and its queue.
+        """
+
+        while True:
+            event = await subscription.queue.get()
+            started = time.monotonic()
+            try:
+                await getattr(subscription.addon, event.handler)(event.track)
+            except Exception as e:
+                LOG.error("%s failed to handle %s: %s", subscription.name, event, e)
+            finally:
+                subscription.handler_seconds.observe(time.monotonic() - started)
+                subscription.queue.task_done()
@@ -0,0 +1,270 @@
+"""Contains the fingerprint index, which recognises a recording across every release of it in the library of the user"""
+
+import base64
+import hashlib
+import logging
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.playlist_loader import iter_pages, iter_playlist_tracks, iter_saved_tracks
+from spotify_playlist_additions.state import StateStore
+
+LOG = logging.getLogger(__name__)
+
+# The scope that reading every playlist and saved track of the user needs
+SCOPE = "playlist-read-private user-library-read"
+
+# Only what a fingerprint is made of is downloaded
+FIELDS = "items(track(name,duration_ms,external_ids(isrc),artists(name))),total"
+
+# The releases of a recording rarely differ by more than a second or two in length
+DURATION_BUCKET_MS = 2000
+
+# The sources that are not playlists
+SAVED_TRACKS = "saved_tracks"
+ADDED = "added"
+
+# Parts of a title that differ between the releases of a single recording
+_NOISE = r"remaster|remastered|single version|album version|mono|stereo|feat|ft|with|deluxe|bonus track"
+_NOISE_IN_BRACKETS = re.compile(r"[(\[][^)\]]*\b(%s)\b[^)\]]*[)\]]" % _NOISE, re.IGNORECASE)
+_NOISE_AFTER_DASH = re.compile(r"\s+-\s+[^-]*\b(%s)\b.*$" % _NOISE, re.IGNORECASE)
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _normalise(text: str) -> str:
+    """Reduces a title or artist to what the releases of a recording have in common, such as
+    "Song - 2011 Remaster" and "Song (feat. Someone)" to "song".
+
+    Args:
+        text: The title or artist.
+
+    Returns:
+        str: The normalised text.
+    """
+
+    text = _NOISE_AFTER_DASH.sub("", _NOISE_IN_BRACKETS.sub("", text))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def _hash(key: str) -> int:
+    """Hashes a key to 64 bits, the same way in every process, so fingerprints can be kept between runs.
+
+    Args:
+        key: The key.
+
+    Returns:
+        int: The fingerprint.
+    """
+
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def _parts(track: Union[Track, dict]) -> Tuple[Optional[str], str, str, int]:
+    """Reads what a fingerprint is made of from a track.
+
+    Args:
+        track: A Track, or a track in the format of a spotify API track.
+
+    Returns:
+        Tuple[Optional[str], str, str, int]: The ISRC, title, primary artist and duration of the track.
+    """
+
+    if isinstance(track, Track):
+        return track.isrc, track.name, track.artist or "", track.duration_ms
+    artists = track.get("artists")
+    return ((track.get("external_ids") or {}).get("isrc"), track.get("name") or "",
+            artists[0]["name"] if artists else "", track.get("duration_ms") or 0)
+
+
+def _fallback(name: str, artist: str, bucket: int) -> int:
+    return _hash("%s|%s|%d" % (_normalise(name), _normalise(artist), bucket))
+
+
+def fingerprints(track: Union[Track, dict]) -> List[int]:
+    """The fingerprints a track is indexed under: its ISRC, which every release of a recording usually shares, and its
+    normalised title, primary artist and rounded duration, which also covers releases with an ISRC of their own, such
+    as remasters, and tracks without one.
+
+    Args:
+        track: A Track, or a track in the format of a spotify API track.
+
+    Returns:
+        List[int]: The fingerprints.
+    """
+
+    isrc, name, artist, duration_ms = _parts(track)
+    keys = [_fallback(name, artist, round(duration_ms / DURATION_BUCKET_MS))]
+    if isrc:
+        keys.append(_hash("isrc|" + isrc.upper()))
+    return keys
+
+
+class FingerprintIndex:
+    """The fingerprints of every track in the playlists and saved tracks of a user, for telling in O(1) time whether
+    the user already has some release of a recording, see fingerprints.
+
+    Each source, a playlist or the saved tracks, keeps its fingerprints in a compact array along with the version it was
+    read at, its snapshot_id for a playlist, so that a refresh only downloads the sources that changed. The lookups go
+    through a single set of every fingerprint, rebuilt from the arrays when a source is replaced. A library of 50000
+    tracks takes under ten megabytes.
+    """
+    def __init__(self):
+        """Initializer for a FingerprintIndex. The index is empty until it is restored or refreshed."""
+
+        self._sources: Dict[str, Tuple[Optional[str], array]] = {}
+        self._fingerprints = set()
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def contains(self, track: Union[Track, dict]) -> bool:
+        """Checks whether the library has a release of the same recording as a track.
+
+        Args:
+            track: A Track, or a track in the format of a spotify API track.
+
+        Returns:
+            bool: Whether it does.
+        """
+
+        isrc, name, artist, duration_ms = _parts(track)
+        if isrc and _hash("isrc|" + isrc.upper()) in self._fingerprints:
+            return True
+
+        # A length close to the edge of a bucket may have been rounded into the next one
+        bucket = round(duration_ms / DURATION_BUCKET_MS)
+        return any(_fallback(name, artist, nearby) in self._fingerprints
+                   for nearby in (bucket, bucket - 1, bucket + 1))
+
+    def add(self, track: Union[Track, dict]) -> None:
+        """Adds a track that has been added to the library since the last refresh, such as by an addon.
+
+        Args:
+            track: A Track, or a track in the format of a spotify API track.
+        """
+
+        keys = fingerprints(track)
+        self._source(ADDED).extend(keys)
+        self._fingerprints.update(keys)
+
+    def version(self, source: str) -> Optional[str]:
+        """The version a source was read at.
+
+        Args:
+            source: The ID of a playlist, or SAVED_TRACKS.
+
+        Returns:
+            Optional[str]: The version, or None if the source has not been read.
+        """
+
+        return self._sources[source][0] if source in self._sources else None
+
+    def replace_source(self, source: str, version: Optional[str], tracks: Iterable[Union[Track, dict]]) -> None:
+        """Replaces the tracks of a source.
+
+        Args:
+            source: The ID of a playlist, or SAVED_TRACKS.
+            version: The version the tracks were read at.
+            tracks: Every track of the source.
+        """
+
+        keys = array("Q")
+        for track in tracks:
+            keys.extend(fingerprints(track))
+        self._sources[source] = (version, keys)
+        self._rebuild()
+
+    def remove_sources(self, sources: Iterable[str]) -> None:
+        """Forgets sources, such as playlists the user no longer follows.
+
+        Args:
+            sources: The IDs of the sources.
+        """
+
+        for source in sources:
+            self._sources.pop(source, None)
+        self._rebuild()
+
+    async def refresh(self, spotify_client: AsyncSpotify, max_in_flight: int = 8) -> None:
+        """Reads every source that changed since it was last read, and forgets the playlists the user no longer has.
+
+        Args:
+            spotify_client: The client to read the library with.
+            max_in_flight: The maximum amount of page requests that can be running at once, per source.
+        """
+
+        # Tracks added while refreshing may have been added after their playlist was read
+        added = len(self._source(ADDED))
+
+        playlists = []
+        async for playlist in iter_pages(
+                lambda offset, limit: spotify_client.current_user_playlists(limit=limit, offset=offset), 50,
+                max_in_flight):
+            if playlist:
+                playlists.append(playlist)
+
+        for playlist in playlists:
+            if self.version(playlist["id"]) == playlist["snapshot_id"]:
+                continue
+            tracks = [item["track"] async for item in iter_playlist_tracks(
+                spotify_client, playlist["id"], FIELDS, max_in_flight) if item.get("track")]
+            self.replace_source(playlist["id"], playlist["snapshot_id"], tracks)
+
+        newest = await spotify_client.current_user_saved_tracks(limit=1)
+        version = "%s:%s" % (newest["total"], newest["items"][0]["added_at"] if newest["items"] else "")
+        if version != self.version(SAVED_TRACKS):
+            self.replace_source(SAVED_TRACKS, version,
+                                [item["track"] async for item in iter_saved_tracks(spotify_client, max_in_flight)])
+
+        del self._source(ADDED)[:added]
+        playlist_ids = {playlist["id"] for playlist in playlists}
+        self.remove_sources([source for source in self._sources
+                             if source not in playlist_ids and source not in (SAVED_TRACKS, ADDED)])
+        LOG.info("Fingerprinted %s sources, %s fingerprints", len(self._sources), len(self))
+
+    def save(self, state_store: StateStore) -> None:
+        """Saves the index to the state store.
+
+        Args:
+            state_store: The state store.
+        """
+
+        state_store.set("fingerprints", {
+            source: [version, base64.b64encode(keys.tobytes()).decode()]
+            for source, (version, keys) in self._sources.items()
+        })
+
+    def restore(self, state_store: StateStore) -> bool:
+        """Restores the index from the state store, so that a refresh only reads what changed since it was saved.
+
+        Args:
+            state_store: The state store.
+
+        Returns:
+            bool: Whether the index had been saved.
+        """
+
+        saved = state_store.get("fingerprints")
+        if not saved:
+            return False
+
+        for source, (version, encoded) in saved.items():
+            keys = array("Q")
+            keys.frombytes(base64.b64decode(encoded))
+            self._sources[source] = (version, keys)
+        self._rebuild()
+        return True
+
+    def _source(self, source: str) -> array:
+        if source not in self._sources:
+            self._sources[source] = (None, array("Q"))
+        return self._sources[source][1]
+
+    def _rebuild(self) -> None:
+        fingerprint_set = set()
+        for _, keys in self._sources.values():
+            fingerprint_set.update(keys)
+        self._fingerprints = fingerprint_set
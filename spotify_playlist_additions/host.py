@@ -0,0 +1,325 @@
+"""Contains the engine host, which runs the engines of many users inside a single process"""
+
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from spotipy.oauth2 import SpotifyAuthBase, SpotifyOAuth
+
+from spotify_playlist_additions import backfill, metrics
+from spotify_playlist_additions.async_client import AsyncSpotify, PollingSpotify
+from spotify_playlist_additions.auth import FileTokenStore, TokenManager, TokenStore
+from spotify_playlist_additions.listening_log import ListeningLog
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.playlists.autoremove import AutoRemovePlaylist
+from spotify_playlist_additions.rate_limit import CircuitBreaker, TokenBucket
+from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+from spotify_playlist_additions.state import StateStore
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_ADDONS = [AutoAddPlaylist, AutoRemovePlaylist]
+
+
+def _scope(addons: list) -> str:
+    """Combines the scopes that a set of addons need into a single scope.
+
+    Args:
+        addons: The addon classes.
+
+    Returns:
+        str: The scope to request.
+    """
+
+    return " ".join(sorted({scope for addon in addons for scope in addon.scope.split()}))
+
+
+def read_config(path: str) -> Tuple[str, Dict[str, dict]]:
+    """Reads a JSON file of sessions, in the format
+    {"sessions": [{"name": "...", "playlists": ["<playlist id>", ...]}, ...]}
+
+    Sessions can also set "search_wait" and "backfill_interval", see SpotifyPlaylistEngine.
+
+    Args:
+        path: Where the config file is.
+
+    Returns:
+        Tuple[str, Dict[str, dict]]: The directory the config file is in, and the config of every session by name.
+    """
+
+    with open(path) as config_file:
+        config = json.load(config_file)
+
+    return os.path.dirname(os.path.abspath(path)), {session["name"]: session for session in config["sessions"]}
+
+
+class EngineHost:
+    """Runs a SpotifyPlaylistEngine per user session as tasks on one event loop.
+
+    Every session has its own token, playlists and addon instances, but they all make their requests through the same
+    worker pool and connection pool, and share a single rate limiter and circuit breaker. Spotify rate limits an
+    application as a whole, so a 429 caused by one session pauses all of them. A session that fails is logged and
+    stops on its own, the other sessions keep running. Sessions can be added and removed while the host is running.
+    """
+    def __init__(self,
+                 max_workers: int = 32,
+                 rate_limiter: TokenBucket = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 metrics_port: int = None,
+                 token_store: TokenStore = None,
+                 profiler: "Profiler" = None):
+        """Initializer for an EngineHost.
+
+        Args:
+            max_workers: The maximum amount of requests that can be running at once, across every session. Also the
+                size of the connection pool.
+            rate_limiter: Limits the rate of requests across every session.
+            circuit_breaker: Stops requests from every session while the API is failing.
+            metrics_port: The local port to serve the metrics of every session on, if any.
+            token_store: Keeps the tokens of configured sessions, by session name. Defaults to a file per session, see
+                add_configured_session.
+            profiler: Profiles the poll loop of every session, see profiling.Profiler. Must have been started.
+        """
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="spotify")
+        self._rate_limiter = rate_limiter or TokenBucket()
+        self._circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._metrics_port = metrics_port
+        self._token_store = token_store
+        self._profiler = profiler
+
+        # Every session connects to the same host, so one large pool serves them all
+        self._session = AsyncSpotify.create_session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._engines: Dict[str, SpotifyPlaylistEngine] = {}
+        self._clients: Dict[str, AsyncSpotify] = {}
+        self._state_stores: Dict[str, StateStore] = {}
+        self._listening_logs: Dict[str, ListeningLog] = {}
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self._stopped: asyncio.Event = None
+
+    @property
+    def session(self) -> requests.Session:
+        """The connection pool shared by every session
+
+        Returns:
+            requests.Session: The session to make requests with.
+        """
+
+        return self._session
+
+    @property
+    def engines(self) -> Dict[str, SpotifyPlaylistEngine]:
+        """The engine of every session, by name
+
+        Returns:
+            Dict[str, SpotifyPlaylistEngine]: The engines.
+        """
+
+        return self._engines
+
+    def create_client(self, auth_manager: SpotifyAuthBase, api_prefix: str = None) -> AsyncSpotify:
+        """Creates a client for a single user that shares the pools, rate limiter and circuit breaker of the host.
+
+        Args:
+            auth_manager: Authenticates the requests of the user.
+            api_prefix: The base URL of the API, if it is not Spotify's.
+
+        Returns:
+            AsyncSpotify: The client.
+        """
+
+        spotify = PollingSpotify(auth_manager=auth_manager, requests_session=self._session)
+        if api_prefix:
+            spotify.prefix = api_prefix
+        return AsyncSpotify(spotify,
+                            rate_limiter=self._rate_limiter,
+                            circuit_breaker=self._circuit_breaker,
+                            executor=self._executor)
+
+    def add_session(self, name: str, auth_manager: SpotifyAuthBase, api_prefix: str = None,
+                    **engine_kwargs) -> SpotifyPlaylistEngine:
+        """Adds a user session. Sessions added after run has been called are not started until start_session is
+        called.
+
+        Args:
+            name: Identifies the session in the logs.
+            auth_manager: Authenticates the requests of the user. Must not need any interaction, as there is nobody to
+                interact with, so the token of the user should already be cached.
+            api_prefix: The base URL of the API, if it is not Spotify's.
+            **engine_kwargs: Passed on to the SpotifyPlaylistEngine of the session.
+
+        Returns:
+            SpotifyPlaylistEngine: The engine of the session.
+        """
+
+        client = self.create_client(auth_manager, api_prefix)
+        engine_kwargs.setdefault("profiler", self._profiler)
+        engine = SpotifyPlaylistEngine(spotify_client=client, **engine_kwargs)
+        self._clients[name] = client
+        self._engines[name] = engine
+        return engine
+
+    def add_configured_session(self, session: dict, root: str) -> SpotifyPlaylistEngine:
+        """Adds a user session from its config, see read_config. The tokens of the session are kept in the token store
+        of the host, or in tokens/<name>.json if it has none, and its state is kept in state/<name>.sqlite3, both under
+        root. Tokens are refreshed in the background while the session runs. A session with "listening_log": true
+        logs its skips and full listens to history/<name>/ under root, see ListeningLog.
+
+        Args:
+            session: The config of the session.
+            root: The directory the config file is in.
+
+        Returns:
+            SpotifyPlaylistEngine: The engine of the session.
+        """
+
+        os.makedirs(os.path.join(root, "tokens"), exist_ok=True)
+        os.makedirs(os.path.join(root, "state"), exist_ok=True)
+
+        name = session["name"]
+        state_store = StateStore(os.path.join(root, "state", name + ".sqlite3"))
+        token_manager = TokenManager(self._token_store or FileTokenStore(os.path.join(root, "tokens", name + ".json")),
+                                     key=name)
+        scope = _scope(DEFAULT_ADDONS)
+        if session.get("backfill_interval") is not None:
+            scope += " " + backfill.SCOPE
+        auth_manager = SpotifyOAuth(redirect_uri="http://localhost:8888/callback",
+                                    scope=scope,
+                                    cache_handler=token_manager,
+                                    open_browser=False,
+                                    requests_session=self._session)
+        listening_log = None
+        if session.get("listening_log"):
+            listening_log = self._listening_logs[name] = ListeningLog(os.path.join(root, "history", name))
+        engine = self.add_session(name,
+                                  auth_manager,
+                                  search_wait=session.get("search_wait", 200),
+                                  backfill_interval=session.get("backfill_interval"),
+                                  addons=DEFAULT_ADDONS,
+                                  playlists=[{"id": playlist_id} for playlist_id in session["playlists"]],
+                                  state_store=state_store,
+                                  token_manager=token_manager,
+                                  listening_log=listening_log)
+        self._state_stores[name] = state_store
+        return engine
+
+    @classmethod
+    def from_config(cls, path: str, **host_kwargs) -> "EngineHost":
+        """Creates a host with every session of a config file, see read_config and add_configured_session.
+
+        Args:
+            path: Where the config file is.
+            **host_kwargs: Passed on to the EngineHost.
+
+        Returns:
+            EngineHost: The host, with every session added.
+        """
+
+        root, sessions = read_config(path)
+        host = cls(**host_kwargs)
+        for session in sessions.values():
+            host.add_configured_session(session, root)
+        return host
+
+    async def run(self) -> None:
+        """Runs every session until stop is called
+        """
+
+        metrics_server = None
+        if self._metrics_port is not None:
+            metrics_server = await metrics.start_metrics_server(self._metrics_port)
+
+        self._stopped = asyncio.Event()
+        LOG.info("Starting %s sessions", len(self._engines))
+        for name in self._engines:
+            self.start_session(name)
+
+        try:
+            await self._stopped.wait()
+        finally:
+            if metrics_server:
+                metrics_server.close()
+                await metrics_server.wait_closed()
+
+    def start_session(self, name: str) -> None:
+        """Starts running a session that has been added.
+
+        Args:
+            name: The name of the session.
+        """
+
+        if name not in self._tasks:
+            self._tasks[name] = asyncio.ensure_future(self._run_session(name, self._engines[name]))
+
+    async def remove_session(self, name: str) -> None:
+        """Stops a session, letting it finish what it was doing, and forgets about it.
+
+        Args:
+            name: The name of the session.
+        """
+
+        engine = self._engines.pop(name)
+        task = self._tasks.pop(name, None)
+        await engine.stop()
+        if task:
+            await task
+        self._clients.pop(name).close()
+        state_store = self._state_stores.pop(name, None)
+        if state_store:
+            state_store.close()
+        listening_log = self._listening_logs.pop(name, None)
+        if listening_log is not None:
+            listening_log.close()
+
+    async def stop(self) -> None:
+        """Stops every session, letting each of them finish what it was doing
+        """
+
+        await asyncio.gather(*[engine.stop() for engine in self._engines.values()], return_exceptions=True)
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._stopped:
+            self._stopped.set()
+
+    def close(self) -> None:
+        """Releases the worker pool and the connection pool. Called once every session has stopped.
+        """
+
+        for client in self._clients.values():
+            client.close()
+        for state_store in self._state_stores.values():
+            state_store.close()
+        for listening_log in self._listening_logs.values():
+            listening_log.close()
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+    @staticmethod
+    async def _run_session(name: str, engine: SpotifyPlaylistEngine) -> None:
+        """Runs the engine of a single session, keeping its failure from taking down the others.
+
+        Args:
+            name: The name of the session.
+            engine: The engine of the session.
+        """
+
+        try:
+            await engine.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOG.error("Session %s failed: %s", name, e)
+            # Whatever had been started before the failure, the event bus and the mutation queues, is left running
+            # otherwise
+            try:
+                await engine.stop()
+            except Exception as e:
+                LOG.error("Session %s failed to stop: %s", name, e)
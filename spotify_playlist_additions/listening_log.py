@@ -0,0 +1,295 @@
+"""Contains the listening log, an append-only record of every skip and full listen along with decaying per-track
+counters of them, for addon rules such as removing a track only once it has been skipped a few times"""
+
+import logging
+import math
+import os
+import struct
+import time
+from typing import Dict, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+SKIPPED = 0
+FULLY_LISTENED = 1
+
+# A second of the timestamp of an event, its kind and the Spotify ID of its track, which is 22 characters long
+_EVENT = struct.Struct("<IB22s")
+# What the counters were folded up to: the last segment folded in, the time they were decayed to and how many follow
+_CHECKPOINT_HEADER = struct.Struct("<IdI")
+# The ID of a track and its skip and full listen counters
+_CHECKPOINT_COUNTERS = struct.Struct("<22sff")
+
+_SEGMENT_MAGIC = b"SPLOG1\n\0"
+_CHECKPOINT_MAGIC = b"SPLCK1\n\0"
+_CHECKPOINT = "counters.bin"
+
+DEFAULT_HALF_LIFE = 30 * 24 * 3600
+DEFAULT_MAX_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 8
+
+# Counters that have decayed below this are dropped when the log is compacted
+_NEGLIGIBLE = 0.01
+
+
+class _TrackCounters:
+    """The decayed counts of the events of a single track, as of updated_at"""
+
+    __slots__ = ("skips", "full_listens", "updated_at")
+
+    def __init__(self, skips: float = 0.0, full_listens: float = 0.0, updated_at: float = 0.0):
+        self.skips = skips
+        self.full_listens = full_listens
+        self.updated_at = updated_at
+
+
+class ListeningLog:
+    """Writes every skip and full listen of a user to a directory of append-only binary segments, and keeps a pair of
+    counters per track in memory that can be checked in O(1) time.
+
+    Every event counts as one when it happens, and half as much every half_life seconds after that, so the counters
+    roughly answer "how often was this skipped lately" without keeping the events themselves in memory. An event is a
+    fixed 27 byte record. The segment being written to is rotated once it reaches max_segment_bytes, and once more than
+    max_segments have been written the log is compacted: the counters are saved as a checkpoint and the segments they
+    cover are deleted, dropping tracks whose counters have decayed to nothing. Opening the log loads the checkpoint and
+    replays the segments written after it.
+
+    Like the state store, a record is flushed to the operating system but not synced to disk, so a power cut can lose
+    the last few events, and a record that was only partly written is ignored when the log is next opened. Tracks
+    without a Spotify ID, such as local files, are not logged.
+    """
+    def __init__(self,
+                 path: str,
+                 half_life: float = DEFAULT_HALF_LIFE,
+                 max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS):
+        """Initializer for a ListeningLog. Creates the directory if it does not exist yet, and rebuilds the counters
+        from what is in it otherwise.
+
+        Args:
+            path: The directory the log is kept in.
+            half_life: How many seconds it takes for an event to count half as much.
+            max_segment_bytes: The size a segment is rotated at.
+            max_segments: How many segments are kept before the log is compacted.
+        """
+
+        self._path = path
+        self._decay_rate = math.log(2) / half_life
+        self._max_segment_bytes = max_segment_bytes
+        self._max_segments = max_segments
+
+        self._counters: Dict[str, _TrackCounters] = {}
+        self._segment_number = 0
+        self._segment = None
+        self._segment_bytes = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def record(self, track_id: Optional[str], kind: int, at: float = None) -> None:
+        """Appends an event to the log and counts it.
+
+        Args:
+            track_id: The Spotify ID of the track. Nothing is logged if it is None.
+            kind: SKIPPED or FULLY_LISTENED.
+            at: When the event happened, in seconds since the epoch. Defaults to now.
+        """
+
+        if not track_id:
+            return
+        at = time.time() if at is None else at
+
+        if self._segment_bytes + _EVENT.size > self._max_segment_bytes:
+            self._rotate()
+            if len(self._segment_numbers()) > self._max_segments:
+                self.compact()
+        # Counted only once it is certain which segment it goes in, so that compacting never counts it twice
+        self._count(track_id, kind, at)
+        self._segment.write(_EVENT.pack(int(at), kind, track_id.encode()))
+        self._segment.flush()
+        self._segment_bytes += _EVENT.size
+
+    def record_skip(self, track_id: Optional[str], at: float = None) -> None:
+        """Logs a skip, see record"""
+
+        self.record(track_id, SKIPPED, at)
+
+    def record_full_listen(self, track_id: Optional[str], at: float = None) -> None:
+        """Logs a full listen, see record"""
+
+        self.record(track_id, FULLY_LISTENED, at)
+
+    def skips(self, track_id: Optional[str], at: float = None) -> float:
+        """How often a track has been skipped lately, with every skip counting half as much every half_life.
+
+        Args:
+            track_id: The Spotify ID of the track.
+            at: The time to decay the count to, in seconds since the epoch. Defaults to now.
+
+        Returns:
+            float: The decayed count.
+        """
+
+        counters = self._counters.get(track_id)
+        return counters.skips * self._decay(counters, at) if counters else 0.0
+
+    def full_listens(self, track_id: Optional[str], at: float = None) -> float:
+        """How often a track has been fully listened to lately, see skips"""
+
+        counters = self._counters.get(track_id)
+        return counters.full_listens * self._decay(counters, at) if counters else 0.0
+
+    def compact(self) -> None:
+        """Saves the counters as a checkpoint and deletes every segment it covers, so that opening the log only has
+        to replay what was written after it. Tracks whose counters have decayed to nothing are forgotten.
+        """
+
+        # Everything counted so far is in the segments up to this one, and nothing else is written to them
+        covered = self._segment_number
+        self._rotate()
+
+        now = time.time()
+        for track_id in list(self._counters):
+            counters = self._counters[track_id]
+            decay = self._decay(counters, now)
+            counters.skips *= decay
+            counters.full_listens *= decay
+            counters.updated_at = now
+            if counters.skips < _NEGLIGIBLE and counters.full_listens < _NEGLIGIBLE:
+                del self._counters[track_id]
+
+        checkpoint = os.path.join(self._path, _CHECKPOINT)
+        with open(checkpoint + ".tmp", "wb") as checkpoint_file:
+            checkpoint_file.write(_CHECKPOINT_MAGIC)
+            checkpoint_file.write(_CHECKPOINT_HEADER.pack(covered, now, len(self._counters)))
+            for track_id, counters in self._counters.items():
+                checkpoint_file.write(_CHECKPOINT_COUNTERS.pack(track_id.encode(), counters.skips,
+                                                                counters.full_listens))
+        # Swapped in whole, so a crash while writing leaves the previous checkpoint and the segments it needs
+        os.replace(checkpoint + ".tmp", checkpoint)
+
+        for number in self._segment_numbers():
+            if number <= covered:
+                os.remove(self._segment_path(number))
+        LOG.debug("Compacted the listening log to %s tracks", len(self._counters))
+
+    def close(self) -> None:
+        """Closes the segment being written to. Called once at the end of runtime.
+        """
+
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+
+    def _count(self, track_id: str, kind: int, at: float) -> None:
+        """Adds an event to the counters of its track.
+
+        Args:
+            track_id: The Spotify ID of the track.
+            kind: SKIPPED or FULLY_LISTENED.
+            at: When the event happened, in seconds since the epoch.
+        """
+
+        counters = self._counters.get(track_id)
+        if counters is None:
+            counters = self._counters[track_id] = _TrackCounters(updated_at=at)
+
+        # Events replayed out of order count as if they happened when the counters were last updated
+        if at > counters.updated_at:
+            decay = self._decay(counters, at)
+            counters.skips *= decay
+            counters.full_listens *= decay
+            counters.updated_at = at
+
+        if kind == SKIPPED:
+            counters.skips += 1
+        else:
+            counters.full_listens += 1
+
+    def _decay(self, counters: _TrackCounters, at: Optional[float]) -> float:
+        elapsed = (time.time() if at is None else at) - counters.updated_at
+        return math.exp(-self._decay_rate * elapsed) if elapsed > 0 else 1.0
+
+    def _rebuild(self) -> None:
+        """Loads the checkpoint and replays every segment written after it, then starts a new segment to write to,
+        so that a record the last run only partly wrote is never followed by another.
+        """
+
+        covered = self._load_checkpoint()
+        numbers = [number for number in self._segment_numbers() if number > covered]
+        events = 0
+        for number in numbers:
+            events += self._replay(number)
+        LOG.info("Rebuilt the counters of %s tracks from %s logged events", len(self._counters), events)
+
+        self._segment_number = max(numbers + [covered])
+        self._rotate()
+        if len(numbers) >= self._max_segments:
+            self.compact()
+
+    def _load_checkpoint(self) -> int:
+        """Loads the counters of the checkpoint, if there is one.
+
+        Returns:
+            int: The number of the last segment the checkpoint covers, 0 if there is none.
+        """
+
+        checkpoint = os.path.join(self._path, _CHECKPOINT)
+        if not os.path.exists(checkpoint):
+            return 0
+
+        with open(checkpoint, "rb") as checkpoint_file:
+            data = checkpoint_file.read()
+        if not data.startswith(_CHECKPOINT_MAGIC):
+            raise ValueError("%s is not a listening log checkpoint" % checkpoint)
+
+        covered, updated_at, count = _CHECKPOINT_HEADER.unpack_from(data, len(_CHECKPOINT_MAGIC))
+        offset = len(_CHECKPOINT_MAGIC) + _CHECKPOINT_HEADER.size
+        for track_id, skips, full_listens in _CHECKPOINT_COUNTERS.iter_unpack(
+                data[offset:offset + count * _CHECKPOINT_COUNTERS.size]):
+            self._counters[track_id.rstrip(b"\0").decode()] = _TrackCounters(skips, full_listens, updated_at)
+        return covered
+
+    def _replay(self, number: int) -> int:
+        """Counts the events of a segment. A record at the end that was only partly written is ignored.
+
+        Args:
+            number: The number of the segment.
+
+        Returns:
+            int: How many events were counted.
+        """
+
+        with open(self._segment_path(number), "rb") as segment:
+            data = segment.read()
+        if not data.startswith(_SEGMENT_MAGIC):
+            LOG.warning("Ignoring %s, it is not a listening log segment", self._segment_path(number))
+            return 0
+
+        records = data[len(_SEGMENT_MAGIC):]
+        records = records[:len(records) - len(records) % _EVENT.size]
+        events = 0
+        for at, kind, track_id in _EVENT.iter_unpack(records):
+            self._count(track_id.rstrip(b"\0").decode(), kind, at)
+            events += 1
+        return events
+
+    def _rotate(self) -> None:
+        """Closes the segment being written to and starts the next one. Segments are never appended to once closed.
+        """
+
+        self.close()
+        self._segment_number += 1
+        self._segment = open(self._segment_path(self._segment_number), "wb")
+        self._segment.write(_SEGMENT_MAGIC)
+        self._segment.flush()
+        self._segment_bytes = len(_SEGMENT_MAGIC)
+
+    def _segment_numbers(self) -> List[int]:
+        return sorted(int(name[:-len(".log")]) for name in os.listdir(self._path) if name.endswith(".log"))
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self._path, "%08d.log" % number)
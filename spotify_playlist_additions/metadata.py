@@ -0,0 +1,216 @@
+"""Contains the metadata service, which looks tracks, artists, albums and audio features up for the addons in batches
+and caches them"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# The batch endpoint of each kind of metadata, and the most IDs it takes per request
+ENDPOINTS = {
+    "track": ("tracks", 50),
+    "artist": ("artists", 50),
+    "album": ("albums", 20),
+    "audio_features": ("audio_features", 100),
+}
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+# How long a lookup waits for others to join its batch, in seconds
+DEFAULT_BATCH_DELAY = 0.01
+
+
+class _CacheEntry:
+    """A cached lookup"""
+
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value: Any, size: int, expires_at: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class MetadataService:
+    """Looks metadata up by Spotify ID for the addons of a single user, so that an addon can ask for the artist of every
+    track it sees without costing a request per event.
+
+    Lookups of the same kind made within batch_delay seconds of each other are sent as a single request to the batch
+    endpoint of that kind, and a lookup of an ID that is already being fetched waits for that fetch instead of starting
+    another. Results, including IDs Spotify does not know, are kept in an LRU cache for ttl seconds. The cache is
+    bounded by the approximate size of the results in bytes, the least recently used results are evicted first.
+    """
+    def __init__(self,
+                 spotify_client: "AsyncSpotify",
+                 ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 batch_delay: float = DEFAULT_BATCH_DELAY):
+        """Initializer for a MetadataService.
+
+        Args:
+            spotify_client: The client to make the batch requests with.
+            ttl: How many seconds a result is cached for.
+            max_bytes: The approximate size of the results the cache holds at most.
+            batch_delay: How many seconds a lookup waits for others to join its batch.
+        """
+
+        self._spotify_client = spotify_client
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._batch_delay = batch_delay
+
+        self._cache: Dict[Tuple[str, str], _CacheEntry] = OrderedDict()
+        self._cached_bytes = 0
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._queued: Dict[str, List[str]] = {kind: [] for kind in ENDPOINTS}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def cached_bytes(self) -> int:
+        """The approximate size of the cached results
+
+        Returns:
+            int: The size in bytes.
+        """
+
+        return self._cached_bytes
+
+    async def track(self, track_id: str) -> Optional[dict]:
+        """Looks a track up, see Spotify.track"""
+
+        return await self.get("track", track_id)
+
+    async def artist(self, artist_id: str) -> Optional[dict]:
+        """Looks an artist up, see Spotify.artist"""
+
+        return await self.get("artist", artist_id)
+
+    async def album(self, album_id: str) -> Optional[dict]:
+        """Looks an album up, see Spotify.album"""
+
+        return await self.get("album", album_id)
+
+    async def audio_features(self, track_id: str) -> Optional[dict]:
+        """Looks the audio features of a track up, see Spotify.audio_features"""
+
+        return await self.get("audio_features", track_id)
+
+    async def get(self, kind: str, spotify_id: str) -> Optional[dict]:
+        """Looks something up, from the cache if it is there and otherwise as part of a batch.
+
+        Args:
+            kind: What to look up, one of ENDPOINTS.
+            spotify_id: The Spotify ID of what to look up.
+
+        Raises:
+            SpotifyException: If the batch request failed. Nothing is cached then.
+
+        Returns:
+            Optional[dict]: What was looked up, in the format of the spotify API, or None if Spotify does not know it.
+        """
+
+        key = (kind, spotify_id)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                return entry.value
+            self._evict(key)
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.get_event_loop().create_future()
+            self._queue(kind, spotify_id)
+        # Shielded so that one waiter giving up does not cancel the lookup for the others
+        return await asyncio.shield(future)
+
+    def _queue(self, kind: str, spotify_id: str) -> None:
+        """Adds an ID to the next batch of its kind, sending the batch right away once it is full.
+
+        Args:
+            kind: What to look up.
+            spotify_id: The Spotify ID of what to look up.
+        """
+
+        queued = self._queued[kind]
+        queued.append(spotify_id)
+        if len(queued) >= ENDPOINTS[kind][1]:
+            self._flush(kind)
+        elif kind not in self._flush_handles:
+            self._flush_handles[kind] = asyncio.get_event_loop().call_later(self._batch_delay, self._flush, kind)
+
+    def _flush(self, kind: str) -> None:
+        """Sends the queued batch of a kind.
+
+        Args:
+            kind: What to look up.
+        """
+
+        handle = self._flush_handles.pop(kind, None)
+        if handle:
+            handle.cancel()
+        spotify_ids, self._queued[kind] = self._queued[kind], []
+        if spotify_ids:
+            asyncio.ensure_future(self._fetch(kind, spotify_ids))
+
+    async def _fetch(self, kind: str, spotify_ids: List[str]) -> None:
+        """Makes a batch request and hands its results to everyone waiting for them.
+
+        Args:
+            kind: What to look up.
+            spotify_ids: The Spotify IDs to look up, at most as many as the batch endpoint takes.
+        """
+
+        endpoint = ENDPOINTS[kind][0]
+        try:
+            response = await getattr(self._spotify_client, endpoint)(spotify_ids)
+            # Every batch endpoint but the audio features one wraps the results in an object named after it
+            results = response[endpoint] if isinstance(response, dict) else response
+        except Exception as e:
+            LOG.warning("Failed to look up %s %ss: %s", len(spotify_ids), kind, e)
+            for spotify_id in spotify_ids:
+                future = self._in_flight.pop((kind, spotify_id))
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        LOG.debug("Looked up %s %ss in one request", len(spotify_ids), kind)
+        expires_at = time.monotonic() + self._ttl
+        results = results or []
+        for position, spotify_id in enumerate(spotify_ids):
+            result = results[position] if position < len(results) else None
+            self._store((kind, spotify_id), result, expires_at)
+            future = self._in_flight.pop((kind, spotify_id))
+            if not future.done():
+                future.set_result(result)
+
+    def _store(self, key: Tuple[str, str], value: Optional[dict], expires_at: float) -> None:
+        """Caches a result, evicting the least recently used ones until the cache fits within max_bytes again.
+
+        Args:
+            key: The kind and Spotify ID of the result.
+            value: The result.
+            expires_at: When the result should no longer be used, in the time of time.monotonic.
+        """
+
+        size = len(json.dumps(value))
+        if size > self._max_bytes:
+            return
+        if key in self._cache:
+            self._evict(key)
+
+        self._cache[key] = _CacheEntry(value, size, expires_at)
+        self._cached_bytes += size
+        while self._cached_bytes > self._max_bytes:
+            self._evict(next(iter(self._cache)))
+
+    def _evict(self, key: Tuple[str, str]) -> None:
+        self._cached_bytes -= self._cache.pop(key).size
@@ -0,0 +1,260 @@
+"""Contains the runtime metrics of the engine, exposed in the Prometheus text format"""
+
+import asyncio
+import bisect
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+class _CounterChild:
+    """The value of a counter for one combination of label values"""
+
+    __slots__ = ("value", )
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        """Increases the counter.
+
+        Args:
+            amount: How much to increase the counter by.
+        """
+
+        self.value += amount
+
+
+class _HistogramChild:
+    """The buckets of a histogram for one combination of label values"""
+
+    __slots__ = ("_upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        # The last bucket is +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Records a single observation.
+
+        Args:
+            value: The observed value.
+        """
+
+        self.counts[bisect.bisect_left(self._upper_bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric(ABC):
+    """A metric family. Children are created once per combination of label values and should be kept by the caller,
+    so that recording a value in the hot path does not allocate anything.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """Gets the child for a combination of label values, creating it the first time.
+
+        Args:
+            *values: The label values, in the same order as the label names.
+
+        Returns:
+            The child, which values are recorded on.
+        """
+
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s expects labels %s" % (self.name, self.labelnames))
+            child = self._children[values] = self._create_child()
+        return child
+
+    @abstractmethod
+    def _create_child(self):
+        """Creates the child for a new combination of label values
+        """
+
+    @abstractmethod
+    def _samples(self) -> Iterator[str]:
+        """Renders the value of every child
+
+        Returns:
+            Iterator[str]: The sample lines, in the Prometheus text format.
+        """
+
+    def render(self) -> str:
+        """Renders the metric in the Prometheus text format
+
+        Returns:
+            str: The metric family, with its HELP and TYPE lines.
+        """
+
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.kind)]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only ever goes up"""
+
+    kind = "counter"
+
+    def _create_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            yield "%s%s %s" % (self.name, _format_labels(self.labelnames, values), child.value)
+
+
+class Histogram(_Metric):
+    """Counts observations into buckets, along with their sum"""
+
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self._upper_bounds = tuple(sorted(buckets))
+
+    def _create_child(self) -> _HistogramChild:
+        return _HistogramChild(self._upper_bounds)
+
+    def _samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for upper_bound, count in zip(self._upper_bounds + (float("inf"), ), child.counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if upper_bound == float("inf") else repr(float(upper_bound)))
+                yield "%s_bucket%s %s" % (self.name, _format_labels(self.labelnames, values, le), cumulative)
+            yield "%s_sum%s %s" % (self.name, _format_labels(self.labelnames, values), child.sum)
+            yield "%s_count%s %s" % (self.name, _format_labels(self.labelnames, values), cumulative)
+
+
+class Registry:
+    """A collection of metrics that are exposed together"""
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Adds a metric to the registry.
+
+        Args:
+            metric: The metric to add.
+
+        Returns:
+            The metric, so that it can be defined and registered in one go.
+        """
+
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text format
+
+        Returns:
+            str: The exposition.
+        """
+
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+POLL_ITERATION_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_poll_iteration_seconds",
+              "Time spent in one iteration of the poll loop, not counting the sleep"))
+STARTUP_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_startup_seconds",
+              "Time from starting until the first poll returned",
+              buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+POLL_DRIFT_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_poll_drift_seconds",
+              "How much later than scheduled each poll started",
+              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)))
+SPOTIFY_REQUEST_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_spotify_request_seconds", "Latency of Spotify API requests, by endpoint",
+              ("endpoint", )))
+SPOTIFY_ERRORS = REGISTRY.register(
+    Counter("spotify_playlist_additions_spotify_errors_total",
+            "Spotify API requests that were rate limited, timed out or failed, by endpoint", ("endpoint", "kind")))
+SPOTIFY_RESPONSES = REGISTRY.register(
+    Counter("spotify_playlist_additions_spotify_responses_total",
+            "Successful responses of the polled Spotify API endpoints, by endpoint and whether they had a body",
+            ("endpoint", "status")))
+SPOTIFY_RESPONSE_BYTES = REGISTRY.register(
+    Counter("spotify_playlist_additions_spotify_response_bytes_total",
+            "Bytes in the bodies of the polled Spotify API endpoints, by endpoint", ("endpoint", )))
+SPOTIFY_PARSE_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_spotify_parse_seconds",
+              "Time spent parsing the bodies of the polled Spotify API endpoints, by endpoint", ("endpoint", ),
+              buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)))
+EVENTS = REGISTRY.register(
+    Counter("spotify_playlist_additions_events_total", "Events detected by the poll loop", ("event", )))
+ADDON_HANDLER_SECONDS = REGISTRY.register(
+    Histogram("spotify_playlist_additions_addon_handler_seconds", "Time spent in playlist addon handlers, by addon",
+              ("addon", )))
+EVENTS_DROPPED = REGISTRY.register(
+    Counter("spotify_playlist_additions_events_dropped_total",
+            "Events dropped because the queue of an addon was full, by addon", ("addon", )))
+
+
+async def start_metrics_server(port: int,
+                               host: str = "127.0.0.1",
+                               registry: Registry = REGISTRY) -> asyncio.AbstractServer:
+    """Serves the metrics over HTTP on the running event loop. Every request is answered with the metrics, whatever
+    its path.
+
+    Args:
+        port: The port to listen on.
+        host: The address to listen on. Only local connections are accepted by default.
+        registry: The metrics to serve.
+
+    Returns:
+        asyncio.AbstractServer: The server, which can be closed to stop serving.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # The request itself is irrelevant, read up to the end of its headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            body = registry.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    LOG.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
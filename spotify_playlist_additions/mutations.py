@@ -0,0 +1,288 @@
+"""Contains the mutation queue that sits between the playlist addons and the Spotify API"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Set, Union
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playback import Track, track_keys
+from spotify_playlist_additions.playlist_diff import diff
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.rate_limit import CircuitOpenError, jittered_backoff
+
+LOG = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 100
+
+
+class _PendingMutation:
+    """The net change to a single track of the playlist that is waiting to be sent"""
+
+    __slots__ = ("track", "was_present", "present")
+
+    def __init__(self, track: Union[Track, dict], was_present: bool, present: bool):
+        self.track = track
+        self.was_present = was_present
+        self.present = present
+
+
+def _batches(uris: List[str]) -> List[List[str]]:
+    return [uris[index:index + MAX_BATCH_SIZE] for index in range(0, len(uris), MAX_BATCH_SIZE)]
+
+
+class PlaylistMutationQueue:
+    """Collects the adds and removes that the playlist addons make to a single playlist and sends them in batches.
+
+    Only the net change to each track is kept, so operations that contradict each other cancel out: adding a track
+    and then removing it again before the queue is flushed sends nothing at all. The playlist index is updated as soon
+    as an operation is queued, so addons see the playlist as it will be once the queue has been flushed.
+
+    The queue is flushed flush_delay seconds after the last operation was queued, but never later than max_flush_delay
+    seconds after the first, as soon as a full batch is waiting, and when the queue is closed. A flush first checks the
+    snapshot_id of the playlist. If another client has edited the playlist, the index is loaded again and the plan is
+    worked out against the playlist as it is now, so the edit is taken into account rather than overwritten.
+    """
+    def __init__(self,
+                 spotify_client: AsyncSpotify,
+                 user_id: str,
+                 playlist: dict,
+                 playlist_index: PlaylistIndex,
+                 flush_delay: float = 5,
+                 max_flush_delay: float = 30,
+                 dry_run: bool = False):
+        """Initializer for a PlaylistMutationQueue.
+
+        Args:
+            spotify_client: A client that can be used for making Spotify API calls.
+            user_id: The user ID that has connected to this runtime.
+            playlist: The playlist that is being mutated. In the same format as described on the spotify API
+            playlist_index: The membership index of the playlist.
+            flush_delay: How many seconds to wait for more operations before flushing.
+            max_flush_delay: The most amount of seconds an operation can wait before it is flushed.
+            dry_run: Whether to print the plan of each flush instead of sending it. The playlist index still assumes
+                the plan was sent.
+        """
+
+        self._spotify_client = spotify_client
+        self._user_id = user_id
+        self._playlist = playlist
+        self._playlist_index = playlist_index
+        self._flush_delay = flush_delay
+        self._max_flush_delay = max_flush_delay
+        self._dry_run = dry_run
+
+        self._pending: Dict[str, _PendingMutation] = OrderedDict()
+        self._first_queued: float = None
+        self._flush_handle: asyncio.TimerHandle = None
+        self._flush_lock = asyncio.Lock()
+        self._failed_flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def settled(self) -> bool:
+        """Whether every queued operation has been sent, so that the playlist index matches the playlist itself
+        rather than what it will be once the queue is flushed.
+
+        Returns:
+            bool: Whether nothing is queued or being flushed.
+        """
+
+        return not self._pending and not self._flush_lock.locked()
+
+    def add(self, track: Union[Track, dict]) -> None:
+        """Queues the track to be added to the playlist.
+
+        Args:
+            track: The track to add. A Track or a track in the format of a spotify API track.
+        """
+
+        self._queue(track, True)
+        self._playlist_index.add(track)
+
+    def remove(self, track: Union[Track, dict]) -> None:
+        """Queues every occurrence of the track to be removed from the playlist.
+
+        Args:
+            track: The track to remove. A Track or a track in the format of a spotify API track.
+        """
+
+        self._queue(track, False)
+        self._playlist_index.discard(track)
+
+    def rebase(self) -> None:
+        """Re-applies the queued operations on top of the playlist index after it has been loaded again, so that
+        changes made by other clients are taken into account when working out the net change of each track.
+        """
+
+        for mutation in self._pending.values():
+            mutation.was_present = self._playlist_index.contains(mutation.track)
+            if mutation.present:
+                self._playlist_index.add(mutation.track)
+            else:
+                self._playlist_index.discard(mutation.track)
+
+    async def resync(self) -> None:
+        """Brings the playlist index up to date with changes made by other clients and rebases the queued operations
+        on top of it. Waits for a flush that is running, which may be doing the same.
+        """
+
+        async with self._flush_lock:
+            await self._resync()
+
+    async def flush(self) -> None:
+        """Sends every queued operation that still changes the playlist, in batches of up to 100 tracks
+        """
+
+        async with self._flush_lock:
+            self._cancel_flush()
+            if all(mutation.present == mutation.was_present for mutation in self._pending.values()):
+                self._pending = OrderedDict()
+                return
+
+            try:
+                await self._resync()
+            except Exception as e:
+                LOG.error("Failed to check %s for edits, will retry %s changes: %s", self._playlist["name"],
+                          len(self._pending), e)
+                self._requeue(OrderedDict(), e)
+                return
+
+            pending, self._pending = self._pending, OrderedDict()
+            plan = diff(OrderedDict((uri, mutation.present) for uri, mutation in pending.items()),
+                        {uri for uri, mutation in pending.items() if mutation.was_present},
+                        self._playlist_index.snapshot_id)
+            if not plan:
+                return
+
+            if self._dry_run:
+                print(plan.describe(self._playlist["name"]))
+                return
+
+            LOG.info("Flushing %s adds and %s removes to %s", len(plan.adds), len(plan.removes),
+                     self._playlist["name"])
+
+            # The plan was just checked against the snapshot_id of the playlist, so the snapshot_id our changes return
+            # can be adopted. Only an edit another client makes in the moment between the check and the requests is
+            # missed, until the playlist is loaded again.
+            snapshot_id = None
+            sent: Set[str] = set()
+            try:
+                for batch in _batches(plan.removes):
+                    result = await self._spotify_client.user_playlist_remove_all_occurrences_of_tracks(
+                        self._user_id, self._playlist["id"], batch)
+                    sent.update(batch)
+                    snapshot_id = result["snapshot_id"]
+
+                for batch in _batches(plan.adds):
+                    result = await self._spotify_client.user_playlist_add_tracks(self._user_id, self._playlist["id"],
+                                                                                 batch)
+                    sent.update(batch)
+                    snapshot_id = result["snapshot_id"]
+            except Exception as e:
+                unsent = OrderedDict((uri, pending[uri]) for uri in plan.removes + plan.adds if uri not in sent)
+                LOG.error("Failed to update %s, will retry %s changes: %s", self._playlist["name"], len(unsent), e)
+                self._requeue(unsent, e)
+
+                # A request that failed may still have been applied, so the index can no longer be trusted. An open
+                # circuit breaker never sends the request, so the index stays exactly as it was.
+                if not isinstance(e, CircuitOpenError):
+                    self._playlist_index.invalidate()
+                    return
+            else:
+                self._failed_flushes = 0
+
+            if sent:
+                self._playlist_index.snapshot_id = snapshot_id
+
+    async def close(self) -> None:
+        """Flushes everything that is still queued. Called once at the end of runtime.
+        """
+
+        await self.flush()
+        self._cancel_flush()
+        if self._pending:
+            LOG.error("Gave up on %s changes to %s", len(self._pending), self._playlist["name"])
+
+    async def _resync(self) -> None:
+        """See resync. Must be called with the flush lock held."""
+
+        if await self._playlist_index.resync():
+            LOG.info("%s was edited by another client, planning on top of the edit", self._playlist["name"])
+            self.rebase()
+
+    def _requeue(self, unsent: Dict[str, _PendingMutation], error: Exception) -> None:
+        """Puts operations that failed to send back in front of the queue, and retries them after a backoff that grows
+        with every flush that fails in a row.
+
+        Args:
+            unsent: The operations that were not sent, by URI.
+            error: Why they were not sent.
+        """
+
+        requeued = OrderedDict(unsent)
+        for uri, mutation in self._pending.items():
+            # Queued while the flush was running, on top of an index that assumed the failed operation had been sent
+            if uri in requeued:
+                mutation.was_present = requeued[uri].was_present
+            requeued[uri] = mutation
+        self._pending = requeued
+
+        delay = jittered_backoff(self._failed_flushes, cap=self._max_flush_delay)
+        if isinstance(error, CircuitOpenError):
+            delay = max(delay, error.retry_after)
+        self._failed_flushes += 1
+
+        self._cancel_flush()
+        self._flush_handle = asyncio.get_event_loop().call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    def _queue(self, track: Union[Track, dict], present: bool) -> None:
+        """Records the desired state of a track and schedules a flush.
+
+        Args:
+            track: The track that is being added or removed. A Track or a track in the format of a spotify API track.
+            present: Whether the track should be in the playlist.
+        """
+
+        track_id, uri = track_keys(track)
+        mutation = self._pending.get(uri)
+        if mutation:
+            mutation.present = present
+        else:
+            if not isinstance(track, Track):
+                track = {"id": track_id, "uri": uri}
+            self._pending[uri] = _PendingMutation(track, self._playlist_index.contains(track), present)
+
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Restarts the debounce timer, or flushes straight away if a full batch is waiting or the oldest operation
+        has waited long enough.
+        """
+
+        loop = asyncio.get_event_loop()
+        if self._first_queued is None:
+            self._first_queued = loop.time()
+
+        self._cancel_flush(reset_first_queued=False)
+
+        delay = min(self._flush_delay, self._first_queued + self._max_flush_delay - loop.time())
+        if len(self._pending) >= MAX_BATCH_SIZE:
+            delay = 0
+
+        self._flush_handle = loop.call_later(max(delay, 0), lambda: asyncio.ensure_future(self.flush()))
+
+    def _cancel_flush(self, reset_first_queued: bool = True) -> None:
+        """Stops the debounce timer.
+
+        Args:
+            reset_first_queued: Whether the queue is being emptied, so the next operation starts a new timer.
+        """
+
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if reset_first_queued:
+            self._first_queued = None
@@ -0,0 +1,164 @@
+"""Contains the compact records the engine parses the currently playing endpoint into"""
+
+import logging
+from typing import Optional, Tuple, Union
+
+LOG = logging.getLogger(__name__)
+
+
+class Track:
+    """The parts of a track the engine and the addons work with. Much smaller than the track of the API, which also
+    carries the album, its artwork, every artist and the markets it is available in.
+    """
+
+    __slots__ = ("id", "uri", "name", "duration_ms", "isrc", "artist", "_payload")
+
+    def __init__(self,
+                 track_id: Optional[str],
+                 uri: str,
+                 name: str,
+                 duration_ms: int,
+                 payload: dict = None,
+                 isrc: str = None,
+                 artist: str = None):
+        """Initializer for a Track.
+
+        Args:
+            track_id: The Spotify ID of the track. None for local files.
+            uri: The Spotify URI of the track.
+            name: The name of the track.
+            duration_ms: How long the track is in milliseconds.
+            payload: The payload of the currently playing endpoint the track was parsed from, if it should be kept.
+            isrc: The International Standard Recording Code of the track, if Spotify knows it.
+            artist: The name of the primary artist of the track.
+        """
+
+        self.id = track_id
+        self.uri = uri
+        self.name = name
+        self.duration_ms = duration_ms
+        self.isrc = isrc
+        self.artist = artist
+        self._payload = payload
+
+    def __repr__(self) -> str:
+        return "Track(%s)" % self.name
+
+    @classmethod
+    def from_api(cls, item: dict, payload: dict = None) -> "Track":
+        """Parses a track of the API.
+
+        Args:
+            item: The track, in the format of a spotify API track.
+            payload: The payload the track was taken from, if it should be kept.
+
+        Returns:
+            Track: The track.
+        """
+
+        artists = item.get("artists")
+        return cls(item.get("id"), item.get("uri"), item["name"], item["duration_ms"], payload,
+                   (item.get("external_ids") or {}).get("isrc"), artists[0]["name"] if artists else None)
+
+    @property
+    def raw(self) -> Optional[dict]:
+        """The payload of the currently playing endpoint the track was parsed from, in the exact format Spotify defines
+        in their API. Only kept when an addon asks for it with wants_raw_track, see AbstractPlaylist.raw_track for
+        looking the track up when it was not.
+
+        Returns:
+            Optional[dict]: The payload, or None if it was not kept.
+        """
+
+        return self._payload
+
+    def to_dict(self) -> dict:
+        """The track in the format of a spotify API track, with only the fields the engine uses. Accepted anywhere a
+        track from the API is, such as the playlist index and the mutation queue.
+
+        Returns:
+            dict: The track.
+        """
+
+        track = {"id": self.id, "uri": self.uri, "name": self.name, "duration_ms": self.duration_ms}
+        if self.isrc:
+            track["external_ids"] = {"isrc": self.isrc}
+        if self.artist:
+            track["artists"] = [{"name": self.artist}]
+        return track
+
+
+def track_keys(track: Union[Track, dict]) -> Tuple[Optional[str], Optional[str]]:
+    """Reads the ID and URI of a track without building anything new.
+
+    Args:
+        track: A Track, or a track in the format of a spotify API track.
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: The ID and URI of the track, None where the track has none.
+    """
+
+    if isinstance(track, Track):
+        return track.id, track.uri
+    return track.get("id"), track.get("uri")
+
+
+class PlaybackState:
+    """What a single frame of the currently playing endpoint says about playback"""
+
+    __slots__ = ("track", "progress_ms", "is_playing")
+
+    def __init__(self, track: Track, progress_ms: int, is_playing: bool):
+        """Initializer for a PlaybackState.
+
+        Args:
+            track: The track that is playing.
+            progress_ms: How far into the track playback is, in milliseconds.
+            is_playing: Whether playback is running rather than paused.
+        """
+
+        self.track = track
+        self.progress_ms = progress_ms
+        self.is_playing = is_playing
+
+    def __repr__(self) -> str:
+        return "PlaybackState(%s, %s/%s)" % (self.track.name, self.progress_ms, self.track.duration_ms)
+
+    @classmethod
+    def from_api(cls, payload: Optional[dict], keep_raw: bool = False) -> Optional["PlaybackState"]:
+        """Parses a payload of the currently playing endpoint. Also parses what to_dict returns.
+
+        Args:
+            payload: The payload, or None if nothing was retrieved.
+            keep_raw: Whether to keep a reference to the payload on the track. Otherwise the payload can be freed as
+                soon as it has been parsed.
+
+        Returns:
+            Optional[PlaybackState]: The playback state, or None if nothing is playing.
+        """
+
+        item = payload.get("item") if payload else None
+        if not item:
+            return None
+
+        track = Track.from_api(item, payload if keep_raw else None)
+        return cls(track, payload["progress_ms"], bool(payload.get("is_playing")))
+
+    @property
+    def remaining_ms(self) -> int:
+        """How much of the track is left to play
+
+        Returns:
+            int: The remaining duration of the track in milliseconds.
+        """
+
+        return self.track.duration_ms - self.progress_ms
+
+    def to_dict(self) -> dict:
+        """The playback state in the format of the currently playing endpoint, with only the fields the engine uses
+
+        Returns:
+            dict: The playback state.
+        """
+
+        return {"is_playing": self.is_playing, "progress_ms": self.progress_ms, "item": self.track.to_dict()}
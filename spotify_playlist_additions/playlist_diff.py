@@ -0,0 +1,71 @@
+"""Contains the diff engine, which works out the fewest requests that bring a playlist to the state the addons want"""
+
+import logging
+from typing import Container, List, Mapping, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class MutationPlan:
+    """The adds and removes that turn the actual state of a playlist into the desired one, along with the snapshot_id
+    of the playlist they were worked out against.
+    """
+
+    __slots__ = ("adds", "removes", "snapshot_id")
+
+    def __init__(self, adds: List[str], removes: List[str], snapshot_id: Optional[str]):
+        """Initializer for a MutationPlan.
+
+        Args:
+            adds: The URIs of the tracks to add.
+            removes: The URIs of the tracks to remove every occurrence of.
+            snapshot_id: The snapshot_id of the playlist the plan applies to.
+        """
+
+        self.adds = adds
+        self.removes = removes
+        self.snapshot_id = snapshot_id
+
+    def __bool__(self) -> bool:
+        return bool(self.adds or self.removes)
+
+    def __len__(self) -> int:
+        return len(self.adds) + len(self.removes)
+
+    def describe(self, playlist_name: str) -> str:
+        """Lists every change in the plan, one per line, for a dry run.
+
+        Args:
+            playlist_name: The name of the playlist the plan applies to.
+
+        Returns:
+            str: The description.
+        """
+
+        lines = ["%s adds and %s removes to %s at snapshot %s" % (len(self.adds), len(self.removes), playlist_name,
+                                                                  self.snapshot_id)]
+        lines.extend("  - %s" % uri for uri in self.removes)
+        lines.extend("  + %s" % uri for uri in self.adds)
+        return "\n".join(lines)
+
+
+def diff(desired: Mapping[str, bool], actual: Container[str], snapshot_id: Optional[str] = None) -> MutationPlan:
+    """Compares the desired state of the tracks the addons changed with the actual state of the playlist, in a single
+    pass. Tracks that are already where the addons want them cost nothing, so a remove of a track the playlist does not
+    have, or an add and a remove that cancel out, never turn into a request.
+
+    Args:
+        desired: Whether each track should be in the playlist, by URI. Tracks the addons did not touch are left out.
+        actual: The URIs of the tracks that are in the playlist, at least of those in desired.
+        snapshot_id: The snapshot_id of the playlist that actual describes.
+
+    Returns:
+        MutationPlan: The changes, in the order the tracks appear in desired.
+    """
+
+    adds = []
+    removes = []
+    for uri, present in desired.items():
+        if present != (uri in actual):
+            (adds if present else removes).append(uri)
+    return MutationPlan(adds, removes, snapshot_id)
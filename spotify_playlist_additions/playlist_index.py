@@ -0,0 +1,207 @@
+"""Contains the playlist index, a local copy of the membership of the playlist shared by every playlist addon"""
+
+import logging
+from typing import Iterable, Optional, Set, Union
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playback import Track, track_keys
+from spotify_playlist_additions.playlist_loader import iter_playlist_tracks
+from spotify_playlist_additions.state import StateStore
+
+LOG = logging.getLogger(__name__)
+
+
+class PlaylistIndex:
+    """A hash based membership index of a single playlist. Loaded once from the Spotify API, after which every lookup
+    is O(1) and makes no network calls. Playlist addons that mutate the playlist are expected to keep the index up to
+    date, normally through a PlaylistMutationQueue. Changes made by other clients are picked up by resync, which uses
+    the snapshot_id of the playlist to avoid downloading it again when nothing has changed.
+    """
+    def __init__(self, spotify_client: AsyncSpotify, playlist: dict):
+        """Initializer for a PlaylistIndex. Does not make any API calls, the index is empty until load is called.
+
+        Args:
+            spotify_client: A client that can be used for making Spotify API calls.
+            playlist: The playlist that is being indexed. In the same format as described on the spotify API
+        """
+
+        self._spotify_client = spotify_client
+        self._playlist = playlist
+
+        self._track_ids: Set[str] = set()
+        self._track_uris: Set[str] = set()
+
+        self._snapshot_id: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._track_uris)
+
+    @property
+    def snapshot_id(self) -> Optional[str]:
+        """The version of the playlist that the index currently reflects. None until the index has been loaded.
+
+        Returns:
+            Optional[str]: The snapshot_id of the playlist.
+        """
+
+        return self._snapshot_id
+
+    @snapshot_id.setter
+    def snapshot_id(self, snapshot_id: str) -> None:
+        """Adopts the snapshot_id returned by the API for a mutation of the playlist, so that the index does not
+        consider its own changes as edits by another client. Only correct if the index was up to date right before the
+        mutation, as the returned snapshot_id also covers any edit another client made before it.
+
+        Args:
+            snapshot_id: The snapshot_id returned by the mutation.
+        """
+
+        self._snapshot_id = snapshot_id
+
+    def invalidate(self) -> None:
+        """Forces the next resync to download the whole playlist again
+        """
+
+        self._snapshot_id = None
+
+    async def load(self) -> None:
+        """Replaces the contents of the index with the current contents of the playlist
+        """
+
+        LOG.info("Loading the contents of %s", self._playlist["name"])
+
+        # Fetched before the pages, so an edit made while paging leaves an old snapshot_id behind and is caught by the
+        # next resync rather than being missed.
+        snapshot_id = await self.fetch_snapshot_id()
+
+        # Built on the side and swapped in at the end, so that addons never see a half loaded index and a page that
+        # fails to load leaves the previous contents in place
+        track_ids: Set[str] = set()
+        track_uris: Set[str] = set()
+        async for playlist_track in iter_playlist_tracks(self._spotify_client, self._playlist["id"]):
+            track = playlist_track["track"]
+            # Episodes and removed tracks come back from the playlist endpoints as None
+            if not track:
+                continue
+            track_id, uri = track_keys(track)
+            if track_id:
+                track_ids.add(track_id)
+            if uri:
+                track_uris.add(uri)
+
+        self._track_ids = track_ids
+        self._track_uris = track_uris
+        self._snapshot_id = snapshot_id
+        LOG.info("Loaded %s tracks from %s", len(self), self._playlist["name"])
+
+    def save(self, state_store: StateStore) -> None:
+        """Checkpoints the index, so that a later run can restore it instead of loading the playlist again.
+
+        Args:
+            state_store: Where to keep the checkpoint.
+        """
+
+        state_store.save_playlist_index(self._playlist["id"], self._snapshot_id, list(self._track_ids),
+                                        list(self._track_uris))
+
+    def restore(self, state_store: StateStore) -> bool:
+        """Replaces the contents of the index with the last checkpoint of the playlist. Makes no API calls; the next
+        resync downloads the playlist again only if it has changed since the checkpoint.
+
+        Args:
+            state_store: Where the checkpoint is kept.
+
+        Returns:
+            bool: Whether there was a checkpoint to restore.
+        """
+
+        checkpoint = state_store.load_playlist_index(self._playlist["id"])
+        if checkpoint is None:
+            return False
+
+        self._snapshot_id, track_ids, track_uris = checkpoint
+        self._track_ids = set(track_ids)
+        self._track_uris = set(track_uris)
+        LOG.info("Restored %s tracks of %s", len(self), self._playlist["name"])
+        return True
+
+    async def resync(self) -> bool:
+        """Brings the index up to date with changes made by other clients. Costs a single small request when the
+        playlist has not changed since it was last loaded, no matter how large the playlist is.
+
+        Returns:
+            bool: Whether the playlist had changed and was downloaded again.
+        """
+
+        if self._snapshot_id is not None and await self.fetch_snapshot_id() == self._snapshot_id:
+            LOG.debug("%s is unchanged, skipping resync", self._playlist["name"])
+            return False
+
+        await self.load()
+        return True
+
+    async def fetch_snapshot_id(self) -> str:
+        """Retrieves the current version of the playlist without any of its tracks
+
+        Returns:
+            str: The snapshot_id of the playlist.
+        """
+
+        playlist = await self._spotify_client.playlist(self._playlist["id"], fields="snapshot_id")
+        return playlist["snapshot_id"]
+
+    def update(self, tracks: Iterable[dict]) -> None:
+        """Adds many tracks to the index at once.
+
+        Args:
+            tracks: The tracks to add. In the format of a spotify API track, only the id and uri are required.
+        """
+
+        for track in tracks:
+            self.add(track)
+
+    def contains(self, track: Union[Track, dict]) -> bool:
+        """Checks whether the playlist contains the track. Matches on either the track ID or URI, so local files (which
+        have no ID) can still be found.
+
+        Args:
+            track: The track that is being looked for. A Track or a track in the format of a spotify API track.
+
+        Returns:
+            bool: Whether the playlist contains the track.
+        """
+
+        track_id, uri = track_keys(track)
+        if track_id and track_id in self._track_ids:
+            return True
+        return bool(uri) and uri in self._track_uris
+
+    def add(self, track: Union[Track, dict]) -> None:
+        """Records that the track has been added to the playlist.
+
+        Args:
+            track: The track that was added. A Track or a track in the format of a spotify API track.
+        """
+
+        # Episodes and removed tracks come back from the playlist endpoints as None
+        if not track:
+            return
+
+        track_id, uri = track_keys(track)
+        if track_id:
+            self._track_ids.add(track_id)
+        if uri:
+            self._track_uris.add(uri)
+
+    def discard(self, track: Union[Track, dict]) -> None:
+        """Records that the track has been removed from the playlist. Does nothing if the track was not in the index.
+
+        Args:
+            track: The track that was removed. A Track or a track in the format of a spotify API track.
+        """
+
+        track_id, uri = track_keys(track)
+        if track_id:
+            self._track_ids.discard(track_id)
+        if uri:
+            self._track_uris.discard(uri)
@@ -0,0 +1,94 @@
+"""Contains a loader that downloads the pages of a playlist, or of any other paged endpoint, concurrently"""
+
+import asyncio
+import logging
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+
+LOG = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+SAVED_TRACKS_PAGE_SIZE = 50
+
+
+async def iter_pages(fetch_page: Callable[[int, int], Awaitable[dict]],
+                     page_size: int = PAGE_SIZE,
+                     max_in_flight: int = 8) -> AsyncIterator[dict]:
+    """Yields every item of a paged endpoint in order. The first page is requested on its own, which tells us the total
+    amount of items. The remaining pages are then requested concurrently, with at most max_in_flight requests running at
+    any time. A caller that stops iterating early cancels the pages that have not been requested yet.
+
+    Args:
+        fetch_page: Requests the page at an offset, given the offset and the page size. Must return the items and the
+            total.
+        page_size: How many items to request per page.
+        max_in_flight: The maximum amount of page requests that can be running at once.
+
+    Yields:
+        dict: The items, in the same format as described on the spotify API
+    """
+
+    def request_page(offset: int) -> asyncio.Future:
+        return asyncio.ensure_future(fetch_page(offset, page_size))
+
+    first_page = await request_page(0)
+    for item in first_page["items"]:
+        yield item
+
+    offsets = iter(range(page_size, first_page["total"], page_size))
+    in_flight = deque(request_page(offset) for offset in islice(offsets, max_in_flight))
+
+    LOG.debug("Loading %s items, %s pages at a time", first_page["total"], max_in_flight)
+
+    try:
+        while in_flight:
+            page = await in_flight.popleft()
+
+            # Keep the window full before handing the items back, so the caller's work overlaps with the requests
+            for offset in islice(offsets, 1):
+                in_flight.append(request_page(offset))
+
+            for item in page["items"]:
+                yield item
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_playlist_tracks(spotify_client: AsyncSpotify,
+                         playlist_id: str,
+                         fields: str = "items(track(id,uri)),total",
+                         max_in_flight: int = 8) -> AsyncIterator[dict]:
+    """Yields every item of a playlist in order, see iter_pages.
+
+    Args:
+        spotify_client: A client that can be used for making Spotify API calls.
+        playlist_id: The ID of the playlist to load.
+        fields: The fields filter passed on to the Spotify API. Must include total.
+        max_in_flight: The maximum amount of page requests that can be running at once.
+
+    Returns:
+        AsyncIterator[dict]: The playlist items, in the same format as described on the spotify API
+    """
+
+    return iter_pages(
+        lambda offset, limit: spotify_client.playlist_tracks(playlist_id, fields=fields, offset=offset, limit=limit),
+        PAGE_SIZE, max_in_flight)
+
+
+def iter_saved_tracks(spotify_client: AsyncSpotify, max_in_flight: int = 8) -> AsyncIterator[dict]:
+    """Yields every saved track of the user, newest first, see iter_pages.
+
+    Args:
+        spotify_client: A client that can be used for making Spotify API calls.
+        max_in_flight: The maximum amount of page requests that can be running at once.
+
+    Returns:
+        AsyncIterator[dict]: The saved tracks, in the same format as described on the spotify API
+    """
+
+    return iter_pages(lambda offset, limit: spotify_client.current_user_saved_tracks(limit=limit, offset=offset),
+                      SAVED_TRACKS_PAGE_SIZE, max_in_flight)
@@ -0,0 +1,174 @@
+"""Contains the playlist picker, which lists every playlist of the user for choosing the one to run on, and resolves a
+playlist given on the command line without asking"""
+
+import logging
+import re
+import time
+from typing import Callable, List, Optional
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playlist_loader import iter_pages
+from spotify_playlist_additions.state import StateStore
+
+LOG = logging.getLogger(__name__)
+
+# The most playlists the playlists endpoint returns per page
+PAGE_SIZE = 50
+
+# How many seconds the listing is reused for before it is downloaded again
+LISTING_MAX_AGE = 24 * 3600
+
+# Matches a bare playlist ID, a spotify:playlist: URI and an open.spotify.com link
+_PLAYLIST_REFERENCE = re.compile(r"^(?:spotify:playlist:|https?://open\.spotify\.com/playlist/)?([0-9A-Za-z]{22})"
+                                 r"(?:\?.*)?$")
+
+
+def parse_playlist_id(reference: str) -> Optional[str]:
+    """Reads the ID of a playlist from an ID, URI or link.
+
+    Args:
+        reference: The ID, URI or link.
+
+    Returns:
+        Optional[str]: The ID, or None if the reference is none of them, such as the name of a playlist.
+    """
+
+    match = _PLAYLIST_REFERENCE.match(reference.strip())
+    return match.group(1) if match else None
+
+
+def find_playlist(playlists: List[dict], reference: str) -> Optional[dict]:
+    """Finds a playlist in a listing by its ID, URI, link or name. Names are compared without case.
+
+    Args:
+        playlists: The listing.
+        reference: The ID, URI, link or name.
+
+    Returns:
+        Optional[dict]: The playlist, or None if the listing does not have it.
+    """
+
+    playlist_id = parse_playlist_id(reference)
+    name = reference.strip().casefold()
+    for playlist in playlists:
+        if playlist["id"] == playlist_id or playlist["name"].casefold() == name:
+            return playlist
+    return None
+
+
+def cached_playlists(state_store: Optional[StateStore], max_age: float = LISTING_MAX_AGE) -> Optional[List[dict]]:
+    """The listing saved by list_playlists, if it is recent enough.
+
+    Args:
+        state_store: Where the listing is kept.
+        max_age: How many seconds old the listing can be.
+
+    Returns:
+        Optional[List[dict]]: The playlists, or None if there is no recent listing.
+    """
+
+    listing = state_store.get("playlist_listing") if state_store else None
+    if not listing or time.time() - listing["listed_at"] > max_age:
+        return None
+    return listing["playlists"]
+
+
+async def list_playlists(spotify_client: AsyncSpotify,
+                         state_store: StateStore = None,
+                         on_playlist: Callable[[int, dict], None] = None,
+                         max_in_flight: int = 8) -> List[dict]:
+    """Downloads every playlist of the user, requesting the pages after the first concurrently, and saves the listing
+    for cached_playlists.
+
+    Args:
+        spotify_client: A client that can be used for making Spotify API calls.
+        state_store: Where to save the listing. Defaults to not saving it.
+        on_playlist: Called with the position and playlist of each playlist as soon as its page arrives.
+        max_in_flight: The maximum amount of page requests that can be running at once.
+
+    Returns:
+        List[dict]: The id, name and snapshot_id of every playlist, in the order Spotify lists them.
+    """
+
+    playlists = []
+    async for playlist in iter_pages(
+            lambda offset, limit: spotify_client.current_user_playlists(limit=limit, offset=offset), PAGE_SIZE,
+            max_in_flight):
+        if not playlist:
+            continue
+        playlist = {"id": playlist["id"], "name": playlist["name"], "snapshot_id": playlist["snapshot_id"]}
+        if on_playlist:
+            on_playlist(len(playlists), playlist)
+        playlists.append(playlist)
+
+    if state_store:
+        state_store.set("playlist_listing", {"listed_at": time.time(), "playlists": playlists})
+    return playlists
+
+
+async def choose_playlist(spotify_client: AsyncSpotify,
+                          state_store: StateStore = None,
+                          refresh: bool = False,
+                          prompt: Callable[[str], str] = input) -> dict:
+    """Lets the user choose a playlist by its number or name. The playlists are printed as they arrive, from the saved
+    listing if it is recent enough.
+
+    Args:
+        spotify_client: A client that can be used for making Spotify API calls.
+        state_store: Where the listing is cached.
+        refresh: Whether to download the listing even if a recent one is saved.
+        prompt: Asks the user for their choice.
+
+    Returns:
+        dict: The id, name and snapshot_id of the chosen playlist.
+    """
+
+    def show(position: int, playlist: dict) -> None:
+        print("%s: %s" % (position, playlist["name"]))
+
+    print("Select the playlist you want to use")
+    playlists = None if refresh else cached_playlists(state_store)
+    if playlists is None:
+        playlists = await list_playlists(spotify_client, state_store, show)
+    else:
+        for position, playlist in enumerate(playlists):
+            show(position, playlist)
+
+    while True:
+        choice = prompt("Select a number or name: ").strip()
+        if choice.isdigit() and int(choice) < len(playlists):
+            return playlists[int(choice)]
+        playlist = find_playlist(playlists, choice)
+        if playlist:
+            return playlist
+        print("No playlist matches %r" % choice)
+
+
+async def resolve_playlist(spotify_client: AsyncSpotify, reference: str, state_store: StateStore = None) -> dict:
+    """Finds the playlist given on the command line without asking. An ID, URI or link is used as it is, unless the
+    saved listing knows its name, and a name is looked up in the saved listing, or in a new one if it is not there.
+
+    Args:
+        spotify_client: A client that can be used for making Spotify API calls.
+        reference: The ID, URI, link or name of the playlist.
+        state_store: Where the listing is cached.
+
+    Raises:
+        ValueError: If no playlist of the user has that name.
+
+    Returns:
+        dict: The playlist. Only the id is known if the playlist was given by its ID and is not in the listing.
+    """
+
+    playlist = find_playlist(cached_playlists(state_store) or [], reference)
+    if playlist:
+        return playlist
+
+    playlist_id = parse_playlist_id(reference)
+    if playlist_id:
+        return {"id": playlist_id}
+
+    playlist = find_playlist(await list_playlists(spotify_client, state_store), reference)
+    if not playlist:
+        raise ValueError("You have no playlist named %r" % reference)
+    return playlist
@@ -1,30 +1,69 @@
 """Contains the abstract interface for a playlist addon"""
 
 from abc import ABC, abstractmethod
-from typing import Any
-from spotipy import Spotify
+from typing import Any, List, Optional
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.events import DROP_OLDEST
+from spotify_playlist_additions.fingerprints import FingerprintIndex
+from spotify_playlist_additions.listening_log import ListeningLog
+from spotify_playlist_additions.metadata import MetadataService
+from spotify_playlist_additions.mutations import PlaylistMutationQueue
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.playlist_index import PlaylistIndex
 
 
 class AbstractPlaylist(ABC):
     """An abstract class that a new playlist can inherit callback functions
     from. Each frame, any of these may be invoked if the required state is
     found.
+
+    Callbacks are invoked one at a time and in the order the events were
+    detected, from a queue that belongs to this playlist alone. If the queue
+    fills up because the callbacks are too slow, overflow_policy decides
+    whether the oldest queued event or the newest one is dropped.
+
+    Callbacks are given a compact Track. Playlists that need more of the
+    track than it holds can look the full track up with raw_track when they
+    need it, or set wants_raw_track to keep the payload of the currently
+    playing endpoint on every Track as Track.raw instead. Anything else, such
+    as the genres of an artist or the audio features of a track, should be
+    looked up through metadata, which batches and caches the lookups of every
+    playlist of the user.
     """
-    def __init__(self, spotify_client: Spotify, playlist: dict, user_id: str):
+
+    queue_size = 100
+    overflow_policy = DROP_OLDEST
+    wants_raw_track = False
+
+    def __init__(self, spotify_client: AsyncSpotify, playlist: dict, user_id: str, playlist_index: PlaylistIndex,
+                 mutations: PlaylistMutationQueue, fingerprint_index: FingerprintIndex = None,
+                 listening_log: ListeningLog = None):
         """The most basic initializer that can be implemented. Any playlist
-        implementation needs take in a Spotify client from spotipy and a playlist
+        implementation needs take in a Spotify client and a playlist
 
         Args:
             spotify_client: A client that can be used for making Spotify API
-                calls.
+                calls. Calls must be awaited, they do not block the event loop.
             playlist: The playlist that this runtime has been configured to run on. In the same format as described on
                 the spotify API
             user_id: The user ID that has connected to this runtime.
+            playlist_index: The membership index of the playlist, shared between every addon.
+            mutations: The queue that changes to the playlist should be made through. Keeps the playlist index up to
+                date and sends the changes to Spotify in batches.
+            fingerprint_index: The fingerprints of every track in the library
+                of the user, if the engine keeps them.
+            listening_log: How often each track has been skipped and fully
+                listened to lately, if the engine logs it. The event being
+                handled has already been counted.
         """
 
         self._spotify_client = spotify_client
         self._playlist = playlist
         self._user_id = user_id
+        self._playlist_index = playlist_index
+        self._mutations = mutations
+        self._fingerprint_index = fingerprint_index
+        self._listening_log = listening_log
 
     @property
     def scope(self) -> str:
@@ -37,6 +76,37 @@ class AbstractPlaylist(ABC):
 
         return ""
 
+    @property
+    def metadata(self) -> MetadataService:
+        """Looks tracks, artists, albums and audio features up by ID in
+        batches, and caches them for every playlist of the user.
+
+        Returns:
+            MetadataService: The metadata service.
+        """
+
+        return self._spotify_client.metadata
+
+    async def raw_track(self, track: Track) -> Optional[dict]:
+        """Gives the full track, in the exact format that Spotify defines in
+        their API. Taken from the payload it was parsed from if that was kept,
+        otherwise looked up only now, so tracks that no callback needs in full
+        never cost a request.
+
+        Args:
+            track: The track.
+
+        Returns:
+            Optional[dict]: The track, or None for local files, which can't be
+                looked up.
+        """
+
+        if track.raw is not None:
+            return track.raw["item"]
+        if not track.id:
+            return None
+        return await self.metadata.track(track.id)
+
     @abstractmethod
     async def start(self) -> Any:
         """Method called at the start of runtime. Only called once.
@@ -47,22 +117,38 @@ class AbstractPlaylist(ABC):
         """Method called at the end of runtime. Only called once
         """
 
+    async def handle_track_start(self, track: Track) -> Any:
+        """Called on each configured playlist when the main loop detects that
+        a new track has started playing. Does nothing by default.
+
+        Args:
+            track: The track that started.
+        """
+
+    async def handle_backfilled_tracks(self, tracks: List[Track]) -> Any:
+        """Called on each configured playlist with the fully listened tracks
+        that the main loop missed, found in the listening history of the
+        user when the engine runs with a backfill. They are not handed to
+        handle_fully_listened_track. Does nothing by default.
+
+        Args:
+            tracks: The fully listened tracks, oldest first.
+        """
+
     @abstractmethod
-    async def handle_skipped_track(self, track: dict) -> Any:
+    async def handle_skipped_track(self, track: Track) -> Any:
         """Called on each configured playlist when the main loop detects a
         skipped track.
 
         Args:
-            track: The skipped track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API.
+            track: The skipped track.
         """
 
     @abstractmethod
-    async def handle_fully_listened_track(self, track: dict) -> Any:
+    async def handle_fully_listened_track(self, track: Track) -> Any:
         """Called on each configured playlist when the main loop detects a
         fully listened track (to within a degree of uncertainty)
 
         Args:
-            track: The fully listened track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API
+            track: The fully listened track.
         """
@@ -3,8 +3,9 @@ Contains the child of an abstract playlist addon for an automatic song adding pl
 """
 
 import logging
-from typing import Any
+from typing import Any, List
 
+from spotify_playlist_additions.playback import Track
 from spotify_playlist_additions.playlists.abstract import AbstractPlaylist
 
 LOG = logging.getLogger(__name__)
@@ -27,61 +28,58 @@ class AutoAddPlaylist(AbstractPlaylist):
 
         pass
 
-    async def handle_skipped_track(self, track: dict):
+    async def handle_skipped_track(self, track: Track):
         """Called on each configured playlist when the main loop detects a
         fully listened track (to within a degree of uncertainty)
 
         Args:
-            track: The fully listened track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API
+            track: The fully listened track.
         """
         pass
 
-    async def handle_fully_listened_track(self, track: dict):
+    async def handle_fully_listened_track(self, track: Track):
         """Ensures that the playlist doesnt contain the track, then adds it to the playlist
 
         Args:
-            track: The skipped track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API.
+            track: The skipped track.
         """
 
         if not self._playlist_contains_track(track):
-            LOG.info("Added %s to playlist", track["item"]["name"])
-            self._spotify_client.user_playlist_add_tracks(
-                self._user_id, self._playlist["id"], [track["item"]["id"]])
+            LOG.info("Added %s to playlist", track.name)
+            self._mutations.add(track)
+            if self._fingerprint_index is not None:
+                self._fingerprint_index.add(track)
 
-    def _playlist_contains_track(self, track: dict) -> bool:
+    async def handle_backfilled_tracks(self, tracks: List[Track]):
+        """Adds every track the playlist doesnt contain yet. The mutation queue sends them to Spotify together.
+
+        Args:
+            tracks: The fully listened tracks.
         """
-        Searches the playlist in O(n) time for the track name.
+
+        for track in tracks:
+            await self.handle_fully_listened_track(track)
+
+    def _playlist_contains_track(self, track: Track) -> bool:
+        """
+        Looks the track up in the shared playlist index in O(1) time, and in the fingerprint index of the library if
+        the engine keeps one, which also recognises other releases of the same recording.
 
         Args:
-            track: The track that is being looked for. In the format of a spotify API track.
+            track: The track that is being looked for.
 
         Returns:
             bool: Whether the playlist contains the track.
         """
 
-        # TODO: There is almost certainly a better way to do this. It would be best to have this calculated only once
-        # instead of every playlist addon doing it.
-
-        LOG.info("Performing a search for %s", track["item"]["name"])
-
-        length = 100
-        offset = 0
-        while length == 100:
-            playlist_tracks = self._spotify_client.playlist_tracks(
-                self._playlist["id"],
-                fields="items(track(name))",
-                offset=offset)
-            for playlist_track in playlist_tracks["items"]:
-                if playlist_track["track"]["name"] == track["item"]["name"]:
-                    LOG.info("Playlist already contains %s",
-                             track["item"]["name"])
-                    return True
+        if self._playlist_index.contains(track):
+            LOG.info("Playlist already contains %s", track.name)
+            return True
 
-            length = len(playlist_tracks["items"])
-            offset += length
+        if self._fingerprint_index is not None and self._fingerprint_index.contains(track):
+            LOG.info("Library already contains a release of %s", track.name)
+            return True
 
-        LOG.info("Did not find %s in playlist. Adding", track["item"]["name"])
+        LOG.info("Did not find %s in playlist. Adding", track.name)
 
         return False
@@ -6,6 +6,7 @@ were detected to be skipped
 import logging
 from typing import Any
 
+from spotify_playlist_additions.playback import Track
 from spotify_playlist_additions.playlists.abstract import AbstractPlaylist
 
 LOG = logging.getLogger(__name__)
@@ -13,9 +14,13 @@ LOG = logging.getLogger(__name__)
 
 class AutoRemovePlaylist(AbstractPlaylist):
     """A playlist addon that removes songs that were detected to be skipped.
+
+    When the engine keeps a listening log, a song is only removed once its skips, each counting half as much every
+    half life of the log, add up to skip_threshold. Otherwise it is removed on its first skip.
     """
 
     scope = "user-read-currently-playing playlist-modify-public"
+    skip_threshold = 3
 
     async def start(self) -> Any:
         """Method called at the start of runtime. Only called once.
@@ -27,26 +32,34 @@ class AutoRemovePlaylist(AbstractPlaylist):
         """
         pass
 
-    async def handle_skipped_track(self, track: dict) -> Any:
+    async def handle_skipped_track(self, track: Track) -> Any:
         """
-        Removes the track from the given playlist
+        Removes the track from the given playlist, if the playlist contains it
 
         Args:
-            track: The skipped track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API.
+            track: The skipped track.
         """
 
-        LOG.info("Removing %s from playlist", track["item"]["name"])
-        self._spotify_client.user_playlist_remove_all_occurrences_of_tracks(
-            self._user_id, self._playlist["id"], [track["item"]["id"]])
+        if not self._playlist_index.contains(track):
+            LOG.debug("Playlist does not contain %s, nothing to remove", track.name)
+            return
+
+        if self._listening_log is not None and track.id:
+            # Rounded, so that skips a few hours apart still add up to a whole number
+            skips = round(self._listening_log.skips(track.id), 1)
+            if skips < self.skip_threshold:
+                LOG.info("Keeping %s, skipped %.1f of %s times lately", track.name, skips, self.skip_threshold)
+                return
+
+        LOG.info("Removing %s from playlist", track.name)
+        self._mutations.remove(track)
 
-    async def handle_fully_listened_track(self, track: dict) -> Any:
+    async def handle_fully_listened_track(self, track: Track) -> Any:
         """Called on each configured playlist when the main loop detects a
         fully listened track (to within a degree of uncertainty)
 
         Args:
-            track: The fully listened track retrieved from the Spotify API.
-                Retains the exact format that Spotify defines in their API
+            track: The fully listened track.
         """
 
         pass
@@ -0,0 +1,266 @@
+"""Contains the profiler, which records why the poll loop falls behind its schedule into files that standard tools
+open. Only imported when profiling is turned on, so the engine pays nothing for it otherwise."""
+
+import asyncio
+import cProfile
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+import types
+from concurrent.futures import Executor
+from typing import Dict, Iterable, Optional, Set
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_FRAMES = 50
+DEFAULT_SAMPLE_EVERY = 1000
+DEFAULT_SLOW_CALLBACK_SECONDS = 0.1
+DEFAULT_SNAPSHOT_INTERVAL = 300
+
+# How many frames of the traceback of each allocation are kept, enough to find the addon behind it
+_TRACEBACK_FRAMES = 25
+_TOP_LINES = 25
+
+# Infrastructure that every session reaches but none of them owns, never followed when measuring a session
+_NOT_OWNED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType, types.FrameType,
+              asyncio.AbstractEventLoop, Executor, logging.Logger)
+
+
+def retained_sizes(roots: Dict[str, object]) -> Dict[str, int]:
+    """Measures the memory held by each of a set of objects: the size of every object reachable from it and from none
+    of the others. What is reachable from several of them is reported as "shared". Modules, classes, functions, event
+    loops, executors and loggers are not followed.
+
+    Args:
+        roots: The objects, by name.
+
+    Returns:
+        Dict[str, int]: The bytes each object holds, by name, and the bytes they share.
+    """
+
+    sizes: Dict[int, int] = {}
+    owners: Dict[int, str] = {}
+    for name, root in roots.items():
+        seen: Set[int] = set()
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen or isinstance(obj, _NOT_OWNED):
+                continue
+            seen.add(id(obj))
+            if id(obj) not in sizes:
+                sizes[id(obj)] = sys.getsizeof(obj, 0)
+            owners[id(obj)] = name if owners.get(id(obj), name) == name else "shared"
+            stack.extend(gc.get_referents(obj))
+
+    retained = dict.fromkeys(list(roots) + ["shared"], 0)
+    for obj_id, owner in owners.items():
+        retained[owner] += sizes[obj_id]
+    return retained
+
+
+class Profiler:
+    """Profiles the poll loops of every engine it is given to, writing what it finds to a directory:
+
+    - slow_callbacks.log: every callback or task step that blocked the event loop for longer than
+      slow_callback_seconds, from the debug mode of asyncio.
+    - frames-<first>-<last>.prof: a cProfile capture of frames consecutive poll frames out of every sample_every, for
+      python -m pstats or snakeviz.
+    - memory-<n>.snapshot and memory-<n>.txt: a tracemalloc snapshot every snapshot_interval seconds, for
+      tracemalloc.Snapshot.load, and a report of the lines whose allocations grew the most since the previous one, the
+      allocations made by the code of each addon and the memory each session and addon holds on to.
+
+    Every part of it slows the event loop down noticeably, tracemalloc most of all, so it is meant to be turned on
+    while looking into a problem rather than left on.
+    """
+    def __init__(self,
+                 directory: str,
+                 frames: int = DEFAULT_FRAMES,
+                 sample_every: int = DEFAULT_SAMPLE_EVERY,
+                 slow_callback_seconds: float = DEFAULT_SLOW_CALLBACK_SECONDS,
+                 snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL):
+        """Initializer for a Profiler. Does nothing until start is called.
+
+        Args:
+            directory: Where to write the results. Created if it does not exist.
+            frames: How many consecutive frames each cProfile capture covers.
+            sample_every: How many frames apart the captures start. The first capture starts with the first frame.
+            slow_callback_seconds: How long a callback can block the event loop before it is logged.
+            snapshot_interval: How many seconds apart the tracemalloc snapshots are taken. None takes none.
+        """
+
+        self._directory = directory
+        self._frames = frames
+        self._sample_every = max(sample_every, frames)
+        self._slow_callback_seconds = slow_callback_seconds
+        self._snapshot_interval = snapshot_interval
+
+        self._sessions: Dict[str, "SpotifyPlaylistEngine"] = {}
+        self._frame = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._capture_started_at_frame = 0
+        self._snapshots = 0
+        self._previous_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_task: Optional[asyncio.Future] = None
+        self._log_handler: Optional[logging.Handler] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop = None) -> None:
+        """Turns on slow callback detection on the event loop and starts taking snapshots. The captures start with the
+        next frame.
+
+        Args:
+            loop: The event loop the engines run on. Defaults to the current one.
+        """
+
+        os.makedirs(self._directory, exist_ok=True)
+        self._loop = loop or asyncio.get_event_loop()
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self._slow_callback_seconds
+
+        # asyncio warns about slow callbacks through its own logger
+        self._log_handler = logging.FileHandler(os.path.join(self._directory, "slow_callbacks.log"))
+        self._log_handler.setLevel(logging.WARNING)
+        self._log_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logging.getLogger("asyncio").addHandler(self._log_handler)
+
+        if self._snapshot_interval is not None:
+            tracemalloc.start(_TRACEBACK_FRAMES)
+            self._snapshot_task = self._loop.create_task(self._snapshot_periodically())
+        LOG.info("Profiling into %s", self._directory)
+
+    async def stop(self) -> None:
+        """Writes the capture that is running and a last snapshot, and turns everything back off
+        """
+
+        if self._profile is not None:
+            self._finish_capture()
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+            self.snapshot()
+            tracemalloc.stop()
+        if self._log_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._log_handler)
+            self._log_handler.close()
+            self._log_handler = None
+        if self._loop is not None:
+            self._loop.set_debug(False)
+            self._loop = None
+
+    def watch(self, name: str, engine: "SpotifyPlaylistEngine") -> None:
+        """Includes a session in the memory reports.
+
+        Args:
+            name: The name of the session.
+            engine: The engine of the session.
+        """
+
+        self._sessions[name] = engine
+
+    def forget(self, name: str) -> None:
+        """Leaves a session that has stopped out of the memory reports.
+
+        Args:
+            name: The name of the session.
+        """
+
+        self._sessions.pop(name, None)
+
+    def frame_started(self) -> None:
+        """Called by the poll loop of an engine as it starts a frame. Starts a capture on every sample_every-th frame.
+        """
+
+        if self._loop is None:
+            return
+        if self._profile is None and self._frame % self._sample_every == 0:
+            self._capture_started_at_frame = self._frame
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._frame += 1
+
+    def frame_finished(self) -> None:
+        """Called by the poll loop of an engine once a frame is done, before it sleeps. Ends a capture once it covers
+        frames frames.
+        """
+
+        if self._profile is not None and self._frame - self._capture_started_at_frame >= self._frames:
+            self._finish_capture()
+
+    def snapshot(self) -> None:
+        """Takes a tracemalloc snapshot and writes it, along with a report of how memory grew since the previous one
+        """
+
+        self._snapshots += 1
+        path = os.path.join(self._directory, "memory-%d" % self._snapshots)
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(path + ".snapshot")
+
+        lines = ["Traced memory: %.1f KiB" % (tracemalloc.get_traced_memory()[0] / 1024), ""]
+        if self._previous_snapshot is None:
+            lines.append("Largest allocations by line:")
+            lines.extend(str(statistic) for statistic in snapshot.statistics("lineno")[:_TOP_LINES])
+        else:
+            lines.append("Largest growth by line since memory-%d:" % (self._snapshots - 1))
+            lines.extend(str(difference) for difference in snapshot.compare_to(self._previous_snapshot,
+                                                                               "lineno")[:_TOP_LINES])
+
+        lines.extend(["", "Allocated by the code of each addon:"])
+        lines.extend(self._report_sizes(self._allocated_by_addons(snapshot)))
+
+        lines.extend(["", "Held by each session:"])
+        lines.extend(self._report_sizes(retained_sizes(self._sessions)))
+        lines.extend(["", "Held by each addon:"])
+        lines.extend(self._report_sizes(retained_sizes({
+            "%s %s %s" % (session, type(addon).__name__, index): addon
+            for session, engine in self._sessions.items() for index, addon in enumerate(engine.addons)})))
+
+        with open(path + ".txt", "w") as report:
+            report.write("\n".join(lines) + "\n")
+        self._previous_snapshot = snapshot
+        LOG.info("Wrote memory snapshot %s", path)
+
+    def _allocated_by_addons(self, snapshot: tracemalloc.Snapshot) -> Dict[str, int]:
+        """Adds up the allocations that have the module of an addon class anywhere in their traceback, by class name.
+
+        Tracebacks are grouped first and matched by file name, rather than with tracemalloc.Filter, which matches every
+        frame of every trace with fnmatch and takes minutes on a large snapshot while tracemalloc is tracing itself.
+        """
+
+        addon_files = {}
+        for engine in self._sessions.values():
+            for addon in engine.addons:
+                addon_file = getattr(sys.modules.get(type(addon).__module__), "__file__", None)
+                if addon_file:
+                    addon_files[addon_file] = type(addon).__name__
+
+        allocated = dict.fromkeys(addon_files.values(), 0)
+        for statistic in snapshot.statistics("traceback"):
+            filenames = {frame.filename for frame in statistic.traceback}
+            for addon_file, name in addon_files.items():
+                if addon_file in filenames:
+                    allocated[name] += statistic.size
+        return allocated
+
+    async def _snapshot_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._snapshot_interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                LOG.error("Failed to take a memory snapshot: %s", e)
+
+    def _finish_capture(self) -> None:
+        self._profile.disable()
+        path = os.path.join(self._directory, "frames-%d-%d.prof" % (self._capture_started_at_frame, self._frame - 1))
+        self._profile.dump_stats(path)
+        self._profile = None
+        LOG.info("Wrote a profile of %s frames to %s", self._frame - self._capture_started_at_frame, path)
+
+    @staticmethod
+    def _report_sizes(sizes: Dict[str, int]) -> Iterable[str]:
+        return ["%s: %.1f KiB" % (name, size / 1024) for name, size in sorted(sizes.items(), key=lambda item: -item[1])]
+
@@ -0,0 +1,154 @@
+"""Contains the building blocks that keep the request rate to the Spotify API bounded, even while it is failing"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while the circuit breaker is open"""
+    def __init__(self, retry_after: float):
+        """Initializer for a CircuitOpenError.
+
+        Args:
+            retry_after: How many seconds until requests are allowed again.
+        """
+
+        super().__init__("Spotify API is unavailable, retrying in %.1f seconds" % retry_after)
+        self.retry_after = retry_after
+
+
+def jittered_backoff(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    """Calculates an exponential backoff with full jitter, so that many clients failing at once don't retry in step.
+
+    Args:
+        attempt: How many attempts have failed so far, starting at 0.
+        base: The backoff of the first attempt in seconds.
+        cap: The longest backoff in seconds.
+
+    Returns:
+        float: How many seconds to wait before the next attempt.
+    """
+
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    """A token bucket rate limiter. Allows bursts of up to capacity requests, and rate requests per second on average.
+    Can also be paused entirely, which is how a Retry-After from the Spotify API is honoured by every caller at once.
+    """
+    def __init__(self, rate: float = 10, capacity: float = 20):
+        """Initializer for a TokenBucket.
+
+        Args:
+            rate: The amount of requests per second that are allowed on average.
+            capacity: The largest burst of requests that is allowed.
+        """
+
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def set_rate(self, rate: float, capacity: float) -> None:
+        """Changes the limit. Tokens beyond the new capacity are dropped straight away.
+
+        Args:
+            rate: The amount of requests per second that are allowed on average.
+            capacity: The largest burst of requests that is allowed.
+        """
+
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = min(self._tokens, capacity)
+
+    def pause(self, seconds: float) -> None:
+        """Stops every request from being made for a while.
+
+        Args:
+            seconds: How long to pause for.
+        """
+
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Waits until a request is allowed to be made
+        """
+
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class CircuitBreaker:
+    """Stops requests from being made once too many have failed in a row. After reset_timeout seconds requests are let
+    through again; the first success closes the breaker, while another failure opens it for another reset_timeout.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """Initializer for a CircuitBreaker.
+
+        Args:
+            failure_threshold: How many failures in a row open the breaker.
+            reset_timeout: How many seconds the breaker stays open before requests are allowed again.
+        """
+
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are currently being stopped
+
+        Returns:
+            bool: Whether the breaker is open.
+        """
+
+        return self._opened_at is not None and time.monotonic() - self._opened_at < self._reset_timeout
+
+    def check(self) -> None:
+        """Checks whether a request is allowed to be made.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+
+        if self.is_open:
+            raise CircuitOpenError(self._opened_at + self._reset_timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        """Closes the breaker
+        """
+
+        if self._opened_at is not None:
+            LOG.info("Spotify API is available again")
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        """Counts a failure, opening the breaker if there have been too many in a row
+        """
+
+        self._failures += 1
+        if self._failures >= self._failure_threshold:
+            if not self.is_open:
+                LOG.warning("Spotify API has failed %s times in a row, pausing requests for %s seconds",
+                            self._failures, self._reset_timeout)
+            self._opened_at = time.monotonic()
@@ -0,0 +1,101 @@
+"""Contains the poll scheduler, which decides how long the main loop sleeps between frames"""
+
+import logging
+from typing import Optional
+
+from spotify_playlist_additions.playback import PlaybackState
+
+LOG = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """Works out when the next frame should be polled from the remaining duration of the track that is playing.
+
+    Detection of a fully listened track needs exactly one frame that lands in the last min_wait milliseconds of the
+    track, and a skip is caught by whichever frame first sees the new track. So instead of polling at a fixed rate, the
+    scheduler sleeps through the middle of a track (never longer than max_wait, which bounds how late a skip can be
+    detected). Once the end of the track is approach_window away it aims the next frame at the middle of the last
+    min_wait milliseconds, allowing for how long requests have been taking. It backs off exponentially from idle_wait
+    up to max_idle_wait while nothing is playing, and while paused never sleeps past the frame the end of the paused
+    track would need if playback were resumed straight away.
+
+    A track that is skipped less than max_wait after it started can go unseen when several tracks are skipped in a
+    row, so lower max_wait where that matters.
+    """
+    def __init__(self,
+                 min_wait: float = 200,
+                 max_wait: float = 5000,
+                 approach_window: float = 2000,
+                 idle_wait: float = 1000,
+                 max_idle_wait: float = 30000):
+        """Initializer for a PollScheduler. All durations are in milliseconds.
+
+        Args:
+            min_wait: The wait between frames near the end of a track. The end of track buffer of the engine.
+            max_wait: The longest wait between frames while a track is playing.
+            approach_window: How long before the end of a track to start polling every min_wait.
+            idle_wait: The first wait while playback is paused or nothing is playing.
+            max_idle_wait: The longest wait while playback is paused or nothing is playing.
+        """
+
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.approach_window = approach_window
+        self.idle_wait = idle_wait
+        self.max_idle_wait = max_idle_wait
+
+        self._idle_frames = 0
+        self._latency = 0.0
+
+    def observe_latency(self, latency: float) -> None:
+        """Records how long a request for the currently playing track took, so that frames near the end of a track can
+        be sent early enough to land where they are aimed.
+
+        Args:
+            latency: How long the request took in milliseconds.
+        """
+
+        self._latency += (latency - self._latency) / 4
+
+    def next_wait(self, track: Optional[PlaybackState]) -> float:
+        """Calculates how long to wait before the next frame.
+
+        Args:
+            track: The playback state of this frame, or None if nothing is playing.
+
+        Returns:
+            float: The amount of milliseconds to wait.
+        """
+
+        if not track or not track.is_playing:
+            wait = min(self.idle_wait * 2**self._idle_frames, self.max_idle_wait)
+            if wait < self.max_idle_wait:
+                self._idle_frames += 1
+            if track:
+                # Playback can be resumed at any moment, after which the track ends no sooner than it would have if it
+                # had kept playing, so the backoff must not sleep past the frame that is needed at the end of it
+                wait = min(wait, self._wait_for(track.remaining_ms, self.max_idle_wait))
+            return wait
+
+        self._idle_frames = 0
+        return self._wait_for(track.remaining_ms, self.max_wait)
+
+    def _wait_for(self, remaining_duration: float, longest_wait: float) -> float:
+        """Calculates how long to wait so that a frame lands in the end of track buffer.
+
+        Args:
+            remaining_duration: The remaining duration of the track in milliseconds.
+            longest_wait: The longest wait while the end of the track is still outside the approach window.
+
+        Returns:
+            float: The amount of milliseconds to wait.
+        """
+
+        # Already at the end, the next frame has to see the track that comes after this one
+        if remaining_duration < self.min_wait:
+            return self.min_wait
+
+        if remaining_duration <= self.approach_window:
+            return max(0, remaining_duration - self.min_wait / 2 - self._latency)
+
+        return max(self.min_wait, min(longest_wait, remaining_duration - self.approach_window))
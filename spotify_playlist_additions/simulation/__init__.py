@@ -0,0 +1 @@
+"""A local stand-in for the Spotify Web API and a harness that replays listening sessions against the engine"""
@@ -0,0 +1,50 @@
+"""Replays a listening trace against the engine and prints how it did. Run with python -m
+spotify_playlist_additions.simulation
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from spotify_playlist_additions.simulation.harness import run_host_simulation, run_simulation, scaled_scheduler
+from spotify_playlist_additions.simulation.trace import ListeningTrace, synthetic_trace
+
+
+def main() -> int:
+    """Console entry point for the simulation."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trace", help="replay a trace saved as JSON instead of generating one")
+    parser.add_argument("--save-trace", help="save the replayed trace as JSON")
+    parser.add_argument("--plays", type=int, default=100, help="length of the generated trace")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated trace")
+    parser.add_argument("--speed", type=float, default=20, help="how many times faster than real time to replay")
+    parser.add_argument("--search-wait", type=float, default=200, help="search_wait of the engine")
+    parser.add_argument("--fixed", action="store_true", help="poll every search_wait instead of adaptively")
+    parser.add_argument("--users",
+                        type=int,
+                        help="replay the trace for this many users in one EngineHost and report what each one costs")
+    parser.add_argument("--verbose", action="store_true", help="show the engine's logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    trace = ListeningTrace.load(args.trace) if args.trace else synthetic_trace(args.plays, seed=args.seed)
+    if args.save_trace:
+        trace.dump(args.save_trace)
+
+    if args.users:
+        report = asyncio.get_event_loop().run_until_complete(
+            run_host_simulation(trace, args.users, args.speed, args.search_wait))
+        print(report)
+        return 0
+
+    scheduler = scaled_scheduler(args.speed, args.search_wait, args.fixed)
+    report = asyncio.get_event_loop().run_until_complete(
+        run_simulation(trace, args.speed, args.search_wait, scheduler))
+    print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())  # pragma: no cover
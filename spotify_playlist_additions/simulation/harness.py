@@ -0,0 +1,366 @@
+"""Contains the replay harness, which drives the real engine against the simulated Spotify API and scores it"""
+
+import asyncio
+import logging
+import multiprocessing
+import resource
+import statistics
+import time
+from collections import Counter
+from typing import Any, List, Tuple
+
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+
+from spotify_playlist_additions.async_client import AsyncSpotify, PollingSpotify
+from spotify_playlist_additions.host import EngineHost
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.playlists.abstract import AbstractPlaylist
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.playlists.autoremove import AutoRemovePlaylist
+from spotify_playlist_additions.rate_limit import TokenBucket
+from spotify_playlist_additions.scheduler import PollScheduler
+from spotify_playlist_additions.simulation.server import FakeSpotifyServer
+from spotify_playlist_additions.simulation.trace import FULLY_LISTENED, SKIPPED, ListeningTrace
+from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+
+LOG = logging.getLogger(__name__)
+
+SCOPE = "user-read-currently-playing playlist-modify-public"
+
+
+class _SimulatedOAuth(SpotifyOAuth):
+    """An OAuth manager that starts with an expired token, so that the first request refreshes it against the token
+    endpoint of the simulated API
+    """
+    def __init__(self, server_url: str):
+        self.OAUTH_TOKEN_URL = server_url + "/api/token"
+        super().__init__(client_id="simulated",
+                         client_secret="simulated",
+                         redirect_uri="http://localhost:8888/callback",
+                         scope=SCOPE,
+                         cache_handler=MemoryCacheHandler())
+        self.cache_handler.save_token_to_cache({
+            "access_token": "expired",
+            "token_type": "Bearer",
+            "refresh_token": "simulated-refresh-token",
+            "expires_at": 0,
+            "scope": self.scope,
+        })
+
+
+class _RecordingPlaylist(AbstractPlaylist):
+    """A playlist addon that records every event the engine detects, along with when it was detected"""
+
+    scope = ""
+    events: List[Tuple[str, str, float]] = []
+
+    async def start(self) -> Any:
+        pass
+
+    async def stop(self) -> Any:
+        pass
+
+    async def handle_skipped_track(self, track: Track) -> Any:
+        self.events.append((SKIPPED, track.id, time.monotonic()))
+
+    async def handle_fully_listened_track(self, track: Track) -> Any:
+        self.events.append((FULLY_LISTENED, track.id, time.monotonic()))
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile))]
+
+
+class SimulationReport:
+    """The outcome of replaying a trace against the engine"""
+    def __init__(self, expected: List[Tuple[str, str, int]], detected: List[Tuple[str, str, float]],
+                 server: FakeSpotifyServer):
+        """Initializer for a SimulationReport. Scores the detected events against the trace.
+
+        Args:
+            expected: The events of the trace, see ListeningTrace.expected_events
+            detected: The events recorded by the engine, with the monotonic time they were detected at.
+            server: The server that replayed the trace.
+        """
+
+        self.expected = len(expected)
+        self.detected = len(detected)
+        self.requests = server.requests
+        self.simulated_ms = server.trace.duration_ms
+
+        expected_counts = Counter((outcome, track_id) for outcome, track_id, _ in expected)
+        detected_counts = Counter((outcome, track_id) for outcome, track_id, _ in detected)
+        self.correct = sum((expected_counts & detected_counts).values())
+        self.missed = self.expected - self.correct
+        self.spurious = self.detected - self.correct
+
+        # How long after the end of a play the engine noticed, converted back to trace time
+        ended_at = {}
+        for outcome, track_id, end_ms in expected:
+            ended_at.setdefault((outcome, track_id), []).append(server.started_at + end_ms / server.speed / 1000)
+        self.detection_latencies_ms = []
+        for outcome, track_id, detected_at in detected:
+            ends = ended_at.get((outcome, track_id))
+            if ends:
+                self.detection_latencies_ms.append((detected_at - ends.pop(0)) * 1000 * server.speed)
+
+        poll_times = server.poll_times
+        self.poll_intervals_ms = [(later - earlier) * 1000 * server.speed
+                                  for earlier, later in zip(poll_times, poll_times[1:])]
+
+    @property
+    def accuracy(self) -> float:
+        """The share of events in the trace that were detected correctly
+
+        Returns:
+            float: The accuracy, between 0 and 1.
+        """
+
+        return self.correct / self.expected if self.expected else 1
+
+    @property
+    def requests_per_hour(self) -> float:
+        """How many requests were made per hour of simulated listening
+
+        Returns:
+            float: The request rate.
+        """
+
+        return sum(self.requests.values()) / (self.simulated_ms / 3600000)
+
+    def __str__(self) -> str:
+        polls = self.requests["GET /v1/me/player/currently-playing"]
+        lines = [
+            "Simulated listening:   %.1f hours" % (self.simulated_ms / 3600000),
+            "Events:                %s expected, %s detected" % (self.expected, self.detected),
+            "Correct:               %s (%.1f%%)" % (self.correct, self.accuracy * 100),
+            "Missed / spurious:     %s / %s" % (self.missed, self.spurious),
+            "Requests per hour:     %.0f (%.0f currently playing)" %
+            (self.requests_per_hour, polls / (self.simulated_ms / 3600000)),
+            "Detection latency:     mean %.0fms, p95 %.0fms" %
+            (statistics.mean(self.detection_latencies_ms or [0]), _percentile(self.detection_latencies_ms, 0.95)),
+            "Poll interval:         mean %.0fms, p95 %.0fms" %
+            (statistics.mean(self.poll_intervals_ms or [0]), _percentile(self.poll_intervals_ms, 0.95)),
+            "Requests:",
+        ]
+        lines.extend("    %6d %s" % (count, endpoint) for endpoint, count in sorted(self.requests.items()))
+        return "\n".join(lines)
+
+
+def scaled_scheduler(speed: float, search_wait: float = 200, fixed: bool = False) -> PollScheduler:
+    """Creates a scheduler with the default timings, sped up to match a replay.
+
+    Args:
+        speed: How many times faster than real time the trace is replayed.
+        search_wait: The search_wait of the engine, in trace milliseconds.
+        fixed: Whether to poll every search_wait regardless of playback, like the engine originally did.
+
+    Returns:
+        PollScheduler: The scheduler.
+    """
+
+    if fixed:
+        return PollScheduler(search_wait / speed, search_wait / speed, 0, search_wait / speed, search_wait / speed)
+    return PollScheduler(search_wait / speed, 5000 / speed, 2000 / speed, 1000 / speed, 30000 / speed)
+
+
+async def run_simulation(trace: ListeningTrace,
+                         speed: float = 20,
+                         search_wait: float = 200,
+                         scheduler: PollScheduler = None,
+                         playlist_tracks: List[dict] = None) -> SimulationReport:
+    """Replays a trace against a SpotifyPlaylistEngine, using the default addons, and scores what it detected.
+
+    Args:
+        trace: The listening session to replay.
+        speed: How many times faster than real time to replay the trace.
+        search_wait: The search_wait of the engine, in trace milliseconds.
+        scheduler: The scheduler the engine uses, with timings already sped up. Defaults to scaled_scheduler.
+        playlist_tracks: The tracks that the playlist starts out with.
+
+    Returns:
+        SimulationReport: How the engine did.
+    """
+
+    server = FakeSpotifyServer(trace, speed, playlist_tracks)
+    server.start()
+
+    spotify = PollingSpotify(auth_manager=_SimulatedOAuth(server.url), requests_session=AsyncSpotify.create_session())
+    spotify.prefix = server.url + "/v1/"
+    client = AsyncSpotify(spotify, rate_limiter=TokenBucket(rate=10 * speed, capacity=20 * speed))
+
+    recording_playlist = type("RecordingPlaylist", (_RecordingPlaylist, ), {"events": []})
+    engine = SpotifyPlaylistEngine(search_wait=search_wait / speed,
+                                   playlist=server.playlist,
+                                   scheduler=scheduler or scaled_scheduler(speed, search_wait),
+                                   spotify_client=client,
+                                   addons=[AutoAddPlaylist, AutoRemovePlaylist, recording_playlist])
+
+    engine_task = asyncio.ensure_future(engine.start())
+    try:
+        while server.started_at is None or server.elapsed_ms < trace.duration_ms + 10000:
+            if engine_task.done():
+                engine_task.result()
+            await asyncio.sleep(0.05)
+
+        await engine.stop()
+        await engine_task
+    finally:
+        engine_task.cancel()
+        server.stop()
+        client.close()
+
+    return SimulationReport(trace.expected_events(), recording_playlist.events, server)
+
+
+def _serve(trace: ListeningTrace, speed: float, connection) -> None:
+    """Runs a FakeSpotifyServer until asked to stop, in a process of its own.
+
+    Args:
+        trace: The listening session to replay.
+        speed: How many times faster than real time to replay the trace.
+        connection: Receives the URL of the server, then the requests it served once it is asked to stop.
+    """
+
+    server = FakeSpotifyServer(trace, speed)
+    server.start()
+    connection.send((server.url, server.playlist))
+    connection.recv()
+    server.stop()
+    connection.send(dict(server.requests))
+
+
+def _rss_kb() -> float:
+    """The resident memory of this process right now, or at its peak where that can't be read
+
+    Returns:
+        float: The resident memory in kilobytes.
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class HostReport:
+    """The cost of running many user sessions in one EngineHost"""
+    def __init__(self, users: int, process_kb: float, session_kb: float, cpu_seconds: float, simulated_ms: float,
+                 expected: int, detected: int, requests: Counter):
+        """Initializer for a HostReport.
+
+        Args:
+            users: How many sessions were run.
+            process_kb: The resident memory of the process before any session was added.
+            session_kb: How much the resident memory grew by once every session was running.
+            cpu_seconds: The CPU time the process used while the sessions were running.
+            simulated_ms: How much listening was simulated for each user.
+            expected: The events a perfect engine would have detected, across every user.
+            detected: The events that were detected, across every user.
+            requests: The requests served by the simulated API.
+        """
+
+        self.users = users
+        self.process_kb = process_kb
+        self.session_kb = session_kb
+        self.cpu_seconds = cpu_seconds
+        self.simulated_ms = simulated_ms
+        self.expected = expected
+        self.detected = detected
+        self.requests = requests
+
+    @property
+    def kb_per_user(self) -> float:
+        """The resident memory each session adds
+
+        Returns:
+            float: The memory in kilobytes.
+        """
+
+        return self.session_kb / self.users
+
+    @property
+    def cpu_seconds_per_user_hour(self) -> float:
+        """The CPU time each session uses per hour of listening
+
+        Returns:
+            float: The CPU time in seconds.
+        """
+
+        return self.cpu_seconds / self.users / (self.simulated_ms / 3600000)
+
+    def __str__(self) -> str:
+        return "\n".join([
+            "Users:                 %s, %.1f hours of listening each" % (self.users, self.simulated_ms / 3600000),
+            "Events:                %s expected, %s detected" % (self.expected, self.detected),
+            "Requests per hour:     %.0f per user" %
+            (sum(self.requests.values()) / self.users / (self.simulated_ms / 3600000)),
+            "Memory:                %.0fkB per user, %.0fkB for the process itself" %
+            (self.kb_per_user, self.process_kb),
+            "CPU:                   %.2fs per user per hour of listening" % self.cpu_seconds_per_user_hour,
+        ])
+
+
+async def run_host_simulation(trace: ListeningTrace,
+                              users: int = 100,
+                              speed: float = 20,
+                              search_wait: float = 200,
+                              max_workers: int = 32) -> HostReport:
+    """Replays the same trace for many users at once, all running in a single EngineHost, and measures what each
+    session costs. The simulated API runs in a process of its own, so that its CPU time is not counted.
+
+    Args:
+        trace: The listening session every user replays.
+        users: How many sessions to run.
+        speed: How many times faster than real time to replay the trace.
+        search_wait: The search_wait of every engine, in trace milliseconds.
+        max_workers: The size of the worker pool shared by every session.
+
+    Returns:
+        HostReport: What the sessions cost.
+    """
+
+    # Spawned rather than forked, the event loop may already have threads running
+    context = multiprocessing.get_context("spawn")
+    connection, server_connection = context.Pipe()
+    server_process = context.Process(target=_serve, args=(trace, speed, server_connection), daemon=True)
+    server_process.start()
+    server_url, playlist = connection.recv()
+
+    process_kb = _rss_kb()
+    host = EngineHost(max_workers=max_workers, rate_limiter=TokenBucket(rate=users * speed, capacity=users * speed))
+    recording_playlist = type("RecordingPlaylist", (_RecordingPlaylist, ), {"events": []})
+    for user in range(users):
+        host.add_session("user%d" % user,
+                         _SimulatedOAuth(server_url),
+                         api_prefix=server_url + "/v1/",
+                         search_wait=search_wait / speed,
+                         scheduler=scaled_scheduler(speed, search_wait),
+                         playlists=[dict(playlist)],
+                         addons=[AutoAddPlaylist, AutoRemovePlaylist, recording_playlist])
+
+    cpu_started = time.process_time()
+    host_task = asyncio.ensure_future(host.run())
+    try:
+        # Measured once every session has loaded its playlist and is polling
+        await asyncio.sleep(trace.duration_ms / speed / 1000 / 2)
+        session_kb = _rss_kb() - process_kb
+        await asyncio.sleep(trace.duration_ms / speed / 1000 / 2 + 10 / speed)
+
+        await host.stop()
+        await host_task
+        cpu_seconds = time.process_time() - cpu_started
+    finally:
+        host_task.cancel()
+        host.close()
+        connection.send(None)
+        requests = Counter(connection.recv())
+        server_process.join()
+
+    return HostReport(users, process_kb, session_kb, cpu_seconds, trace.duration_ms,
+                      len(trace.expected_events()) * users, len(recording_playlist.events), requests)
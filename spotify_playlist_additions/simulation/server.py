@@ -0,0 +1,290 @@
+"""Contains a local stand-in for the parts of the Spotify Web API that the engine uses"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from spotify_playlist_additions.simulation.trace import ListeningTrace
+
+LOG = logging.getLogger(__name__)
+
+USER_ID = "simulated-user"
+PLAYLIST_ID = "simulatedplaylist00000"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeSpotifyServer:
+    """Serves the token endpoint, /me, /me/playlists, /me/player/currently-playing and the playlist endpoints from
+    memory, replaying a listening trace on the currently playing endpoint.
+
+    The trace is replayed speed times faster than real time, starting with the first request for the currently playing
+    track. Every duration the server reports is divided by speed as well, so to a client the replay looks like real
+    time playback of tracks that are speed times shorter. A client replaying at speed 50 should therefore also poll
+    50 times faster than it normally would.
+    """
+    def __init__(self, trace: ListeningTrace, speed: float = 1, playlist_tracks: List[dict] = None):
+        """Initializer for a FakeSpotifyServer. The server is not started until start is called.
+
+        Args:
+            trace: The listening session to replay.
+            speed: How many times faster than real time to replay the trace.
+            playlist_tracks: The tracks that the playlist starts out with. In the format of a spotify API track.
+        """
+
+        self.trace = trace
+        self.speed = speed
+        self.playlist = {"id": PLAYLIST_ID, "name": "Simulated Playlist", "snapshot_id": "0"}
+        self.playlist_uris = [track["uri"] for track in playlist_tracks or []]
+
+        self.requests = Counter()
+        self.poll_times: List[float] = []
+        self.started_at: Optional[float] = None
+
+        self._scaled_tracks = {}
+        for play in trace.plays:
+            scaled_track = dict(play.track)
+            scaled_track["duration_ms"] = play.track["duration_ms"] / speed
+            self._scaled_tracks[play.track["id"]] = scaled_track
+
+        self._lock = threading.Lock()
+        self._snapshot = 0
+        self._http_server = _ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """The address the server listens on
+
+        Returns:
+            str: The base URL of the server.
+        """
+
+        host, port = self._http_server.server_address
+        return "http://%s:%s" % (host, port)
+
+    @property
+    def elapsed_ms(self) -> float:
+        """How far into the trace the replay is, in trace milliseconds. 0 until the replay has started.
+
+        Returns:
+            float: The position of the replay.
+        """
+
+        if self.started_at is None:
+            return 0
+        return (time.monotonic() - self.started_at) * 1000 * self.speed
+
+    def start(self) -> None:
+        """Starts serving requests on a background thread
+        """
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving requests
+        """
+
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+    def currently_playing(self) -> Optional[dict]:
+        """Works out what the currently playing endpoint should return at this moment, starting the replay if it is the
+        first time it has been asked.
+
+        Returns:
+            Optional[dict]: The currently playing document, or None if nothing is playing.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if self.started_at is None:
+                self.started_at = now
+            self.poll_times.append(now)
+
+        state = self.trace.state_at(self.elapsed_ms)
+        if state is None:
+            return None
+
+        state["progress_ms"] = state["progress_ms"] / self.speed
+        state["item"] = self._scaled_tracks[state["item"]["id"]]
+        state["timestamp"] = int(time.time() * 1000)
+        return state
+
+    def playlist_items(self, offset: int, limit: int) -> dict:
+        """Serves a page of the playlist.
+
+        Args:
+            offset: The index of the first item.
+            limit: The maximum amount of items.
+
+        Returns:
+            dict: The page, in the format of the Spotify API.
+        """
+
+        with self._lock:
+            uris = self.playlist_uris[offset:offset + limit]
+            total = len(self.playlist_uris)
+        items = [{"track": {"id": uri.rsplit(":", 1)[-1], "uri": uri}} for uri in uris]
+        return {"items": items, "total": total, "offset": offset, "limit": limit}
+
+    def add_items(self, uris: List[str]) -> dict:
+        """Appends tracks to the playlist.
+
+        Args:
+            uris: The URIs of the tracks.
+
+        Returns:
+            dict: The new snapshot_id of the playlist.
+        """
+
+        with self._lock:
+            self.playlist_uris.extend(uris)
+            return self._new_snapshot()
+
+    def remove_items(self, uris: List[str]) -> dict:
+        """Removes every occurrence of tracks from the playlist.
+
+        Args:
+            uris: The URIs of the tracks.
+
+        Returns:
+            dict: The new snapshot_id of the playlist.
+        """
+
+        removed = set(uris)
+        with self._lock:
+            self.playlist_uris = [uri for uri in self.playlist_uris if uri not in removed]
+            return self._new_snapshot()
+
+    def count_request(self, method: str, path: str) -> None:
+        """Counts a request that was made to the server.
+
+        Args:
+            method: The HTTP method of the request.
+            path: The path of the request, without the query string.
+        """
+
+        with self._lock:
+            self.requests[method + " " + path] += 1
+
+    def _new_snapshot(self) -> dict:
+        self._snapshot += 1
+        self.playlist["snapshot_id"] = str(self._snapshot)
+        return {"snapshot_id": self.playlist["snapshot_id"]}
+
+    def _handler_class(self) -> type:
+        """Creates the request handler, bound to this server.
+
+        Returns:
+            type: The BaseHTTPRequestHandler subclass.
+        """
+
+        server = self
+        playlist_path = re.compile(r"^/v1/playlists/(?P<id>[^/]+)(?P<items>/(items|tracks))?$")
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: dict = None, headers: dict = None) -> None:
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _url(self):
+                url = urlparse(self.path)
+                return url._replace(path=url.path.rstrip("/"))
+
+            def do_POST(self) -> None:
+                url = self._url()
+                body = self._read_body()
+                server.count_request("POST", url.path)
+
+                if url.path == "/api/token":
+                    self._send(200, {
+                        "access_token": "simulated-access-token",
+                        "token_type": "Bearer",
+                        "expires_in": 3600,
+                        "refresh_token": "simulated-refresh-token",
+                    })
+                    return
+
+                match = playlist_path.match(url.path)
+                if match and match.group("items"):
+                    uris = json.loads(body)
+                    if isinstance(uris, dict):
+                        uris = uris["uris"]
+                    self._send(201, server.add_items(uris))
+                    return
+
+                self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+            def do_DELETE(self) -> None:
+                url = self._url()
+                body = json.loads(self._read_body() or b"{}")
+                server.count_request("DELETE", url.path)
+
+                match = playlist_path.match(url.path)
+                if match and match.group("items"):
+                    items = body.get("items") or body.get("tracks") or []
+                    self._send(200, server.remove_items([item["uri"] for item in items]))
+                    return
+
+                self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+            def do_GET(self) -> None:
+                url = self._url()
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                server.count_request("GET", url.path)
+
+                if url.path == "/v1/me":
+                    self._send(200, {"id": USER_ID})
+                elif url.path == "/v1/me/player/currently-playing":
+                    state = server.currently_playing()
+                    if state is None:
+                        self._send(204)
+                        return
+                    # The timestamp of the real API only changes along with the playback state, not on every request
+                    etag = '"%s"' % hashlib.sha1(json.dumps(dict(state, timestamp=None),
+                                                            sort_keys=True).encode()).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        self._send(304)
+                    else:
+                        self._send(200, state, {"ETag": etag})
+                elif url.path == "/v1/me/playlists":
+                    self._send(200, {"items": [server.playlist], "total": 1, "offset": 0, "limit": 50})
+                else:
+                    match = playlist_path.match(url.path)
+                    if not match:
+                        self._send(404, {"error": {"status": 404, "message": "Not found"}})
+                    elif match.group("items"):
+                        self._send(
+                            200,
+                            server.playlist_items(int(query.get("offset", 0)), int(query.get("limit", 100))))
+                    else:
+                        self._send(200, server.playlist)
+
+        return Handler
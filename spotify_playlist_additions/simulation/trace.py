@@ -0,0 +1,220 @@
+"""Contains listening traces, the scripted playback that the simulated Spotify API replays"""
+
+import bisect
+import json
+import random
+from typing import List, Optional, Tuple
+
+FULLY_LISTENED = "fully_listened"
+SKIPPED = "skipped"
+
+
+def make_track(number: int, duration_ms: int) -> dict:
+    """Creates a track in the same format as the Spotify API, with only the fields the engine and addons use.
+
+    Args:
+        number: Makes the ID, URI and name of the track unique.
+        duration_ms: How long the track is.
+
+    Returns:
+        dict: The track.
+    """
+
+    track_id = "simulated%016d" % number
+    return {
+        "id": track_id,
+        "uri": "spotify:track:" + track_id,
+        "name": "Simulated Track %d" % number,
+        "duration_ms": duration_ms,
+    }
+
+
+class TracePlay:
+    """A single play of a track in a listening trace. The track is listened to for listen_ms milliseconds, after which
+    the next play starts. If listen_ms is shorter than the track it was skipped, otherwise it was fully listened.
+    Playback can be paused once during the play, for pause_ms milliseconds after pause_at_ms milliseconds of listening.
+    """
+
+    __slots__ = ("track", "listen_ms", "pause_at_ms", "pause_ms")
+
+    def __init__(self, track: dict, listen_ms: int, pause_at_ms: int = 0, pause_ms: int = 0):
+        """Initializer for a TracePlay.
+
+        Args:
+            track: The track that is played. In the format of a spotify API track.
+            listen_ms: How long the track is listened to, not counting the pause.
+            pause_at_ms: How far into the play the pause starts.
+            pause_ms: How long playback is paused for.
+        """
+
+        self.track = track
+        self.listen_ms = min(listen_ms, track["duration_ms"])
+        self.pause_at_ms = pause_at_ms
+        self.pause_ms = pause_ms
+
+    @property
+    def outcome(self) -> str:
+        """What the engine should detect once this play is over
+
+        Returns:
+            str: Either FULLY_LISTENED or SKIPPED.
+        """
+
+        return FULLY_LISTENED if self.listen_ms >= self.track["duration_ms"] else SKIPPED
+
+    @property
+    def length_ms(self) -> int:
+        """How long the play lasts in total, including the pause
+
+        Returns:
+            int: The length of the play in milliseconds.
+        """
+
+        return self.listen_ms + self.pause_ms
+
+    def to_json(self) -> dict:
+        return {
+            "track": self.track,
+            "listen_ms": self.listen_ms,
+            "pause_at_ms": self.pause_at_ms,
+            "pause_ms": self.pause_ms
+        }
+
+
+class ListeningTrace:
+    """A sequence of plays, back to back. The last play only marks the end of the one before it; it is never judged,
+    because the engine can only tell how a track ended once the next one has started.
+    """
+    def __init__(self, plays: List[TracePlay]):
+        """Initializer for a ListeningTrace.
+
+        Args:
+            plays: The plays, in the order they happen. Two plays in a row must not be of the same track.
+        """
+
+        self.plays = plays
+
+        self._starts = []
+        start = 0
+        for play in plays:
+            self._starts.append(start)
+            start += play.length_ms
+        self._end = start
+
+    @property
+    def duration_ms(self) -> int:
+        """How long the trace takes to play until the last play has started
+
+        Returns:
+            int: The duration in milliseconds.
+        """
+
+        return self._starts[-1] if self._starts else 0
+
+    def expected_events(self) -> List[Tuple[str, str, int]]:
+        """The events that a perfect engine would detect while replaying the trace.
+
+        Returns:
+            List[Tuple[str, str, int]]: The outcome, track ID and the time in milliseconds at which each play ended.
+        """
+
+        return [(play.outcome, play.track["id"], self._starts[index + 1])
+                for index, play in enumerate(self.plays[:-1])]
+
+    def state_at(self, elapsed_ms: float) -> Optional[dict]:
+        """Works out what is playing at a point in the trace.
+
+        Args:
+            elapsed_ms: How far into the trace to look.
+
+        Returns:
+            Optional[dict]: The play that is happening and how far into the track it is, in the format of the
+                currently playing endpoint of the Spotify API. None once the trace has finished.
+        """
+
+        index = bisect.bisect_right(self._starts, elapsed_ms) - 1
+        if index < 0 or elapsed_ms >= self._end:
+            return None
+
+        play = self.plays[index]
+        into_play = elapsed_ms - self._starts[index]
+
+        is_playing = True
+        progress_ms = into_play
+        if play.pause_ms and into_play >= play.pause_at_ms:
+            if into_play < play.pause_at_ms + play.pause_ms:
+                is_playing = False
+                progress_ms = play.pause_at_ms
+            else:
+                progress_ms = into_play - play.pause_ms
+
+        return {"is_playing": is_playing, "progress_ms": int(progress_ms), "item": play.track}
+
+    def dump(self, path: str) -> None:
+        """Saves the trace as JSON, so that it can be replayed again later.
+
+        Args:
+            path: Where to save the trace.
+        """
+
+        with open(path, "w") as trace_file:
+            json.dump([play.to_json() for play in self.plays], trace_file)
+
+    @classmethod
+    def load(cls, path: str) -> "ListeningTrace":
+        """Loads a trace that was saved by dump, or recorded elsewhere in the same format.
+
+        Args:
+            path: Where the trace was saved.
+
+        Returns:
+            ListeningTrace: The trace.
+        """
+
+        with open(path) as trace_file:
+            return cls([TracePlay(**play) for play in json.load(trace_file)])
+
+
+def synthetic_trace(plays: int = 100,
+                    catalog_size: int = 500,
+                    skip_ratio: float = 0.3,
+                    pause_ratio: float = 0.1,
+                    seed: int = None) -> ListeningTrace:
+    """Generates a random listening session.
+
+    Args:
+        plays: How many plays the trace has.
+        catalog_size: How many different tracks are picked from.
+        skip_ratio: The share of plays that are skipped.
+        pause_ratio: The share of plays that are paused part of the way through.
+        seed: Makes the trace repeatable.
+
+    Returns:
+        ListeningTrace: The trace.
+    """
+
+    generator = random.Random(seed)
+    catalog = [make_track(number, generator.randint(120000, 300000)) for number in range(catalog_size)]
+
+    trace = []
+    previous = None
+    for _ in range(plays):
+        track = generator.choice(catalog)
+        while track is previous:
+            track = generator.choice(catalog)
+        previous = track
+
+        duration_ms = track["duration_ms"]
+        listen_ms = duration_ms
+        if generator.random() < skip_ratio:
+            # Far enough from the end of the track that it can't be mistaken for a full listen
+            listen_ms = generator.randint(5000, duration_ms - 10000)
+
+        pause_at_ms, pause_ms = 0, 0
+        if generator.random() < pause_ratio:
+            pause_at_ms = generator.randint(1000, listen_ms - 1000)
+            pause_ms = generator.randint(5000, 120000)
+
+        trace.append(TracePlay(track, listen_ms, pause_at_ms, pause_ms))
+
+    return ListeningTrace(trace)
@@ -2,35 +2,58 @@
 
 import asyncio
 import logging
+import time
+from typing import List
 
 import requests
-from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
 
+from spotify_playlist_additions import backfill, fingerprints, metrics
+from spotify_playlist_additions.async_client import NOT_MODIFIED, AsyncSpotify, PollingSpotify
+from spotify_playlist_additions.auth import FileTokenStore, TokenManager
+from spotify_playlist_additions.backfill import RecentlyPlayedBackfill
+from spotify_playlist_additions.events import (EventBus, TrackEvent, TrackFullyListened, TracksBackfilled, TrackSkipped,
+                                               TrackStarted)
+from spotify_playlist_additions.fingerprints import FingerprintIndex
+from spotify_playlist_additions.listening_log import ListeningLog
+from spotify_playlist_additions.mutations import PlaylistMutationQueue
+from spotify_playlist_additions.playback import PlaybackState
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlist_picker import choose_playlist, resolve_playlist
+from spotify_playlist_additions.playlists.abstract import AbstractPlaylist
 from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
 from spotify_playlist_additions.playlists.autoremove import AutoRemovePlaylist
+from spotify_playlist_additions.rate_limit import CircuitOpenError
+from spotify_playlist_additions.scheduler import PollScheduler
+from spotify_playlist_additions.state import StateStore
 
 LOG = logging.getLogger(__name__)
 
+# How old the last observed track can be and still be trusted after a restart. Anything older and too much may have
+# been played in between to tell how that track ended.
+TRACK_STATE_MAX_AGE = 30
+
+# How many seconds apart the fingerprint index of the library is brought up to date
+FINGERPRINT_REFRESH_INTERVAL = 3600
+
 
 def _detect_skipped_track(remaining_duration: float,
-                          end_of_track_buffer: float, track: dict,
-                          prev_track: dict) -> bool:
+                          end_of_track_buffer: float, track: PlaybackState,
+                          prev_track: PlaybackState) -> bool:
     """Performs the detection logic for whether a track was skipped
 
     Args:
         remaining_duration: The remaining duration of the track in milliseconds
         end_of_track_buffer: The buffer of time at the end of a song that, if skipped, will still be counted as fully
             listened
-        track: The track retrieved directly from the spotify API.
-        prev_track: The track that was detected to be playing on the previous frame.
+        track: The playback state of this frame.
+        prev_track: The playback state of the previous frame.
 
     Returns:
         bool: Whether the track has been skipped or not.
     """
 
-    if remaining_duration > end_of_track_buffer and prev_track["item"][
-            "name"] != track["item"]["name"]:
+    if remaining_duration > end_of_track_buffer and prev_track.track.name != track.track.name:
         return True
 
     return False
@@ -53,114 +76,512 @@ def _detect_fully_listened_track(remaining_duration,
     return False
 
 
+class _PlaylistRuntime:
+    """Everything the engine keeps for a single playlist it runs on"""
+
+    __slots__ = ("playlist", "index", "mutations", "checkpointed_snapshot_id")
+
+    def __init__(self, playlist: dict, index: PlaylistIndex):
+        self.playlist = playlist
+        self.index = index
+        self.mutations: PlaylistMutationQueue = None
+        self.checkpointed_snapshot_id: str = None
+
+
 class SpotifyPlaylistEngine:
     """The main driver for Spotify Playlist Additions. Contains the main loop, functionality branches out from here.
     Contains logic for detection of a skipped or fully listened track and passes this information to various playlist
     additions that utilize it to perform actions on a playlist
     """
-    def __init__(self, search_wait: float = 5000, playlist: dict = None):
+    def __init__(self,
+                 search_wait: float = 5000,
+                 playlist: dict = None,
+                 max_workers: int = 8,
+                 scheduler: PollScheduler = None,
+                 spotify_client: AsyncSpotify = None,
+                 addons: list = None,
+                 metrics_port: int = None,
+                 state_store: StateStore = None,
+                 playlists: List[dict] = None,
+                 token_manager: TokenManager = None,
+                 backfill_interval: float = None,
+                 dry_run: bool = False,
+                 fingerprint_library: bool = False,
+                 listening_log: ListeningLog = None,
+                 started_at: float = None,
+                 profiler: "Profiler" = None):
         """Initializer for a SpotifyPlaylistEngine. Nothing that absolutely requires an internet connection should be
         located here.
 
         Args:
-            search_wait: How long to wait before performing a track search. Essentially, the rate of checking or time
-            per frame
-            playlist: The playlist dictionary retrieved directly from the spotify API.
+            search_wait: How long to wait before performing a track search near the end of a track. Also the buffer at
+                the end of a track that still counts as fully listened.
+            playlist: The playlist dictionary retrieved directly from the spotify API. Shorthand for playlists when
+                the engine runs on a single playlist.
+            max_workers: The maximum amount of Spotify API requests that can be running at once.
+            scheduler: Decides how long to wait between frames. Defaults to a PollScheduler that polls every
+                search_wait near the end of a track and less often everywhere else.
+            spotify_client: The client to make Spotify API calls with. Defaults to one that authenticates the user
+                through OAuth, keeping the tokens in memory through token_manager.
+            addons: The playlist addon classes to run. Defaults to the addons specified in the config file.
+            metrics_port: The local port to serve metrics on, in the Prometheus text format. Metrics are still
+                collected but not served if this is not given.
+            state_store: Keeps the user, playlists, playlist indexes and last observed track between runs, so that a
+                restart neither repeats the requests to look them up nor loses the track that was playing. Defaults to
+                not keeping anything.
+            playlists: The playlists to run the addons on, each with its own instance of every addon. Only the id of
+                each playlist is required, the rest is looked up when the engine starts.
+            token_manager: Refreshes the token of the user in the background while the engine runs. Must be the cache
+                handler of the auth manager of spotify_client. Defaults to one that keeps the token in .tokens.txt if
+                spotify_client is not given, and to not refreshing in the background otherwise.
+            backfill_interval: How many seconds apart to look for fully listened tracks that the poll loop missed in
+                the listening history of the user, see RecentlyPlayedBackfill. The history is also read once when the
+                engine starts. Needs the user-read-recently-played scope. Defaults to not looking.
+            dry_run: Whether to print the changes the addons make to the playlists instead of sending them.
+            fingerprint_library: Whether to keep a FingerprintIndex of every playlist and saved track of the user for
+                the addons, so that AutoAddPlaylist does not add another release of a recording the user already has.
+                Read in the background when the engine starts and every FINGERPRINT_REFRESH_INTERVAL seconds after
+                that. Needs the playlist-read-private and user-library-read scopes.
+            listening_log: Where every skip and full listen is logged, and counted for the addons, so that
+                AutoRemovePlaylist only removes a track once it has been skipped a few times lately. Defaults to not
+                logging anything, in which case a track is removed on its first skip. Not closed by the engine.
+            started_at: When the program started, in the time of time.monotonic, for measuring how long it took until
+                the first poll. Defaults to when start is called.
+            profiler: Profiles the poll loop of the engine, see profiling.Profiler. Must have been started. Defaults
+                to not profiling, which costs nothing.
         """
 
-        self._playlist = playlist
+        self._state_store = state_store
+        if playlists is None and playlist is not None:
+            playlists = [playlist]
+        if playlists is None and state_store:
+            playlists = state_store.get("playlists")
+
+        self._playlists: List[dict] = list(playlists or [])
         self._search_wait = search_wait
+        self._scheduler = scheduler or PollScheduler(min_wait=search_wait)
 
-        self._playlist_addons = []
-        self._collect_addons()
+        self._playlist_addons = list(addons or [])
+        if not addons:
+            self._collect_addons()
 
         self._scope = ""
         self._get_scope()
-
-        self._spotify_client = Spotify(auth_manager=SpotifyOAuth(
-            redirect_uri="http://localhost:8888/callback",
-            scope=self._scope,
-            cache_path=".tokens.txt"))
+        self._backfill_interval = backfill_interval
+        self._dry_run = dry_run
+        self._listening_log = listening_log
+        self._fingerprint_index: FingerprintIndex = None
+        if fingerprint_library:
+            self._scope += " " + fingerprints.SCOPE
+            self._fingerprint_index = FingerprintIndex()
+            if state_store:
+                self._fingerprint_index.restore(state_store)
+        if backfill_interval is not None:
+            self._scope += backfill.SCOPE
+
+        if not spotify_client:
+            token_manager = token_manager or TokenManager(FileTokenStore(".tokens.txt"))
+            auth_manager = SpotifyOAuth(
+                redirect_uri="http://localhost:8888/callback",
+                scope=self._scope,
+                cache_handler=token_manager)
+            spotify_client = AsyncSpotify(
+                PollingSpotify(auth_manager=auth_manager,
+                        requests_session=AsyncSpotify.create_session()),
+                max_workers=max_workers)
+        self._spotify_client = spotify_client
+        self._token_manager = token_manager
+
+        # The raw payload of every frame is freed as soon as it has been parsed, unless an addon needs it
+        self._keep_raw = any(getattr(addon, "wants_raw_track", False) for addon in self._playlist_addons)
 
         self._user_id: str = ""
+        self._runtimes: List[_PlaylistRuntime] = []
+        self._event_bus: EventBus = None
+        self._backfill_task: asyncio.Future = None
+        self._fingerprint_task: asyncio.Future = None
+        self._running = False
+        self._stopped = False
+
+        self._metrics_port = metrics_port
+        self._metrics_server: asyncio.AbstractServer = None
+        self._started_at = started_at
+        self._profiler = profiler
+        self._iteration_started = 0.0
+        self._next_poll_at: float = None
+        self._iteration_seconds = metrics.POLL_ITERATION_SECONDS.labels()
+        self._drift_seconds = metrics.POLL_DRIFT_SECONDS.labels()
+        self._skipped_events = metrics.EVENTS.labels("skipped")
+        self._fully_listened_events = metrics.EVENTS.labels("fully_listened")
+
+    @property
+    def addons(self) -> List[AbstractPlaylist]:
+        """The addon instances of every playlist. Only the addon classes until the engine has started.
+
+        Returns:
+            List[AbstractPlaylist]: The addons.
+        """
+
+        return self._playlist_addons
+
+    @property
+    def playlists(self) -> List[dict]:
+        """The playlists the engine runs on. Empty until one has been chosen or restored from the state store.
+
+        Returns:
+            List[dict]: The playlist dictionaries retrieved directly from the spotify API.
+        """
+
+        return self._playlists
 
     async def start(self) -> None:
         """Main loop for the program
         """
 
-        self._user_id = self._spotify_client.current_user()["id"]
+        # Set before anything is awaited, so that being stopped while starting up stops the main loop too
+        self._running = True
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+
+        if self._metrics_port is not None:
+            self._metrics_server = await metrics.start_metrics_server(self._metrics_port)
+
+        if self._token_manager:
+            self._token_manager.start(self._spotify_client.sync.auth_manager)
+
+        if self._state_store:
+            self._user_id = self._state_store.get("user_id")
+        if not self._user_id:
+            self._user_id = (await self._spotify_client.current_user())["id"]
+            if self._state_store:
+                self._state_store.set("user_id", self._user_id)
+
+        self._runtimes = list(await asyncio.gather(
+            *[self._start_playlist(playlist) for playlist in self._playlists]))
+
         self._init_addons()
+        await asyncio.gather(
+            *[addon.start() for addon in self._playlist_addons])
 
-        prev_track = None
-        remaining_duration = self._search_wait + 1
-        while True:
-            track = None
+        if not self._running:
+            return
+
+        if self._profiler is not None:
+            self._profiler.watch(self._user_id, self)
+
+        self._event_bus = EventBus(prepare=self._prepare)
+        for addon in self._playlist_addons:
+            self._event_bus.subscribe(addon, addon.queue_size,
+                                      addon.overflow_policy)
+        self._event_bus.start()
+
+        if self._fingerprint_index is not None:
+            self._fingerprint_task = asyncio.ensure_future(self._refresh_fingerprints())
+        if self._backfill_interval is not None:
+            self._backfill_task = asyncio.ensure_future(self._run_backfill(
+                RecentlyPlayedBackfill(self._spotify_client, self._search_wait, self._state_store)))
+
+        prev_track, remaining_duration = self._restore_track_state()
+        frame = None
+        while self._running:
+            payload = None
+            self._iteration_started = time.monotonic()
+            if self._profiler is not None:
+                self._profiler.frame_started()
+            if self._next_poll_at is not None:
+                self._drift_seconds.observe(
+                    max(0.0, self._iteration_started - self._next_poll_at))
             try:
-                track = self._spotify_client.currently_playing()
+                payload = await self._spotify_client.currently_playing()
+                self._scheduler.observe_latency(
+                    (time.monotonic() - self._iteration_started) * 1000)
+                if self._started_at is not None:
+                    self._observe_startup()
+            except CircuitOpenError as e:
+                LOG.warning(e)
+                await self._wait(e.retry_after * 1000)
+                continue
             except requests.exceptions.ReadTimeout as exc:
                 LOG.debug(exc)
                 LOG.warning(
-                    "Retrieving currently running track from spotify timed out.",
+                    "Retrieving currently running track from spotify timed out."
                     " See debug for more detail (this is unlikely to be a problem)"
                 )
             except Exception as e:
                 LOG.error(e)
+            if payload is NOT_MODIFIED:
+                # Nothing has changed since the last frame, not even the progress, so playback is still paused
+                track = frame
+            else:
+                track = frame = PlaybackState.from_api(payload, self._keep_raw)
+            del payload
             if not track:
+                await self._wait(self._scheduler.next_wait(None))
                 continue
 
             if not prev_track:
                 prev_track = track
 
-            if track["item"]["id"] != prev_track["item"]["id"]:
-                LOG.info("Detected song start: %s", track["item"]["name"])
-
-            tasks = []
-
             if _detect_skipped_track(remaining_duration, self._search_wait,
                                      track, prev_track):
 
-                LOG.info("Detected skipped song: %s",
-                         prev_track["item"]["name"])
-                for addon in self._playlist_addons:
-                    tasks.append(addon.handle_skipped_track(track=prev_track))
+                LOG.info("Detected skipped song: %s", prev_track.track.name)
+                self._skipped_events.inc()
+                if self._listening_log is not None:
+                    self._listening_log.record_skip(prev_track.track.id)
+                self._event_bus.publish(TrackSkipped(prev_track.track))
 
             elif _detect_fully_listened_track(remaining_duration,
                                               self._search_wait):
-                LOG.info("Detected fully listened song: %s",
-                         prev_track["item"]["name"])
-                for addon in self._playlist_addons:
-                    tasks.append(addon.handle_fully_listened_track(prev_track))
-
-            progress_ms = track["progress_ms"]
-            duration_ms = track["item"]["duration_ms"]
-            remaining_duration = duration_ms - progress_ms
+                LOG.info("Detected fully listened song: %s", prev_track.track.name)
+                self._fully_listened_events.inc()
+                if self._listening_log is not None:
+                    self._listening_log.record_full_listen(prev_track.track.id)
+                self._event_bus.publish(TrackFullyListened(prev_track.track))
+
+            if track.track.id != prev_track.track.id:
+                LOG.info("Detected song start: %s", track.track.name)
+                self._event_bus.publish(TrackStarted(track.track))
+
+            remaining_duration = track.remaining_ms
             prev_track = track
 
-            await asyncio.gather(*tasks)
+            self._checkpoint(track, remaining_duration)
 
-            LOG.debug("Waiting %s seconds before testing tracks again",
-                      self._search_wait / 1000)
-            await asyncio.sleep(self._search_wait / 1000)
+            await self._wait(self._scheduler.next_wait(track))
 
-    def choose_playlist_cli(self) -> None:
-        """Simple interface to choose the playlist. Will be improved upon later on.
+    def _observe_startup(self) -> None:
+        """Records how long it took from starting until the first poll returned
         """
 
-        print("Select the playlist you want to use")
+        startup_seconds = time.monotonic() - self._started_at
+        self._started_at = None
+        metrics.STARTUP_SECONDS.labels().observe(startup_seconds)
+        LOG.info("First poll returned %.3f seconds after starting", startup_seconds)
+
+    def _restore_track_state(self) -> tuple:
+        """Restores the track that was observed last before a restart, if it was observed recently enough that the
+        first frame of this run can still tell whether it was skipped or fully listened.
+
+        Returns:
+            tuple: The playback state of the previous frame, or None, and the remaining duration of its track in
+                milliseconds.
+        """
+
+        last_track = self._state_store.get("last_track") if self._state_store else None
+        if not last_track or time.time() - last_track["observed_at"] > TRACK_STATE_MAX_AGE:
+            return None, self._search_wait + 1
+
+        track = PlaybackState.from_api(last_track["track"])
+        remaining_duration = last_track["remaining_duration"]
+        # The track kept playing while the engine was down, and may even have ended
+        if track.is_playing:
+            remaining_duration -= (time.time() - last_track["observed_at"]) * 1000
+
+        LOG.info("Restored the last observed track: %s", track.track.name)
+        return track, remaining_duration
+
+    def _checkpoint(self, track: PlaybackState, remaining_duration: float) -> None:
+        """Saves the state of this frame to the state store. The playlist index is only saved once its snapshot_id has
+        changed and every queued change has been sent, so that a checkpoint never claims a change that Spotify does not
+        know about yet.
+
+        Args:
+            track: The playback state of this frame.
+            remaining_duration: The remaining duration of the track in milliseconds.
+        """
+
+        if not self._state_store:
+            return
+
+        self._state_store.set("last_track", {
+            "track": track.to_dict(),
+            "remaining_duration": remaining_duration,
+            "observed_at": time.time(),
+        })
+
+        for runtime in self._runtimes:
+            if runtime.index.snapshot_id != runtime.checkpointed_snapshot_id and runtime.mutations.settled:
+                runtime.index.save(self._state_store)
+                runtime.checkpointed_snapshot_id = runtime.index.snapshot_id
+
+    async def _wait(self, wait: float) -> None:
+        """Sleeps until the next frame, recording how long this frame took.
+
+        Args:
+            wait: How long to sleep in milliseconds.
+        """
 
-        playlists = self._spotify_client.current_user_playlists()
-        for idx, playlist in enumerate(playlists["items"]):
-            print(str(idx) + ":", playlist["name"])
+        now = time.monotonic()
+        self._iteration_seconds.observe(now - self._iteration_started)
+        if self._profiler is not None:
+            self._profiler.frame_finished()
+        self._next_poll_at = now + wait / 1000
+
+        LOG.debug("Waiting %s seconds before testing tracks again",
+                  wait / 1000)
+        await asyncio.sleep(wait / 1000)
+
+    async def _run_backfill(self, recently_played: RecentlyPlayedBackfill) -> None:
+        """Hands the fully listened tracks the poll loop missed to the addons, once right away and then every
+        backfill_interval seconds.
+
+        Args:
+            recently_played: Finds the tracks.
+        """
 
-        # TODO: Make this not shit
         while True:
-            user_input = input("Select a number: ")
+            try:
+                tracks, cursor = await recently_played.fetch()
+                if tracks:
+                    LOG.info("Backfilled %s fully listened tracks", len(tracks))
+                    if self._listening_log is not None:
+                        for track in tracks:
+                            self._listening_log.record_full_listen(track.id)
+                    self._event_bus.publish(TracksBackfilled(tracks))
+                recently_played.commit(cursor)
+            except CircuitOpenError as e:
+                LOG.warning(e)
+            except Exception as e:
+                LOG.error("Failed to backfill from the recently played tracks: %s", e)
+            await asyncio.sleep(self._backfill_interval)
+
+    async def _refresh_fingerprints(self) -> None:
+        """Reads whatever changed in the library of the user into the fingerprint index, once right away and then
+        every FINGERPRINT_REFRESH_INTERVAL seconds.
+        """
 
+        while True:
             try:
-                self._playlist = playlists["items"][int(user_input)]
-                break
-            except:  # noqa: E722
-                pass
+                await self._fingerprint_index.refresh(self._spotify_client)
+                if self._state_store:
+                    self._fingerprint_index.save(self._state_store)
+            except CircuitOpenError as e:
+                LOG.warning(e)
+            except Exception as e:
+                LOG.error("Failed to fingerprint the library: %s", e)
+            await asyncio.sleep(FINGERPRINT_REFRESH_INTERVAL)
+
+    async def _prepare(self, event: TrackEvent) -> None:
+        """Brings the playlist index up to date before the addons handle an event that they may change the playlist
+        for.
+
+        Args:
+            event: The event about to be handed to the addons.
+        """
+
+        if isinstance(event, TrackStarted):
+            return
+
+        await asyncio.gather(
+            *[self._resync(runtime) for runtime in self._runtimes])
+
+    @staticmethod
+    async def _resync(runtime: _PlaylistRuntime) -> None:
+        """Brings the index of a single playlist up to date.
+
+        Args:
+            runtime: The playlist.
+        """
+
+        await runtime.mutations.resync()
+
+    async def _start_playlist(self, playlist: dict) -> _PlaylistRuntime:
+        """Fills in the index of a playlist, from the state store if it has a checkpoint and from the API otherwise.
+
+        Args:
+            playlist: The playlist. Looked up first if only its id is known.
+
+        Returns:
+            _PlaylistRuntime: The index and mutation queue of the playlist.
+        """
+
+        if "name" not in playlist:
+            playlist.update(await self._spotify_client.playlist(
+                playlist["id"], fields="id,name,snapshot_id"))
+
+        runtime = _PlaylistRuntime(
+            playlist, PlaylistIndex(self._spotify_client, playlist))
+        if self._state_store and runtime.index.restore(self._state_store):
+            runtime.checkpointed_snapshot_id = runtime.index.snapshot_id
+        else:
+            await runtime.index.load()
+
+        runtime.mutations = PlaylistMutationQueue(self._spotify_client,
+                                                  self._user_id, playlist,
+                                                  runtime.index,
+                                                  dry_run=self._dry_run)
+        return runtime
+
+    async def stop(self) -> None:
+        """Stops the main loop, waits for the addons to finish handling what has already been detected and sends any
+        changes to the playlist that are still queued. Does nothing if the engine has already been stopped.
+        """
+
+        self._running = False
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._profiler is not None:
+            self._profiler.forget(self._user_id)
+
+        for task in (self._backfill_task, self._fingerprint_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._event_bus:
+            await self._event_bus.close()
+        for runtime in self._runtimes:
+            await runtime.mutations.close()
+            if self._state_store:
+                runtime.index.save(self._state_store)
+        if self._fingerprint_index is not None and self._state_store:
+            self._fingerprint_index.save(self._state_store)
+
+        await asyncio.gather(
+            *[addon.stop() for addon in self._playlist_addons
+              if isinstance(addon, AbstractPlaylist)])
+
+        if self._metrics_server:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+
+        if self._token_manager:
+            await self._token_manager.stop()
+
+    async def choose_playlist(self, refresh: bool = False) -> None:
+        """Asks the user which playlist to run on, listing every playlist they have as it arrives, see
+        playlist_picker.choose_playlist. The choice is kept in the state store for the next run.
+
+        Args:
+            refresh: Whether to download the listing of playlists even if a recent one is saved.
+        """
+
+        self._use_playlists([await choose_playlist(self._spotify_client, self._state_store, refresh)])
+
+    async def use_playlist(self, reference: str) -> None:
+        """Runs on the playlist with the given ID, URI, link or name, without asking, see
+        playlist_picker.resolve_playlist. The choice is kept in the state store for the next run.
+
+        Args:
+            reference: The ID, URI, link or name of the playlist.
+
+        Raises:
+            ValueError: If the user has no playlist with that name.
+        """
+
+        self._use_playlists([await resolve_playlist(self._spotify_client, reference, self._state_store)])
+
+    def choose_playlist_cli(self) -> None:
+        """Asks the user which playlist to run on, see choose_playlist. Must be called before the event loop runs.
+        """
+
+        asyncio.get_event_loop().run_until_complete(self.choose_playlist())
+
+    def _use_playlists(self, playlists: List[dict]) -> None:
+        self._playlists = playlists
+        if self._state_store:
+            self._state_store.set("playlists", self._playlists)
 
     def _collect_addons(self):
         """Collects the addons specified in the config file
@@ -173,9 +594,18 @@ class SpotifyPlaylistEngine:
         """Initializes addons with the required inputs
         """
 
-        for index in range(len(self._playlist_addons)):
-            self._playlist_addons[index] = self._playlist_addons[index](
-                self._spotify_client, self._playlist, self._user_id)
+        addon_classes = self._playlist_addons
+        # Only passed when there are any, so addons written before they existed keep working
+        optional_kwargs = {}
+        if self._fingerprint_index is not None:
+            optional_kwargs["fingerprint_index"] = self._fingerprint_index
+        if self._listening_log is not None:
+            optional_kwargs["listening_log"] = self._listening_log
+        self._playlist_addons = [
+            addon_class(self._spotify_client, runtime.playlist, self._user_id,
+                        runtime.index, runtime.mutations, **optional_kwargs)
+            for runtime in self._runtimes for addon_class in addon_classes
+        ]
 
     def _get_scope(self):
         """Collects the scope of all the addons into a singular scope, used to make a singular scope request to
@@ -0,0 +1,109 @@
+"""Contains the state store, which keeps what the engine knows on disk so that a restart picks up where it left off"""
+
+import json
+import logging
+import sqlite3
+from typing import Any, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_index (
+    playlist_id TEXT PRIMARY KEY,
+    snapshot_id TEXT,
+    track_ids TEXT NOT NULL,
+    track_uris TEXT NOT NULL
+);
+"""
+
+
+class StateStore:
+    """A small SQLite database of JSON values and playlist index checkpoints.
+
+    The database is opened in WAL mode without syncing on every commit, so a checkpoint costs a write to the page cache
+    rather than a disk flush. A power cut can lose the last few checkpoints but never corrupts the database, which is
+    fine for state that only saves requests on the next start.
+    """
+    def __init__(self, path: str = ".state.sqlite3"):
+        """Initializer for a StateStore. Creates the database if it does not exist yet.
+
+        Args:
+            path: Where the database is kept.
+        """
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Reads a value.
+
+        Args:
+            key: The name of the value.
+
+        Returns:
+            Optional[Any]: The value, or None if it has never been set.
+        """
+
+        row = self._connection.execute("SELECT value FROM state WHERE key = ?", (key, )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        """Writes a value, replacing whatever was there before.
+
+        Args:
+            key: The name of the value.
+            value: The value. Must be serializable to JSON.
+        """
+
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                                     (key, json.dumps(value)))
+
+    def save_playlist_index(self, playlist_id: str, snapshot_id: Optional[str], track_ids: List[str],
+                            track_uris: List[str]) -> None:
+        """Checkpoints the membership of a playlist. Each playlist is kept in a single row, which makes restoring even
+        a large playlist a single read.
+
+        Args:
+            playlist_id: The ID of the playlist.
+            snapshot_id: The version of the playlist that the membership reflects.
+            track_ids: The IDs of the tracks in the playlist.
+            track_uris: The URIs of the tracks in the playlist.
+        """
+
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO playlist_index (playlist_id, snapshot_id, track_ids, track_uris) "
+                "VALUES (?, ?, ?, ?)", (playlist_id, snapshot_id, "\n".join(track_ids), "\n".join(track_uris)))
+
+    def load_playlist_index(self, playlist_id: str) -> Optional[Tuple[Optional[str], List[str], List[str]]]:
+        """Reads the last checkpoint of the membership of a playlist.
+
+        Args:
+            playlist_id: The ID of the playlist.
+
+        Returns:
+            Optional[Tuple[Optional[str], List[str], List[str]]]: The snapshot_id, track IDs and track URIs, or None if
+                the playlist has never been checkpointed.
+        """
+
+        row = self._connection.execute(
+            "SELECT snapshot_id, track_ids, track_uris FROM playlist_index WHERE playlist_id = ?",
+            (playlist_id, )).fetchone()
+        if not row:
+            return None
+
+        snapshot_id, track_ids, track_uris = row
+        return snapshot_id, track_ids.split("\n") if track_ids else [], track_uris.split("\n") if track_uris else []
+
+    def close(self) -> None:
+        """Closes the database
+        """
+
+        self._connection.close()
@@ -0,0 +1,430 @@
+"""Contains the supervisor, which spreads user sessions over a pool of worker processes that each run an EngineHost"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from spotify_playlist_additions.host import EngineHost, read_config
+from spotify_playlist_additions.rate_limit import TokenBucket, jittered_backoff
+
+LOG = logging.getLogger(__name__)
+
+# How long a worker has to stay up before its earlier crashes stop making it wait longer to be restarted
+HEALTHY_AFTER = 60
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """A consistent hash ring. Every node is placed on the ring many times, and a key belongs to the first node after
+    it on the ring. Adding or removing a node only moves the keys that belong to it, about 1/N of them, rather than
+    reshuffling every key the way a plain hash modulo N would.
+    """
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        """Initializer for a HashRing.
+
+        Args:
+            nodes: The nodes the ring starts with.
+            replicas: How many times each node is placed on the ring. More replicas spread the keys more evenly.
+        """
+
+        self._replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes: Set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def add(self, node: str) -> None:
+        """Places a node on the ring.
+
+        Args:
+            node: The node.
+        """
+
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self._replicas):
+            point = _hash("%s#%d" % (node, replica))
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str) -> None:
+        """Takes a node off the ring, handing its keys to the nodes that follow it.
+
+        Args:
+            node: The node.
+        """
+
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Finds the node a key belongs to.
+
+        Args:
+            key: The key.
+
+        Returns:
+            Optional[str]: The node, or None if the ring is empty.
+        """
+
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, Set[str]]:
+        """Works out which keys belong to every node.
+
+        Args:
+            keys: The keys.
+
+        Returns:
+            Dict[str, Set[str]]: The keys of every node on the ring, including the nodes without any.
+        """
+
+        assignment = {node: set() for node in self._nodes}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                assignment[node].add(key)
+        return assignment
+
+
+async def _serve_assignments(host: EngineHost, rate_limiter: TokenBucket, sessions: Dict[str, dict], root: str,
+                             connection) -> None:
+    """Runs the sessions of a worker, adding and removing them as the supervisor assigns them.
+
+    Args:
+        host: The host the sessions run in.
+        rate_limiter: The rate limiter of the host. Its rate is set by every assignment.
+        sessions: The config of every session, by name.
+        root: The directory the config file is in.
+        connection: Receives assignments from the supervisor, and acknowledges each of them once it has been applied.
+    """
+
+    loop = asyncio.get_event_loop()
+    host_task = asyncio.ensure_future(host.run())
+    try:
+        while True:
+            try:
+                message = await loop.run_in_executor(None, connection.recv)
+            except EOFError:
+                LOG.warning("Lost the supervisor, stopping")
+                break
+
+            if message[0] == "stop":
+                break
+
+            _, sequence, names, rate = message
+            rate_limiter.set_rate(rate, rate * 2)
+
+            assigned = set(names)
+            running = set(host.engines)
+            await asyncio.gather(*[host.remove_session(name) for name in running - assigned])
+            for name in assigned - running:
+                host.add_configured_session(sessions[name], root)
+                host.start_session(name)
+
+            LOG.info("Running %s sessions", len(assigned))
+            connection.send(("assigned", sequence, sorted(assigned)))
+    finally:
+        await host.stop()
+        await host_task
+        host.close()
+
+
+def _run_worker(config_path: str, worker_id: str, connection, max_workers: int, rate: float) -> None:
+    """The entry point of a worker process.
+
+    Args:
+        config_path: Where the config file of the sessions is.
+        worker_id: Identifies the worker in the logs.
+        connection: The worker's end of the pipe to the supervisor.
+        max_workers: The size of the worker pool of the host.
+        rate: The amount of requests per second the worker is allowed on average, until an assignment changes it.
+    """
+
+    # An interrupt reaches every process of the terminal, but it is up to the supervisor to stop the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(format="%(asctime)s " + worker_id +
+                        " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+                        level=logging.INFO)
+
+    root, sessions = read_config(config_path)
+    rate_limiter = TokenBucket(rate=rate, capacity=rate * 2)
+    host = EngineHost(max_workers=max_workers, rate_limiter=rate_limiter)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_serve_assignments(host, rate_limiter, sessions, root, connection))
+    finally:
+        loop.close()
+
+
+class _Worker:
+    """The supervisor's view of a single worker process"""
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.process: multiprocessing.Process = None
+        self.connection = None
+        self.sessions: Set[str] = set()
+        self.rate = 0.0
+        self.started_at = 0.0
+        self.crashes = 0
+        self.restart_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        """Whether the process of the worker is running
+
+        Returns:
+            bool: Whether it is running.
+        """
+
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """Spreads the sessions of a config file (see read_config) over worker processes, each running an EngineHost on
+    its own core.
+
+    Sessions are assigned to workers by consistent hashing of their names. When a worker crashes its sessions move to
+    the workers that are still running, and it is restarted after a jittered backoff that grows with every crash. Once
+    it is back it takes over the same sessions as before. Adding a worker moves only the sessions that hash to it. A
+    session is always released by the worker that had it before another worker acquires it, so it never runs twice.
+
+    The rate limit is split evenly between the workers, as Spotify limits the application as a whole. Every worker is
+    sent its new share whenever a worker is added.
+    """
+    def __init__(self,
+                 config_path: str,
+                 workers: int = None,
+                 max_workers: int = 32,
+                 rate: float = 10,
+                 check_interval: float = 1,
+                 ack_timeout: float = 60):
+        """Initializer for a Supervisor. Does not start any workers until start is called.
+
+        Args:
+            config_path: Where the config file of the sessions is.
+            workers: How many worker processes to run. Defaults to the amount of cores.
+            max_workers: The size of the worker pool of each host.
+            rate: The amount of requests per second allowed on average, across every worker.
+            check_interval: How many seconds to wait between checks on the workers.
+            ack_timeout: How many seconds a worker has to apply an assignment.
+        """
+
+        self._config_path = config_path
+        self._max_workers = max_workers
+        self._rate = rate
+        self._check_interval = check_interval
+        self._ack_timeout = ack_timeout
+
+        _, sessions = read_config(config_path)
+        self._session_names = sorted(sessions)
+
+        # Spawned rather than forked, so that workers never inherit the supervisor's threads or open connections
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: Dict[str, _Worker] = {}
+        self._ring = HashRing()
+        self._running = False
+        self._sequence = 0
+        self._unsettled = False
+
+        for _ in range(workers or os.cpu_count() or 1):
+            self._new_worker()
+
+    @property
+    def assignments(self) -> Dict[str, Set[str]]:
+        """The sessions every worker is running, as acknowledged by the worker
+
+        Returns:
+            Dict[str, Set[str]]: The session names, by worker.
+        """
+
+        return {worker_id: set(worker.sessions) for worker_id, worker in self._workers.items()}
+
+    def start(self) -> None:
+        """Starts every worker and hands out the sessions
+        """
+
+        self._running = True
+        for worker in self._workers.values():
+            self._spawn(worker)
+        self._rebalance()
+
+    def add_worker(self) -> str:
+        """Starts another worker, moving the sessions that now hash to it over from the other workers.
+
+        Returns:
+            str: The ID of the new worker.
+        """
+
+        worker = self._new_worker()
+        if self._running:
+            self._spawn(worker)
+            self._rebalance()
+        return worker.worker_id
+
+    def check(self) -> None:
+        """Moves the sessions of crashed workers to healthy ones, and restarts crashed workers whose backoff is over
+        """
+
+        now = time.monotonic()
+        changed = False
+        for worker in self._workers.values():
+            if worker.alive:
+                if worker.crashes and now - worker.started_at > HEALTHY_AFTER:
+                    worker.crashes = 0
+                continue
+
+            if worker.worker_id in self._ring:
+                worker.crashes += 1
+                worker.restart_at = now + jittered_backoff(worker.crashes - 1)
+                LOG.error("%s exited with %s, moving its %s sessions", worker.worker_id, worker.process.exitcode,
+                          len(worker.sessions))
+                self._ring.remove(worker.worker_id)
+                worker.sessions = set()
+                changed = True
+            elif now >= worker.restart_at:
+                LOG.info("Restarting %s", worker.worker_id)
+                self._spawn(worker)
+                changed = True
+
+        if changed or self._unsettled:
+            self._rebalance()
+
+    def run(self) -> None:
+        """Starts the workers and looks after them until interrupted, then stops them
+        """
+
+        self.start()
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.add_worker())
+        try:
+            while self._running:
+                time.sleep(self._check_interval)
+                self.check()
+        except KeyboardInterrupt:
+            LOG.info("Stopping every worker, sending any queued playlist changes")
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Asks every worker to stop its sessions gracefully, and waits for them to exit
+        """
+
+        self._running = False
+        for worker in self._workers.values():
+            if worker.alive:
+                try:
+                    worker.connection.send(("stop", ))
+                except (BrokenPipeError, OSError):
+                    pass
+        for worker in self._workers.values():
+            if worker.process is not None:
+                worker.process.join(self._ack_timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def _new_worker(self) -> _Worker:
+        worker = _Worker("worker-%d" % len(self._workers))
+        self._workers[worker.worker_id] = worker
+        return worker
+
+    def _spawn(self, worker: _Worker) -> None:
+        """Starts the process of a worker and puts it on the ring.
+
+        Args:
+            worker: The worker.
+        """
+
+        connection, worker_connection = self._context.Pipe()
+        worker.rate = self._rate_share
+        worker.process = self._context.Process(target=_run_worker,
+                                               args=(self._config_path, worker.worker_id, worker_connection,
+                                                     self._max_workers, worker.rate),
+                                               name=worker.worker_id,
+                                               daemon=True)
+        worker.process.start()
+        worker.connection = connection
+        worker.sessions = set()
+        worker.started_at = time.monotonic()
+        self._ring.add(worker.worker_id)
+
+    @property
+    def _rate_share(self) -> float:
+        return self._rate / len(self._workers)
+
+    def _rebalance(self) -> None:
+        """Hands every session to the worker it hashes to, and every worker its share of the rate limit. Sessions that
+        move are released by their old worker before their new worker acquires them. A session whose release is not
+        acknowledged stays where it is until the next rebalance, so that it never runs twice.
+        """
+
+        self._unsettled = False
+        assignment = self._ring.assign(self._session_names)
+        live_workers = [self._workers[worker_id] for worker_id in assignment]
+
+        for worker in live_workers:
+            keep = worker.sessions & assignment[worker.worker_id]
+            if keep != worker.sessions:
+                self._assign(worker, keep)
+
+        held = {name: worker.worker_id for worker in live_workers for name in worker.sessions}
+        for worker in live_workers:
+            sessions = {name for name in assignment[worker.worker_id] if held.get(name, worker.worker_id) ==
+                        worker.worker_id}
+            if sessions != assignment[worker.worker_id]:
+                self._unsettled = True
+            if sessions != worker.sessions or worker.rate != self._rate_share:
+                self._assign(worker, sessions)
+
+    def _assign(self, worker: _Worker, sessions: Set[str]) -> None:
+        """Tells a worker which sessions to run and its share of the rate limit, and waits for it to apply the
+        assignment. A worker that does not answer is left to the next check. Every assignment is numbered, so that a
+        late acknowledgement of an earlier one is never taken for the answer to this one.
+
+        Args:
+            worker: The worker.
+            sessions: The names of the sessions it should run.
+        """
+
+        self._sequence += 1
+        rate = self._rate_share
+        deadline = time.monotonic() + self._ack_timeout
+        try:
+            worker.connection.send(("assign", self._sequence, sorted(sessions), rate))
+            while worker.connection.poll(max(0, deadline - time.monotonic())):
+                _, sequence, names = worker.connection.recv()
+                if sequence == self._sequence:
+                    worker.sessions = set(names)
+                    worker.rate = rate
+                    return
+                LOG.debug("Dropped a late acknowledgement from %s", worker.worker_id)
+            LOG.error("%s did not apply its assignment in time", worker.worker_id)
+        except (EOFError, BrokenPipeError, OSError) as e:
+            LOG.error("Lost %s while assigning sessions to it: %s", worker.worker_id, e)
+        # Tried again on the next check
+        self._unsettled = True
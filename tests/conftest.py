@@ -0,0 +1,13 @@
+"""Shared fixtures for the spotify_playlist_additions tests."""
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def run():
+    """Runs a coroutine to completion on a fresh event loop."""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.async_client`."""
+
+import asyncio
+import json
+import time
+
+import pytest
+import requests
+from spotipy import SpotifyException
+
+from spotify_playlist_additions.async_client import NOT_MODIFIED, AsyncSpotify, PollingSpotify
+
+
+class SleepySpotify:
+    """A client whose every call blocks for a while, like a real request would."""
+    def currently_playing(self):
+        time.sleep(0.1)
+        return {"is_playing": True}
+
+
+def test_calls_do_not_block_the_event_loop(run):
+    """Blocking calls run on the worker pool, so several of them overlap instead of running one after another."""
+    client = AsyncSpotify(SleepySpotify(), max_workers=4)
+
+    async def poll_four_times():
+        return await asyncio.gather(*[client.currently_playing() for _ in range(4)])
+
+    started = time.monotonic()
+    results = run(poll_four_times())
+
+    assert results == [{"is_playing": True}] * 4
+    assert time.monotonic() - started < 0.3
+    client.close()
+
+
+class FakeSession(requests.Session):
+    """A requests session that answers with a list of canned responses and records the headers it was sent."""
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers, **kwargs):
+        self.sent_headers.append(dict(headers))
+        status, body, response_headers = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode() if body is not None else b""
+        response.headers.update(response_headers)
+        response.url = url
+        return response
+
+
+def test_polling_client_sends_etag():
+    """The ETag of a response is sent back, and a 304 is reported as unchanged rather than as nothing playing."""
+    payload = {"is_playing": False, "progress_ms": 1000, "item": {"name": "Track"}}
+    session = FakeSession([(200, payload, {"ETag": '"1"'}), (304, None, {}), (204, None, {}), (200, payload, {})])
+    spotify = PollingSpotify(auth="token", requests_session=session)
+
+    assert spotify.currently_playing() == payload
+    assert spotify.currently_playing() is NOT_MODIFIED
+    assert spotify.currently_playing() is None
+    assert spotify.currently_playing() == payload
+
+    assert [headers.get("If-None-Match") for headers in session.sent_headers] == [None, '"1"', '"1"', None]
+
+
+def test_polling_client_raises_errors():
+    """Error responses raise the same exception spotipy does, with the headers AsyncSpotify reads Retry-After from."""
+    session = FakeSession([(429, {"error": {"status": 429}}, {"Retry-After": "3"})])
+    spotify = PollingSpotify(auth="token", requests_session=session)
+
+    with pytest.raises(SpotifyException) as raised:
+        spotify.currently_playing()
+
+    assert raised.value.http_status == 429
+    assert raised.value.headers["Retry-After"] == "3"
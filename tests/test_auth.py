@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.auth`."""
+
+import asyncio
+import time
+
+from spotify_playlist_additions.auth import FileTokenStore, SQLiteTokenStore, TokenManager, TokenStore
+
+
+class CountingStore(TokenStore):
+    """A token store in memory that counts how often it is used."""
+    def __init__(self, token=None):
+        self.token = token
+        self.loads = 0
+        self.saves = 0
+
+    def load(self, key):
+        self.loads += 1
+        return self.token
+
+    def save(self, key, token):
+        self.saves += 1
+        self.token = token
+
+
+class FakeAuthManager:
+    """Refreshes a token the way SpotifyOAuth does, by handing the new token to its cache handler."""
+    def __init__(self, cache_handler):
+        self.cache_handler = cache_handler
+        self.refreshes = []
+
+    def refresh_access_token(self, refresh_token):
+        self.refreshes.append(refresh_token)
+        token = {"access_token": "access-%d" % len(self.refreshes), "refresh_token": refresh_token,
+                 "expires_at": int(time.time()) + 3600}
+        self.cache_handler.save_token_to_cache(token)
+        return token
+
+
+def _token(expires_in):
+    return {"access_token": "access-0", "refresh_token": "refresh", "expires_at": int(time.time()) + expires_in}
+
+
+def test_token_is_read_from_memory():
+    """The store is read once, however often spotipy asks for the token, and only written when the token changes."""
+    token = _token(3600)
+    store = CountingStore(token)
+    manager = TokenManager(store)
+
+    for _ in range(10):
+        assert manager.get_cached_token() == token
+    manager.save_token_to_cache(dict(token))
+
+    assert store.loads == 1
+    assert store.saves == 0
+
+    manager.save_token_to_cache(_token(7200))
+    assert store.saves == 1
+
+
+def test_token_refreshed_before_it_expires(run):
+    """A token within the refresh margin is refreshed in the background, and the new one is kept and stored."""
+    # expires_at is whole seconds, so the refresh is due between one and two seconds from now
+    store = CountingStore(_token(3))
+    manager = TokenManager(store, refresh_margin=1)
+    auth_manager = FakeAuthManager(manager)
+    refreshes_before_due = []
+
+    async def scenario():
+        manager.start(auth_manager)
+        await asyncio.sleep(0.5)
+        refreshes_before_due.extend(auth_manager.refreshes)
+
+        await asyncio.sleep(2)
+        await manager.stop()
+
+    run(scenario())
+
+    assert refreshes_before_due == []
+    assert auth_manager.refreshes == ["refresh"]
+    assert manager.get_cached_token()["access_token"] == "access-1"
+    assert store.token["access_token"] == "access-1"
+
+
+def test_failed_refresh_retried(run):
+    """A refresh that fails is retried rather than ending the background refresh."""
+    manager = TokenManager(CountingStore(_token(0)))
+    auth_manager = FakeAuthManager(manager)
+    failures = []
+    refresh = auth_manager.refresh_access_token
+
+    def flaky_refresh(refresh_token):
+        if not failures:
+            failures.append(refresh_token)
+            raise ConnectionError("offline")
+        return refresh(refresh_token)
+
+    auth_manager.refresh_access_token = flaky_refresh
+
+    async def scenario():
+        manager.start(auth_manager)
+        await asyncio.sleep(1.2)
+        await manager.stop()
+
+    run(scenario())
+
+    assert failures == ["refresh"]
+    assert auth_manager.refreshes == ["refresh"]
+
+
+def test_stores_round_trip(tmp_path):
+    """Both stores read back what was saved. The SQLite store keeps each user separately."""
+    token = _token(3600)
+
+    file_store = FileTokenStore(str(tmp_path / "tokens.json"))
+    assert file_store.load("user") is None
+    file_store.save("user", token)
+    assert FileTokenStore(str(tmp_path / "tokens.json")).load("user") == token
+
+    sqlite_store = SQLiteTokenStore(str(tmp_path / "tokens.sqlite3"))
+    sqlite_store.save("first", token)
+    sqlite_store.save("second", dict(token, access_token="other"))
+    sqlite_store.close()
+
+    sqlite_store = SQLiteTokenStore(str(tmp_path / "tokens.sqlite3"))
+    assert sqlite_store.load("first") == token
+    assert sqlite_store.load("second")["access_token"] == "other"
+    assert sqlite_store.load("missing") is None
+    sqlite_store.close()
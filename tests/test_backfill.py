@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.backfill`."""
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.backfill import RecentlyPlayedBackfill, _played_at_ms, fully_listened_plays
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.state import StateStore
+
+PLAYLIST = {"id": "playlist", "name": "Playlist"}
+
+
+def _play(number, duration_s, ended_at_s):
+    return {
+        "track": {"id": "id%d" % number, "uri": "spotify:track:id%d" % number, "name": "Track %d" % number,
+                  "duration_ms": duration_s * 1000},
+        "played_at": "2020-09-01T12:%02d:%02d.000Z" % divmod(ended_at_s, 60),
+    }
+
+
+class RecentlyPlayedSpotify:
+    """A client that serves the plays after the cursor it is asked for, newest first like the API does."""
+    def __init__(self, plays):
+        self.plays = plays
+        self.cursors = []
+
+    def current_user_recently_played(self, limit, after):
+        self.cursors.append(after)
+        plays = [play for play in self.plays if after is None or _ended_ms(play) > after]
+        return {"items": list(reversed(plays))[:limit]}
+
+
+def _ended_ms(play):
+    return _played_at_ms(play["played_at"])
+
+
+class RecordingMutations:
+    """A mutation queue that records what it was asked to add."""
+    def __init__(self, index):
+        self.index = index
+        self.added = []
+
+    def add(self, track):
+        self.added.append(track.id)
+        self.index.add(track)
+
+
+def test_plays_judged_by_the_previous_end():
+    """A play is fully listened when the previous one ended about its length earlier. The oldest play can only be
+    judged against a known previous end."""
+    plays = [_play(1, 100, 0), _play(2, 100, 100), _play(3, 100, 130), _play(4, 100, 400), _play(5, 100, 515)]
+
+    assert [track.id for track in fully_listened_plays(plays, None, 200)] == ["id2", "id5"]
+    start = _ended_ms(plays[0]) - 100000
+    assert [track.id for track in fully_listened_plays(list(reversed(plays)), start, 200)] == ["id1", "id2", "id5"]
+
+
+def test_cursor_hands_each_play_on_once(run, tmp_path):
+    """The cursor is only moved once it is committed, and survives a restart through the state store."""
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    spotify = RecentlyPlayedSpotify([_play(1, 100, 0), _play(2, 100, 100)])
+    backfill = RecentlyPlayedBackfill(AsyncSpotify(spotify), 200, store)
+
+    tracks, cursor = run(backfill.fetch())
+    assert [track.id for track in tracks] == ["id2"]
+    assert [track.id for track in run(backfill.fetch())[0]] == ["id2"]
+    backfill.commit(cursor)
+
+    spotify.plays.append(_play(3, 100, 200))
+    restarted = RecentlyPlayedBackfill(AsyncSpotify(spotify), 200, store)
+    tracks, cursor = run(restarted.fetch())
+    restarted.commit(cursor)
+
+    assert [track.id for track in tracks] == ["id3"]
+    assert run(restarted.fetch())[0] == []
+    assert spotify.cursors[-2:] == [_ended_ms(spotify.plays[1]), _ended_ms(spotify.plays[2])]
+
+
+def test_autoadd_adds_backfilled_tracks_once(run):
+    """Tracks already in the playlist, or more than once in the batch, are only added if they are missing."""
+    index = PlaylistIndex(AsyncSpotify(RecentlyPlayedSpotify([])), PLAYLIST)
+    index.update([{"id": "id1", "uri": "spotify:track:id1"}])
+    mutations = RecordingMutations(index)
+    addon = AutoAddPlaylist(None, PLAYLIST, "user", index, mutations)
+
+    plays = [_play(1, 100, 100), _play(2, 100, 200), _play(2, 100, 300)]
+    tracks = fully_listened_plays(plays, _ended_ms(plays[0]) - 100000, 200)
+    assert len(tracks) == 3
+    run(addon.handle_backfilled_tracks(tracks))
+
+    assert mutations.added == ["id2"]
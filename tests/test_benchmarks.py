@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+"""Tests for the benchmark suite in `benchmarks`."""
+
+import pytest
+
+from benchmarks import suite
+
+
+def test_regressions_past_the_threshold_fail():
+    """Results worse than the baseline by more than the threshold regress, new results never do."""
+    baseline = {"python": "3.8.0", "results": {"fast": {"value": 100, "unit": "ns"},
+                                               "memory": {"value": 200, "unit": "KiB"}}}
+    current = {"python": "3.8.0", "results": {"fast": {"value": 120, "unit": "ns"},
+                                              "memory": {"value": 320, "unit": "KiB"},
+                                              "new": {"value": 1, "unit": "us"}}}
+
+    rows = {row[0]: row for row in suite.compare(baseline, current, threshold=0.5)}
+
+    assert rows["fast"][4] == pytest.approx(0.2) and not rows["fast"][5]
+    assert rows["memory"][5]
+    assert rows["new"][1] is None and not rows["new"][5]
+
+
+def test_engine_runs_against_the_stub(run):
+    """The engine benchmark polls the stubbed client and hands the events to the addons."""
+    seconds_per_frame = run(suite._run_engine([suite.AutoAddPlaylist, suite.AutoRemovePlaylist], 20))
+
+    assert 0 < seconds_per_frame < 1
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.detection`."""
+
+import random
+
+import pytest
+
+from spotify_playlist_additions import detection
+from spotify_playlist_additions.detection import detect_batch
+from spotify_playlist_additions.playback import PlaybackState, Track
+from spotify_playlist_additions.spotify_playlist_additions import (_detect_fully_listened_track,
+                                                                   _detect_skipped_track)
+
+BUFFER = 200
+
+
+def _sessions(count, seed=0):
+    """Frames that cover skips, full listens and the edges of the buffer, including remaining == buffer."""
+    generator = random.Random(seed)
+    names = ["Track %d" % number for number in range(5)]
+    sessions = []
+    for _ in range(count):
+        duration = generator.randint(1000, 300000)
+        remaining = generator.choice([0, BUFFER - 1, BUFFER, BUFFER + 1, generator.randint(0, duration)])
+        sessions.append((generator.choice(names), generator.choice(names), duration - remaining, duration))
+    return sessions
+
+
+def _state(name, progress, duration):
+    return PlaybackState(Track(name, "spotify:track:" + name, name, duration), progress, True)
+
+
+def _scalar(sessions):
+    skipped, fully_listened = [], []
+    for previous_name, current_name, progress, duration in sessions:
+        remaining_duration = duration - progress
+        skip = _detect_skipped_track(remaining_duration, BUFFER, _state(current_name, 0, duration),
+                                     _state(previous_name, progress, duration))
+        skipped.append(skip)
+        fully_listened.append(not skip and _detect_fully_listened_track(remaining_duration, BUFFER))
+    return skipped, fully_listened
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    detection.numpy is None, reason="numpy is not installed"))])
+def test_batch_matches_the_scalar_functions(use_numpy):
+    """Every row of the batch gives exactly what the engine's scalar detection gives for that session."""
+    sessions = _sessions(5000)
+
+    skipped, fully_listened = detect_batch(*zip(*sessions), BUFFER, use_numpy=use_numpy)
+
+    assert (list(skipped), list(fully_listened)) == _scalar(sessions)
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    detection.numpy is None, reason="numpy is not installed"))])
+def test_paused_sessions_are_left_undecided(use_numpy):
+    """A session that is paused on this frame is neither skipped nor fully listened."""
+    skipped, fully_listened = detect_batch(["a", "a", "a", "a"], ["b", "b", "a", "a"], [0, 0, 180000, 180000],
+                                           [180000, 180000, 180000, 180000], BUFFER,
+                                           is_playing=[True, False, True, False], use_numpy=use_numpy)
+
+    assert (list(skipped), list(fully_listened)) == ([True, False, False, False], [False, False, True, False])
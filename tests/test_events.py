@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.events`."""
+
+import asyncio
+
+from spotify_playlist_additions.events import DROP_NEWEST, DROP_OLDEST, EventBus, TrackSkipped, TrackStarted
+from spotify_playlist_additions.playback import Track
+
+
+def _track(name):
+    return Track(name, "spotify:track:" + name, name, 1000)
+
+
+class RecordingAddon:
+    """Records the events it handles, taking delay seconds over each one."""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.handled = []
+
+    async def handle_skipped_track(self, track):
+        await asyncio.sleep(self.delay)
+        self.handled.append(("skipped", track.name))
+
+    async def handle_track_start(self, track):
+        await asyncio.sleep(self.delay)
+        self.handled.append(("started", track.name))
+
+
+def test_slow_addon_does_not_hold_up_the_others(run):
+    """Each addon drains its own queue, so a fast addon is done long before a slow one."""
+    fast, slow = RecordingAddon(), RecordingAddon(delay=0.05)
+    bus = EventBus()
+    bus.subscribe(fast)
+    bus.subscribe(slow)
+
+    async def publish():
+        bus.start()
+        for number in range(5):
+            bus.publish(TrackSkipped(_track(str(number))))
+        await asyncio.sleep(0.02)
+        handled_by_slow = len(slow.handled)
+        await bus.close()
+        return handled_by_slow
+
+    assert run(publish()) == 0
+    assert fast.handled == slow.handled == [("skipped", str(number)) for number in range(5)]
+
+
+def test_events_are_prepared_before_they_are_handled(run):
+    """The prepare step runs for each event, in order, before any addon sees it."""
+    addon = RecordingAddon()
+    steps = []
+
+    async def prepare(event):
+        steps.append(("prepared", event.track.name))
+
+    async def handle_skipped_track(track):
+        steps.append(("handled", track.name))
+
+    addon.handle_skipped_track = handle_skipped_track
+    bus = EventBus(prepare=prepare)
+    bus.subscribe(addon)
+
+    async def publish():
+        bus.start()
+        bus.publish(TrackSkipped(_track("a")))
+        bus.publish(TrackSkipped(_track("b")))
+        await bus.close()
+
+    run(publish())
+
+    assert steps.index(("prepared", "a")) < steps.index(("handled", "a"))
+    assert steps.index(("prepared", "b")) < steps.index(("handled", "b"))
+
+
+def test_router_survives_a_failed_delivery(run):
+    """An event that can't be delivered is dropped, but the router keeps going and close still returns."""
+    addon = RecordingAddon()
+    bus = EventBus()
+    bus.subscribe(addon)
+    offer = bus._offer
+
+    def offer_all_but_a(subscription, event):
+        if event.track.name == "a":
+            raise RuntimeError("broken")
+        offer(subscription, event)
+
+    bus._offer = offer_all_but_a
+
+    async def publish():
+        bus.start()
+        bus.publish(TrackSkipped(_track("a")))
+        bus.publish(TrackSkipped(_track("b")))
+        await asyncio.wait_for(bus.close(), 5)
+
+    run(publish())
+
+    assert addon.handled == [("skipped", "b")]
+
+
+def _overflow(run, overflow_policy):
+    addon = RecordingAddon(delay=0.01)
+    bus = EventBus()
+    bus.subscribe(addon, maxsize=2, overflow_policy=overflow_policy)
+
+    async def publish():
+        bus.start()
+        bus.publish(TrackStarted(_track("playing")))
+        # Let the worker pick up the first event, so the rest pile up behind it
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        for name in ("a", "b", "c"):
+            bus.publish(TrackStarted(_track(name)))
+        await bus.close()
+
+    run(publish())
+    return [name for _, name in addon.handled]
+
+
+def test_overflow_drops_the_oldest_event(run):
+    assert _overflow(run, DROP_OLDEST) == ["playing", "b", "c"]
+
+
+def test_overflow_drops_the_newest_event(run):
+    assert _overflow(run, DROP_NEWEST) == ["playing", "a", "b"]
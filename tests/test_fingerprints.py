@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.fingerprints`."""
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.fingerprints import SAVED_TRACKS, FingerprintIndex
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.state import StateStore
+
+
+def _track(name, artist, duration_ms, isrc=None):
+    track = {"name": name, "artists": [{"name": artist}], "duration_ms": duration_ms}
+    if isrc:
+        track["external_ids"] = {"isrc": isrc}
+    return track
+
+
+class LibrarySpotify:
+    """A client that serves a library of playlists and saved tracks, and counts the pages it serves."""
+    def __init__(self):
+        self.playlists = {"a": ("snapshot-a", [_track("Song", "Band", 200000, "GBAAA0000001")])}
+        self.saved = [_track("Other", "Singer", 180000)]
+        self.pages = []
+
+    def current_user_playlists(self, limit, offset):
+        items = [{"id": playlist_id, "snapshot_id": snapshot_id}
+                 for playlist_id, (snapshot_id, _) in self.playlists.items()]
+        return {"items": items[offset:offset + limit], "total": len(items)}
+
+    def playlist_tracks(self, playlist_id, fields=None, offset=0, limit=100):
+        self.pages.append(playlist_id)
+        tracks = self.playlists[playlist_id][1]
+        return {"items": [{"track": track} for track in tracks[offset:offset + limit]], "total": len(tracks)}
+
+    def current_user_saved_tracks(self, limit, offset=0):
+        self.pages.append(SAVED_TRACKS)
+        items = [{"added_at": "2020-09-0%dT00:00:00Z" % (index + 1), "track": track}
+                 for index, track in enumerate(self.saved)]
+        return {"items": items[offset:offset + limit], "total": len(items)}
+
+
+def test_other_releases_are_recognised():
+    """A shared ISRC, or the same normalised title, artist and length, is the same recording. A shared title alone is
+    not."""
+    index = FingerprintIndex()
+    index.replace_source("playlist", "1", [_track("Song", "Band", 200000, "GBAAA0000001"),
+                                           _track("Tune (feat. Guest)", "Singer", 181000)])
+
+    assert index.contains(_track("Song - Single Version", "Band", 199000, "gbaaa0000001"))
+    assert index.contains(Track("id", "uri", "Song - 2011 Remaster", 201100, isrc="GBAAA1100001", artist="Band"))
+    assert index.contains(_track("TUNE", "Singer", 180900))
+    assert not index.contains(_track("Song", "Another Band", 200000))
+    assert not index.contains(_track("Song", "Band", 260000, "USBBB0000001"))
+
+
+def test_refresh_only_reads_what_changed(run, tmp_path):
+    """A restored index only downloads the sources whose version changed, and forgets playlists that are gone."""
+    spotify = LibrarySpotify()
+    index = FingerprintIndex()
+    run(index.refresh(AsyncSpotify(spotify)))
+    assert index.contains(_track("Other", "Singer", 180000))
+
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    index.save(store)
+    restored = FingerprintIndex()
+    assert restored.restore(store)
+    assert len(restored) == len(index)
+
+    spotify.pages.clear()
+    spotify.playlists["b"] = ("snapshot-b", [_track("New", "Band", 100000)])
+    run(restored.refresh(AsyncSpotify(spotify)))
+    assert spotify.pages == ["b", SAVED_TRACKS]
+
+    del spotify.playlists["a"]
+    run(restored.refresh(AsyncSpotify(spotify)))
+    assert not restored.contains(_track("Song", "Band", 200000, "GBAAA0000001"))
+    assert restored.contains(_track("New", "Band", 100000))
+
+
+def test_added_tracks_are_kept_until_refreshed(run):
+    """Tracks added between refreshes are recognised right away."""
+    index = FingerprintIndex()
+    index.add(_track("Fresh", "Band", 150000))
+    assert index.contains(_track("Fresh", "Band", 150000))
+
+    spotify = LibrarySpotify()
+    spotify.playlists["a"][1].append(_track("Fresh", "Band", 150000))
+    run(index.refresh(AsyncSpotify(spotify)))
+    assert index.contains(_track("Fresh", "Band", 150000))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.host`."""
+
+import json
+import sqlite3
+
+import pytest
+
+from spotify_playlist_additions.host import EngineHost
+from spotify_playlist_additions.simulation.harness import run_host_simulation
+from spotify_playlist_additions.simulation.trace import ListeningTrace, TracePlay, make_track
+
+
+def test_from_config_adds_a_session_per_user(tmp_path, monkeypatch):
+    """Each session gets its own playlists and token cache, and every client shares the host's pools."""
+    monkeypatch.setenv("SPOTIPY_CLIENT_ID", "client")
+    monkeypatch.setenv("SPOTIPY_CLIENT_SECRET", "secret")
+    config = tmp_path / "host.json"
+    config.write_text(
+        json.dumps({"sessions": [
+            {"name": "alice", "playlists": ["playlist1", "playlist2"]},
+            {"name": "bob", "playlists": ["playlist3"]},
+        ]}))
+
+    host = EngineHost.from_config(str(config))
+
+    assert sorted(host.engines) == ["alice", "bob"]
+    assert [playlist["id"] for playlist in host.engines["alice"].playlists] == ["playlist1", "playlist2"]
+    assert (tmp_path / "state" / "bob.sqlite3").exists()
+    host.close()
+
+
+class FailingEngine:
+    """Fails to start, recording whether it was stopped afterwards."""
+    def __init__(self):
+        self.stopped = False
+
+    async def start(self):
+        raise ConnectionError("connection refused")
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_sessions_release_what_they_hold(run, tmp_path, monkeypatch):
+    """A removed session closes its state store, and a session that fails to start is stopped."""
+    monkeypatch.setenv("SPOTIPY_CLIENT_ID", "client")
+    monkeypatch.setenv("SPOTIPY_CLIENT_SECRET", "secret")
+    config = tmp_path / "host.json"
+    config.write_text(json.dumps({"sessions": [{"name": "alice", "playlists": ["playlist1"]}]}))
+    host = EngineHost.from_config(str(config))
+    state_store = host._state_stores["alice"]
+
+    run(host.remove_session("alice"))
+    with pytest.raises(sqlite3.ProgrammingError):
+        state_store.get("playlists")
+
+    engine = FailingEngine()
+    run(EngineHost._run_session("bob", engine))
+    assert engine.stopped
+    host.close()
+
+
+def test_sessions_run_side_by_side(run):
+    """Every user replaying the trace in one host has every one of their events detected."""
+    trace = ListeningTrace([
+        TracePlay(make_track(1, 12000), 12000),
+        TracePlay(make_track(2, 12000), 5000),
+        TracePlay(make_track(3, 12000), 12000),
+    ])
+
+    report = run(run_host_simulation(trace, users=3, speed=10, max_workers=4))
+
+    assert report.expected == 6
+    assert report.detected == 6
+    assert report.requests["GET /v1/me"] == 3
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.listening_log`."""
+
+import os
+import time
+
+import pytest
+
+from spotify_playlist_additions.listening_log import ListeningLog
+from spotify_playlist_additions.playback import Track
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlists.autoremove import AutoRemovePlaylist
+
+DAY = 24 * 3600
+TRACK_ID = "4uLU6hMCjMI75M1A2tKUQC"
+
+
+def _segments(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(".log"))
+
+
+def test_counters_decay(tmp_path):
+    """Every event counts half as much every half life, and tracks without an ID are not logged."""
+    log = ListeningLog(str(tmp_path), half_life=DAY)
+    now = time.time()
+    log.record_skip(TRACK_ID, at=now - DAY)
+    log.record_skip(TRACK_ID, at=now)
+    log.record_full_listen(TRACK_ID, at=now)
+    log.record_skip(None)
+
+    assert log.skips(TRACK_ID, at=now) == pytest.approx(1.5)
+    assert log.skips(TRACK_ID, at=now + DAY) == pytest.approx(0.75)
+    assert log.full_listens(TRACK_ID, at=now) == pytest.approx(1)
+    assert log.skips("unknown") == 0
+    assert len(log) == 1
+
+
+def test_counters_rebuilt_from_the_log(tmp_path):
+    """Reopening the log replays it, ignoring a record that was only partly written."""
+    log = ListeningLog(str(tmp_path), half_life=DAY)
+    now = time.time()
+    log.record_skip(TRACK_ID, at=now - DAY)
+    log.record_skip(TRACK_ID, at=now)
+    log.close()
+    with open(os.path.join(str(tmp_path), _segments(str(tmp_path))[-1]), "ab") as segment:
+        segment.write(b"\x01\x02\x03")
+
+    reopened = ListeningLog(str(tmp_path), half_life=DAY)
+
+    # Events are logged to the second
+    assert reopened.skips(TRACK_ID, at=now) == pytest.approx(1.5, rel=1e-4)
+    reopened.record_skip(TRACK_ID, at=now)
+    assert reopened.skips(TRACK_ID, at=now) == pytest.approx(2.5, rel=1e-4)
+
+
+def test_rotated_and_compacted(tmp_path):
+    """The log keeps at most max_segments segments, and the checkpoint of the counters it compacts them into is
+    restored along with the segments written after it. Counters that decayed to nothing are dropped."""
+    log = ListeningLog(str(tmp_path), half_life=DAY, max_segment_bytes=100, max_segments=3)
+    now = time.time()
+    log.record_skip("forgotten", at=now - 30 * DAY)
+    for number in range(40):
+        log.record_skip(TRACK_ID if number % 2 else "other", at=now)
+
+    assert len(_segments(str(tmp_path))) <= 3
+    assert os.path.exists(os.path.join(str(tmp_path), "counters.bin"))
+    assert log.skips("forgotten") == 0
+    log.close()
+
+    reopened = ListeningLog(str(tmp_path), half_life=DAY, max_segment_bytes=100, max_segments=3)
+    assert reopened.skips(TRACK_ID, at=now) == pytest.approx(20, rel=1e-3)
+    assert reopened.skips("other", at=now) == pytest.approx(20, rel=1e-3)
+    assert len(reopened) == 2
+
+
+def test_autoremove_waits_for_the_skip_threshold(run, tmp_path):
+    """With a listening log, a track is removed once it has been skipped skip_threshold times lately."""
+    playlist = {"id": "playlist", "name": "Playlist"}
+    index = PlaylistIndex(None, playlist)
+    index.update([{"id": TRACK_ID, "uri": "spotify:track:" + TRACK_ID}])
+    log = ListeningLog(str(tmp_path))
+    removed = []
+
+    class RecordingMutations:
+        def remove(self, track):
+            removed.append(track.id)
+
+    addon = AutoRemovePlaylist(None, playlist, "user", index, RecordingMutations(), listening_log=log)
+    track = Track(TRACK_ID, "spotify:track:" + TRACK_ID, "Track", 200000)
+
+    async def skip():
+        log.record_skip(track.id)
+        await addon.handle_skipped_track(track)
+
+    for _ in range(addon.skip_threshold):
+        assert removed == []
+        run(skip())
+
+    assert removed == [TRACK_ID]
+
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.metadata`."""
+
+import asyncio
+
+import pytest
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.metadata import MetadataService
+
+
+class BatchSpotify:
+    """Serves the batch endpoints and records every request."""
+    def __init__(self):
+        self.requests = []
+        self.fail = False
+
+    def artists(self, artist_ids):
+        self.requests.append(("artists", list(artist_ids)))
+        if self.fail:
+            raise ConnectionError("offline")
+        return {"artists": [{"id": artist_id, "genres": ["genre"]} if artist_id != "unknown" else None
+                            for artist_id in artist_ids]}
+
+    def audio_features(self, track_ids):
+        self.requests.append(("audio_features", list(track_ids)))
+        return [{"id": track_id, "energy": 0.5} for track_id in track_ids]
+
+
+def test_concurrent_lookups_share_requests(run):
+    """Lookups made together go out as one batch request, and an ID that is being fetched is fetched only once."""
+    spotify = BatchSpotify()
+    client = AsyncSpotify(spotify)
+
+    async def lookup():
+        artists = await asyncio.gather(*[client.metadata.artist(artist_id)
+                                         for artist_id in ["a", "b", "a", "unknown", "b"]])
+        features = await client.metadata.audio_features("track")
+        return artists, features
+
+    artists, features = run(lookup())
+
+    assert [artist and artist["id"] for artist in artists] == ["a", "b", "a", None, "b"]
+    assert features["energy"] == 0.5
+    assert spotify.requests == [("artists", ["a", "b", "unknown"]), ("audio_features", ["track"])]
+
+    run(client.metadata.artist("unknown"))
+    assert len(spotify.requests) == 2
+
+
+def test_large_lookups_are_split_into_full_batches(run):
+    """No batch is larger than its endpoint allows."""
+    spotify = BatchSpotify()
+    client = AsyncSpotify(spotify)
+
+    async def lookup():
+        return await asyncio.gather(*[client.metadata.artist(str(number)) for number in range(120)])
+
+    assert len(run(lookup())) == 120
+    assert [len(artist_ids) for _, artist_ids in spotify.requests] == [50, 50, 20]
+
+
+def test_cache_is_bounded_and_expires(run):
+    """The least recently used results are evicted once the cache is over its size, and results expire."""
+    spotify = BatchSpotify()
+    client = AsyncSpotify(spotify)
+    metadata = MetadataService(client, ttl=60, max_bytes=70, batch_delay=0)
+
+    run(metadata.artist("a"))
+    run(metadata.artist("b"))
+    run(metadata.artist("a"))
+    run(metadata.artist("c"))
+
+    assert len(metadata) == 2
+    assert metadata.cached_bytes <= 70
+    run(metadata.artist("a"))
+    run(metadata.artist("b"))
+    assert [artist_ids for _, artist_ids in spotify.requests] == [["a"], ["b"], ["c"], ["b"]]
+
+    expired = MetadataService(client, ttl=0, batch_delay=0)
+    run(expired.artist("a"))
+    run(expired.artist("a"))
+    assert spotify.requests[-2:] == [("artists", ["a"]), ("artists", ["a"])]
+
+
+def test_failed_lookups_are_not_cached(run):
+    """Everyone waiting for a failed batch sees the error, and the next lookup tries again."""
+    spotify = BatchSpotify()
+    spotify.fail = True
+    client = AsyncSpotify(spotify, max_retries=0)
+
+    async def lookup():
+        return await asyncio.gather(client.metadata.artist("a"), client.metadata.artist("a"), return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in run(lookup()))
+
+    spotify.fail = False
+    assert run(client.metadata.artist("a"))["id"] == "a"
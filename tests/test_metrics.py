@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.metrics`."""
+
+import asyncio
+
+from spotipy import SpotifyException
+
+from spotify_playlist_additions import metrics
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.metrics import Counter, Histogram, Registry, start_metrics_server
+
+
+def test_renders_the_prometheus_text_format():
+    """Histogram buckets are cumulative and end with +Inf, and label values are escaped."""
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency", ("endpoint", ), buckets=(0.1, 1)))
+    errors = registry.register(Counter("errors_total", "Errors", ("endpoint", )))
+
+    child = latency.labels("me")
+    child.observe(0.05)
+    child.observe(0.5)
+    child.observe(5)
+    errors.labels('say "hi"').inc()
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{endpoint="me",le="0.1"} 1',
+        'latency_seconds_bucket{endpoint="me",le="1.0"} 2',
+        'latency_seconds_bucket{endpoint="me",le="+Inf"} 3',
+        'latency_seconds_sum{endpoint="me"} 5.55',
+        'latency_seconds_count{endpoint="me"} 3',
+        "# HELP errors_total Errors",
+        "# TYPE errors_total counter",
+        'errors_total{endpoint="say \\"hi\\""} 1.0',
+    ]
+
+
+def test_children_are_created_once():
+    """The same child is handed out for the same label values, so callers can keep it."""
+    errors = Counter("errors_total", "Errors", ("endpoint", "kind"))
+
+    assert errors.labels("me", "timeout") is errors.labels("me", "timeout")
+    assert errors.labels("me", "timeout") is not errors.labels("me", "rate_limited")
+
+
+class RateLimitedOnceSpotify:
+    """A client that is rate limited on its first request."""
+    def __init__(self):
+        self.calls = 0
+
+    def current_user(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise SpotifyException(429, -1, "Too many requests", headers={"Retry-After": "0"})
+        return {"id": "user"}
+
+
+def test_client_records_requests_and_rate_limits(run):
+    """Every attempt is timed, and the 429 is counted against the endpoint it happened on."""
+    requests = metrics.SPOTIFY_REQUEST_SECONDS.labels("current_user")
+    rate_limited = metrics.SPOTIFY_ERRORS.labels("current_user", "rate_limited")
+    requests_before, rate_limited_before = sum(requests.counts), rate_limited.value
+
+    client = AsyncSpotify(RateLimitedOnceSpotify())
+    assert run(client.current_user()) == {"id": "user"}
+    client.close()
+
+    assert sum(requests.counts) - requests_before == 2
+    assert rate_limited.value - rate_limited_before == 1
+
+
+def test_serves_metrics_over_http(run):
+    """Any GET is answered with the rendered registry."""
+    registry = Registry()
+    registry.register(Counter("polls_total", "Polls")).labels().inc()
+
+    async def scrape():
+        server = await start_metrics_server(0, registry=registry)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    response = run(scrape())
+
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert response.endswith(b"polls_total 1.0\n")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.mutations`."""
+
+import asyncio
+
+import pytest
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.mutations import PlaylistMutationQueue
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.rate_limit import CircuitOpenError
+
+
+class RecordingSpotify:
+    """Records the playlist mutations that are sent."""
+    def __init__(self):
+        self.adds = []
+        self.removes = []
+        self.snapshot_id = "snapshot-1"
+        self.tracks = [_track(0)]
+
+    def playlist(self, playlist_id, fields=None):
+        return {"snapshot_id": self.snapshot_id}
+
+    def playlist_tracks(self, playlist_id, fields=None, offset=0, limit=100):
+        return {"items": [{"track": track} for track in self.tracks[offset:offset + limit]], "total": len(self.tracks)}
+
+    def user_playlist_add_tracks(self, user_id, playlist_id, tracks):
+        self.adds.append(tracks)
+        self.snapshot_id = "add-%d" % len(self.adds)
+        return {"snapshot_id": self.snapshot_id}
+
+    def user_playlist_remove_all_occurrences_of_tracks(self, user_id, playlist_id, tracks):
+        self.removes.append(tracks)
+        self.snapshot_id = "remove-%d" % len(self.removes)
+        return {"snapshot_id": self.snapshot_id}
+
+
+def _track(number):
+    return {"id": "id%d" % number, "uri": "spotify:track:id%d" % number}
+
+
+@pytest.fixture
+def queue(run):
+    """A queue for a playlist that already contains track 0, with a very short flush delay."""
+    client = AsyncSpotify(RecordingSpotify())
+    index = PlaylistIndex(client, {"id": "playlist", "name": "Playlist"})
+    index.add(_track(0))
+    index.snapshot_id = "snapshot-1"
+
+    async def create():
+        return PlaylistMutationQueue(client, "user", {"id": "playlist", "name": "Playlist"}, index, flush_delay=0.05)
+
+    return run(create())
+
+
+def test_operations_are_batched(run, queue):
+    """Many queued adds are sent as batches of at most 100 tracks."""
+    for number in range(1, 151):
+        queue.add(_track(number))
+    run(queue.close())
+
+    adds = queue._spotify_client.sync.adds
+    assert [len(batch) for batch in adds] == [100, 50]
+    assert queue._playlist_index.snapshot_id == "add-2"
+
+
+def test_edit_by_another_client_is_planned_on(run, queue):
+    """If another client edited the playlist since the last resync, the changes are worked out against its edit
+    rather than overwriting it, and only what still changes the playlist is sent."""
+    spotify = queue._spotify_client.sync
+    spotify.snapshot_id = "edited-elsewhere"
+    spotify.tracks = [_track(1), _track(2)]
+
+    queue.add(_track(1))
+    queue.remove(_track(3))
+    queue.add(_track(4))
+    run(queue.close())
+
+    assert spotify.adds == [[_track(4)["uri"]]]
+    assert spotify.removes == []
+    assert queue._playlist_index.snapshot_id == "add-1"
+    assert not queue._playlist_index.contains(_track(0))
+    assert queue._playlist_index.contains(_track(2))
+
+
+def test_dry_run_prints_the_plan(run, queue, capsys):
+    """A dry run prints what it would send without sending it."""
+    queue._dry_run = True
+    queue.add(_track(1))
+    queue.remove(_track(0))
+    queue.remove(_track(2))
+    run(queue.close())
+
+    assert queue._spotify_client.sync.adds == []
+    assert queue._spotify_client.sync.removes == []
+    assert capsys.readouterr().out.splitlines() == [
+        "1 adds and 1 removes to Playlist at snapshot snapshot-1", "  - spotify:track:id0", "  + spotify:track:id1"
+    ]
+
+
+def test_contradicting_operations_cancel_out(run, queue):
+    """Adding and then removing a track, or the reverse, sends nothing."""
+    queue.add(_track(1))
+    queue.remove(_track(1))
+    queue.remove(_track(0))
+    queue.add(_track(0))
+    run(queue.close())
+
+    assert queue._spotify_client.sync.adds == []
+    assert queue._spotify_client.sync.removes == []
+    assert queue._playlist_index.contains(_track(0))
+    assert not queue._playlist_index.contains(_track(1))
+
+
+def test_index_is_updated_when_queued(queue):
+    """Addons see the playlist as it will be once the queue is flushed."""
+    queue.add(_track(1))
+    queue.remove(_track(0))
+
+    assert queue._playlist_index.contains(_track(1))
+    assert not queue._playlist_index.contains(_track(0))
+
+
+def test_flushes_after_the_debounce_delay(run, queue):
+    """Queued operations are sent on their own once the queue has been quiet for flush_delay."""
+    async def remove_and_wait():
+        queue.remove(_track(0))
+        await asyncio.sleep(0.2)
+
+    run(remove_and_wait())
+
+    assert queue._spotify_client.sync.removes == [["spotify:track:id0"]]
+    assert len(queue) == 0
+
+
+def test_failed_flush_is_retried(run, queue):
+    """Changes that fail to send are kept and sent once the API recovers, instead of being lost."""
+    client = queue._spotify_client.sync
+    add_tracks = client.user_playlist_add_tracks
+    failures = []
+
+    def fail_once(user_id, playlist_id, tracks):
+        if not failures:
+            failures.append(tracks)
+            raise CircuitOpenError(0.05)
+        return add_tracks(user_id, playlist_id, tracks)
+
+    client.user_playlist_add_tracks = fail_once
+
+    async def add_and_wait():
+        queue.add(_track(1))
+        await queue.flush()
+        assert len(queue) == 1
+        queue.remove(_track(0))
+        await asyncio.sleep(0.3)
+
+    run(add_and_wait())
+
+    assert failures == [["spotify:track:id1"]]
+    assert client.adds == [["spotify:track:id1"]]
+    assert client.removes == [["spotify:track:id0"]]
+    assert len(queue) == 0
+    assert queue._playlist_index.snapshot_id == "add-1"
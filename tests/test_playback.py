@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.playback`."""
+
+from spotify_playlist_additions.playback import PlaybackState, Track, track_keys
+
+PAYLOAD = {
+    "is_playing": True,
+    "progress_ms": 1000,
+    "context": {"uri": "spotify:playlist:playlist"},
+    "item": {
+        "id": "id1",
+        "uri": "spotify:track:id1",
+        "name": "Track",
+        "duration_ms": 180000,
+        "available_markets": ["AU", "NZ"],
+    },
+}
+
+
+def test_nothing_playing_parses_to_none():
+    """Neither an empty response nor a response without a track is a playback state."""
+    assert PlaybackState.from_api(None) is None
+    assert PlaybackState.from_api({"is_playing": False, "progress_ms": 0, "item": None}) is None
+
+
+def test_parses_only_what_the_engine_uses():
+    """The raw payload is dropped unless it is asked for."""
+    state = PlaybackState.from_api(PAYLOAD)
+
+    assert (state.track.id, state.track.uri, state.track.name) == ("id1", "spotify:track:id1", "Track")
+    assert (state.progress_ms, state.is_playing, state.remaining_ms) == (1000, True, 179000)
+    assert state.track.raw is None
+    assert PlaybackState.from_api(PAYLOAD, keep_raw=True).track.raw is PAYLOAD
+
+
+def test_round_trips_through_a_dict():
+    """What to_dict gives parses back into the same playback state."""
+    state = PlaybackState.from_api(PlaybackState.from_api(PAYLOAD).to_dict())
+
+    assert state.to_dict() == {
+        "is_playing": True,
+        "progress_ms": 1000,
+        "item": {"id": "id1", "uri": "spotify:track:id1", "name": "Track", "duration_ms": 180000}
+    }
+
+
+def test_track_keys_reads_tracks_and_dicts_alike():
+    """The index and mutation queue accept a Track or a track from the API."""
+    assert track_keys(Track(None, "spotify:local:song", "Song", 1000)) == (None, "spotify:local:song")
+    assert track_keys(PAYLOAD["item"]) == ("id1", "spotify:track:id1")
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.playlist_diff`."""
+
+from collections import OrderedDict
+
+from spotify_playlist_additions.playlist_diff import diff
+
+
+def test_only_changes_are_planned():
+    """Tracks that are already where they should be cost nothing, the rest keep the order they were given in."""
+    desired = OrderedDict([("b", True), ("a", False), ("c", True), ("d", False), ("e", True)])
+
+    plan = diff(desired, {"a", "c", "x"}, "snapshot-1")
+
+    assert plan.adds == ["b", "e"]
+    assert plan.removes == ["a"]
+    assert plan.snapshot_id == "snapshot-1"
+    assert len(plan) == 3
+    assert not diff({"c": True, "d": False}, {"c"})
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.playlist_index`."""
+
+import pytest
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+
+
+class StubSpotify:
+    """Serves the pages of a single in-memory playlist, counting the requests made."""
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.snapshot_id = "snapshot-1"
+        self.requests = 0
+
+    def playlist(self, playlist_id, fields=None):
+        self.requests += 1
+        return {"snapshot_id": self.snapshot_id}
+
+    def playlist_tracks(self, playlist_id, fields=None, offset=0, limit=100):
+        self.requests += 1
+        items = [{"track": track} for track in self.tracks[offset:offset + limit]]
+        return {"items": items, "total": len(self.tracks)}
+
+
+def _track(number):
+    return {"id": "id%d" % number, "uri": "spotify:track:id%d" % number}
+
+
+@pytest.fixture
+def index(run):
+    """An index of a playlist that holds 250 tracks."""
+    client = StubSpotify([_track(number) for number in range(250)])
+    playlist_index = PlaylistIndex(AsyncSpotify(client), {"id": "playlist", "name": "Playlist"})
+    run(playlist_index.load())
+    return playlist_index
+
+
+def test_load_pages_through_playlist(index):
+    """Every page is requested once, and every track ends up in the index."""
+    assert index._spotify_client.sync.requests == 4
+    assert len(index) == 250
+    assert index.contains(_track(0))
+    assert index.contains(_track(249))
+    assert not index.contains(_track(250))
+
+
+def test_contains_makes_no_requests(index):
+    """Membership checks are answered from memory."""
+    index.contains(_track(10))
+    assert index._spotify_client.sync.requests == 4
+
+
+def test_contains_matches_on_uri(index):
+    """Local files have no ID, so the URI alone has to be enough."""
+    index.add({"id": None, "uri": "spotify:local:a:b:c:1"})
+    assert index.contains({"id": None, "uri": "spotify:local:a:b:c:1"})
+
+
+def test_add_and_discard(index):
+    """The index tracks mutations made by the addons."""
+    index.add(_track(300))
+    assert index.contains(_track(300))
+
+    index.discard(_track(0))
+    assert not index.contains(_track(0))
+
+
+def test_resync_unchanged_playlist(run, index):
+    """An unchanged snapshot_id costs a single request and keeps the index as is."""
+    assert not run(index.resync())
+    assert index._spotify_client.sync.requests == 5
+
+
+def test_resync_changed_playlist(run, index):
+    """A new snapshot_id downloads the playlist again."""
+    client = index._spotify_client.sync
+    client.tracks = client.tracks[:10]
+    client.snapshot_id = "snapshot-2"
+
+    assert run(index.resync())
+    assert index.snapshot_id == "snapshot-2"
+    assert len(index) == 10
+
+
+def test_own_mutation_does_not_trigger_resync(run, index):
+    """The snapshot_id returned by a mutation is adopted by the index."""
+    index._spotify_client.sync.snapshot_id = "snapshot-2"
+    index.add(_track(300))
+    index.snapshot_id = "snapshot-2"
+
+    assert not run(index.resync())
+    assert index.contains(_track(300))
+
+
+def test_invalidate_forces_a_download(run, index):
+    """An invalidated index is downloaded again even though the playlist has not changed."""
+    index.invalidate()
+    assert run(index.resync())
+
+
+def test_failed_load_keeps_the_previous_contents(run, index):
+    """The index is swapped in whole once every page has loaded, never left half empty."""
+    client = index._spotify_client.sync
+    client.snapshot_id = "snapshot-2"
+    playlist_tracks = client.playlist_tracks
+
+    def fail_on_second_page(playlist_id, fields=None, offset=0, limit=100):
+        if offset:
+            raise ConnectionError("connection reset")
+        return playlist_tracks(playlist_id, fields=fields, offset=offset, limit=limit)
+
+    client.playlist_tracks = fail_on_second_page
+
+    with pytest.raises(ConnectionError):
+        run(index.resync())
+    assert len(index) == 250
+    assert index.snapshot_id == "snapshot-1"
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.playlist_loader`."""
+
+import threading
+import time
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playlist_loader import iter_playlist_tracks
+
+
+class SlowSpotify:
+    """Serves numbered playlist items, taking a while to answer each page and recording the concurrency reached."""
+    def __init__(self, total):
+        self.total = total
+        self.offsets = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def playlist_tracks(self, playlist_id, fields=None, offset=0, limit=100):
+        with self._lock:
+            self.offsets.append(offset)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(0.01)
+
+        with self._lock:
+            self.in_flight -= 1
+        items = [{"track": {"id": str(number)}} for number in range(offset, min(offset + limit, self.total))]
+        return {"items": items, "total": self.total}
+
+
+async def _collect(iterator, stop_at=None):
+    items = []
+    async for item in iterator:
+        items.append(item["track"]["id"])
+        if item["track"]["id"] == stop_at:
+            break
+    return items
+
+
+def test_items_are_yielded_in_order(run):
+    """Pages may complete out of order, but the items come back in playlist order."""
+    client = SlowSpotify(1050)
+    items = run(_collect(iter_playlist_tracks(AsyncSpotify(client), "playlist", max_in_flight=4)))
+
+    assert items == [str(number) for number in range(1050)]
+    assert sorted(client.offsets) == list(range(0, 1100, 100))
+
+
+def test_requests_in_flight_are_bounded(run):
+    """No more than max_in_flight pages are requested at once."""
+    client = SlowSpotify(2000)
+    run(_collect(iter_playlist_tracks(AsyncSpotify(client), "playlist", max_in_flight=3)))
+
+    assert 1 < client.max_in_flight <= 3
+
+
+def test_stopping_early_skips_remaining_pages(run):
+    """A caller that finds what it was looking for does not pay for the rest of the playlist."""
+    client = SlowSpotify(5000)
+    iterator = iter_playlist_tracks(AsyncSpotify(client), "playlist", max_in_flight=2)
+    items = run(_collect(iterator, stop_at="150"))
+    run(iterator.aclose())
+
+    assert items[-1] == "150"
+    assert len(client.offsets) <= 4
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.playlist_picker`."""
+
+import pytest
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playlist_picker import (choose_playlist, list_playlists, parse_playlist_id,
+                                                        resolve_playlist)
+from spotify_playlist_additions.state import StateStore
+
+PLAYLIST_ID = "37i9dQZF1DXcBWIGoYBM5M"
+
+
+class PlaylistsSpotify:
+    """Serves a user with many playlists and records the offsets of the pages asked for."""
+    def __init__(self, amount):
+        self.playlists = [{"id": "%022d" % number, "name": "Playlist %d" % number, "snapshot_id": "s%d" % number}
+                          for number in range(amount)]
+        self.offsets = []
+
+    def current_user_playlists(self, limit, offset):
+        self.offsets.append(offset)
+        return {"items": self.playlists[offset:offset + limit], "total": len(self.playlists)}
+
+
+@pytest.fixture
+def state_store(tmp_path):
+    return StateStore(str(tmp_path / "state.sqlite3"))
+
+
+def test_playlist_ids_parsed():
+    """IDs, URIs and links are recognised, names are not."""
+    assert parse_playlist_id(PLAYLIST_ID) == PLAYLIST_ID
+    assert parse_playlist_id("spotify:playlist:" + PLAYLIST_ID) == PLAYLIST_ID
+    assert parse_playlist_id("https://open.spotify.com/playlist/%s?si=abc" % PLAYLIST_ID) == PLAYLIST_ID
+    assert parse_playlist_id("Discover Weekly") is None
+
+
+def test_every_page_listed_and_cached(run, state_store):
+    """Every page is listed, each playlist handed on as it arrives, and the listing is reused while it is recent."""
+    spotify = PlaylistsSpotify(120)
+    shown = []
+
+    playlists = run(list_playlists(AsyncSpotify(spotify), state_store, lambda position, playlist: shown.append(
+        (position, playlist["name"]))))
+
+    assert len(playlists) == 120
+    assert shown[-1] == (119, "Playlist 119")
+    assert sorted(spotify.offsets) == [0, 50, 100]
+
+    answers = iter(["nothing", "playlist 7"])
+    chosen = run(choose_playlist(AsyncSpotify(spotify), state_store, prompt=lambda _: next(answers)))
+    assert chosen["id"] == "%022d" % 7
+    assert len(spotify.offsets) == 3
+
+
+def test_playlists_resolved_without_asking(run, state_store):
+    """A name is looked up in the listing, an ID is used as it is."""
+    spotify = PlaylistsSpotify(60)
+    client = AsyncSpotify(spotify)
+
+    assert run(resolve_playlist(client, PLAYLIST_ID, state_store)) == {"id": PLAYLIST_ID}
+    assert spotify.offsets == []
+    assert run(resolve_playlist(client, "Playlist 55", state_store))["id"] == "%022d" % 55
+    assert run(resolve_playlist(client, "spotify:playlist:%022d" % 3, state_store))["name"] == "Playlist 3"
+    with pytest.raises(ValueError):
+        run(resolve_playlist(client, "Missing", state_store))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.profiling`."""
+
+import os
+import pstats
+import sys
+import tracemalloc
+
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.profiling import Profiler, retained_sizes
+
+
+class _Addon:
+    def __init__(self, size):
+        self.tracks = ["track %d" % number for number in range(size)]
+
+
+class _Engine:
+    def __init__(self, *addons):
+        self.addons = list(addons)
+
+
+def test_retained_sizes():
+    """What only one object reaches counts towards it, what several reach is shared, and classes are not followed."""
+    shared = ["shared"] * 1000
+    small, large = _Addon(10), _Addon(1000)
+    small.shared = large.shared = shared
+
+    sizes = retained_sizes({"small": small, "large": large})
+
+    assert sizes["large"] > sizes["small"] > 0
+    assert sizes["shared"] >= sys.getsizeof(shared)
+    assert sizes["large"] < sys.getsizeof(shared) + sum(map(sys.getsizeof, large.tracks)) * 2
+
+
+def test_profiler_writes_captures(run, tmp_path):
+    """A capture covers frames frames out of every sample_every, starting with the first frame after start."""
+    profiler = Profiler(str(tmp_path), frames=2, sample_every=4, snapshot_interval=None)
+
+    async def profile():
+        profiler.frame_started()  # Ignored until started
+        profiler.frame_finished()
+        profiler.start()
+        for _ in range(7):
+            profiler.frame_started()
+            sum(range(1000))
+            profiler.frame_finished()
+        await profiler.stop()
+
+    run(profile())
+
+    assert sorted(os.listdir(str(tmp_path))) == ["frames-0-1.prof", "frames-4-5.prof", "slow_callbacks.log"]
+    assert pstats.Stats(str(tmp_path / "frames-0-1.prof")).total_calls > 0
+
+
+def test_profiler_writes_snapshots(run, tmp_path):
+    """Every snapshot is written along with a report of every watched session and addon, and stopping takes a last
+    one."""
+    profiler = Profiler(str(tmp_path), snapshot_interval=3600)
+    playlist = {"id": "playlist", "name": "Profiled"}
+    index = PlaylistIndex(None, playlist)
+    index.update({"id": "id%d" % number, "uri": "spotify:track:id%d" % number} for number in range(100))
+
+    async def profile():
+        profiler.start()
+        profiler.watch("user", _Engine(AutoAddPlaylist(None, playlist, "user", index, None)))
+        profiler.snapshot()
+        await profiler.stop()
+
+    run(profile())
+
+    assert not tracemalloc.is_tracing()
+    assert sorted(os.listdir(str(tmp_path))) == ["memory-1.snapshot", "memory-1.txt", "memory-2.snapshot",
+                                                 "memory-2.txt", "slow_callbacks.log"]
+    tracemalloc.Snapshot.load(str(tmp_path / "memory-2.snapshot"))
+
+    report = (tmp_path / "memory-2.txt").read_text()
+    assert "Largest growth by line since memory-1:" in report
+    assert "AutoAddPlaylist:" in report
+    assert "user:" in report
+    assert "user AutoAddPlaylist 0:" in report
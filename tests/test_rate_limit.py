@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.rate_limit` and the retry behaviour of the async client."""
+
+import time
+
+import pytest
+import requests
+from spotipy import SpotifyException
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.rate_limit import CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+class FlakySpotify:
+    """Raises the queued errors one call at a time, then succeeds."""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def currently_playing(self):
+        self.calls.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"is_playing": True}
+
+
+def test_token_bucket_limits_the_rate(run):
+    """Once the burst capacity is used up, requests are spread out at the configured rate."""
+    bucket = TokenBucket(rate=100, capacity=5)
+
+    async def acquire_many():
+        for _ in range(15):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    run(acquire_many())
+    assert time.monotonic() - started >= 0.09
+
+
+def test_circuit_breaker_opens_after_repeated_failures():
+    """Requests are refused once the failure threshold is reached, and allowed again after a success."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.check()
+
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.check()
+    assert 29 < error.value.retry_after <= 30
+
+    breaker.record_success()
+    breaker.check()
+
+
+def test_retry_after_is_honoured(run):
+    """A 429 pauses requests for as long as Spotify asked before retrying."""
+    spotify = FlakySpotify(SpotifyException(429, -1, "Too many requests", headers={"Retry-After": "0.2"}))
+    client = AsyncSpotify(spotify)
+
+    assert run(client.currently_playing()) == {"is_playing": True}
+    assert spotify.calls[1] - spotify.calls[0] >= 0.2
+
+
+def test_timeouts_are_retried_then_raised(run):
+    """Timeouts are retried with a backoff, and raised once the retries are used up."""
+    spotify = FlakySpotify(*[requests.exceptions.ReadTimeout()] * 3)
+    client = AsyncSpotify(spotify, max_retries=2, circuit_breaker=CircuitBreaker(failure_threshold=10))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        run(client.currently_playing())
+    assert len(spotify.calls) == 3
+
+
+def test_client_errors_are_not_retried(run):
+    """A 4xx other than 429 won't fix itself, so it is raised straight away."""
+    spotify = FlakySpotify(SpotifyException(404, -1, "Not found"))
+
+    with pytest.raises(SpotifyException):
+        run(AsyncSpotify(spotify).currently_playing())
+    assert len(spotify.calls) == 1
+
+
+def test_open_circuit_stops_requests(run):
+    """Once the API has failed enough times in a row, no request is made at all."""
+    spotify = FlakySpotify(*[SpotifyException(503, -1, "Unavailable")] * 5)
+    client = AsyncSpotify(spotify, max_retries=0, circuit_breaker=CircuitBreaker(failure_threshold=2))
+
+    for _ in range(2):
+        with pytest.raises(SpotifyException):
+            run(client.currently_playing())
+    with pytest.raises(CircuitOpenError):
+        run(client.currently_playing())
+    assert len(spotify.calls) == 2
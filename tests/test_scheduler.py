@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.scheduler`."""
+
+import pytest
+
+from spotify_playlist_additions.playback import PlaybackState, Track
+from spotify_playlist_additions.scheduler import PollScheduler
+
+
+def _playing(progress_ms, duration_ms=240000, is_playing=True):
+    return PlaybackState(Track("id", "spotify:track:id", "Track", duration_ms), progress_ms, is_playing)
+
+
+@pytest.fixture
+def scheduler():
+    """A scheduler with the default timings."""
+    return PollScheduler(min_wait=200, max_wait=5000, approach_window=2000, idle_wait=1000, max_idle_wait=30000)
+
+
+def test_sleeps_through_the_middle_of_a_track(scheduler):
+    """Mid track, frames are max_wait apart."""
+    assert scheduler.next_wait(_playing(10000)) == 5000
+
+
+def test_wakes_up_before_the_end_of_a_track(scheduler):
+    """The wait is cut short so that the next frame lands at the start of the approach window."""
+    assert scheduler.next_wait(_playing(235000)) == 3000
+
+
+def test_aims_at_the_end_of_a_track(scheduler):
+    """Inside the approach window the next frame is aimed at the middle of the end of track buffer."""
+    assert scheduler.next_wait(_playing(239000)) == 900
+
+    scheduler.observe_latency(400)
+    assert scheduler.next_wait(_playing(239000)) == 800
+
+
+def test_single_frame_at_the_end_of_a_track(scheduler):
+    """Once a frame lands in the end of track buffer, the next one waits until the track has finished."""
+    assert scheduler.next_wait(_playing(239900)) == 200
+
+
+def test_backs_off_while_paused(scheduler):
+    """Paused or idle playback waits exponentially longer, up to max_idle_wait."""
+    waits = [scheduler.next_wait(_playing(1000, is_playing=False)) for _ in range(7)]
+    assert waits == [1000, 2000, 4000, 8000, 16000, 30000, 30000]
+
+    assert scheduler.next_wait(None) == 30000
+    assert scheduler.next_wait(_playing(1000)) == 5000
+    assert scheduler.next_wait(None) == 1000
+
+
+def test_paused_backoff_stops_short_of_the_end_of_the_track(scheduler):
+    """Paused with 10 seconds left, the backoff never sleeps past the start of the approach window, so a resume
+    followed by the track ending is still seen as a full listen."""
+    waits = [scheduler.next_wait(_playing(230000, is_playing=False)) for _ in range(7)]
+    assert waits == [1000, 2000, 4000, 8000, 8000, 8000, 8000]
+
+    assert scheduler.next_wait(_playing(239000, is_playing=False)) == 900
+
+
+def test_request_rate_against_fixed_interval(scheduler):
+    """Listening to a four minute track through takes a fraction of the frames of a fixed 200ms loop."""
+    progress, frames = 0, 0
+    while progress < 240000:
+        progress += scheduler.next_wait(_playing(progress))
+        frames += 1
+
+    assert frames < 240000 / 200 / 15
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.simulation`."""
+
+from spotify_playlist_additions.simulation.harness import run_simulation
+from spotify_playlist_additions.simulation.trace import (FULLY_LISTENED, SKIPPED, ListeningTrace, TracePlay,
+                                                         make_track, synthetic_trace)
+
+
+def _trace():
+    return ListeningTrace([
+        TracePlay(make_track(1, 20000), 20000, pause_at_ms=5000, pause_ms=3000),
+        TracePlay(make_track(2, 20000), 8000),
+        TracePlay(make_track(3, 20000), 20000),
+    ])
+
+
+def test_trace_replays_pauses():
+    """Progress stops moving while a play is paused, and picks up where it left off afterwards."""
+    trace = _trace()
+
+    assert trace.state_at(4000)["progress_ms"] == 4000
+    assert trace.state_at(6000)["progress_ms"] == 5000
+    assert not trace.state_at(6000)["is_playing"]
+    assert trace.state_at(9000)["progress_ms"] == 6000
+    assert trace.state_at(24000)["item"]["id"] == make_track(2, 0)["id"]
+    assert trace.state_at(60000) is None
+
+
+def test_trace_expected_events():
+    """Every play but the last is judged once the next one starts."""
+    assert [(outcome, end) for outcome, _, end in _trace().expected_events()] == [(FULLY_LISTENED, 23000),
+                                                                                  (SKIPPED, 31000)]
+
+
+def test_synthetic_trace_is_repeatable():
+    """The same seed generates the same trace."""
+    first = synthetic_trace(20, seed=3)
+    second = synthetic_trace(20, seed=3)
+
+    assert [play.to_json() for play in first.plays] == [play.to_json() for play in second.plays]
+
+
+def test_simulation_drives_the_engine(run):
+    """The real engine runs against the simulated API and its events are scored against the trace."""
+    report = run(run_simulation(_trace(), speed=10))
+
+    assert report.expected == 2
+    assert report.detected >= 1
+    assert report.requests["POST /api/token"] == 1
+    assert report.requests["GET /v1/me/player/currently-playing"] > 0
+    assert "Requests per hour" in str(report)
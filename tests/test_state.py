@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.state`."""
+
+import time
+
+from spotify_playlist_additions.async_client import AsyncSpotify
+from spotify_playlist_additions.playlist_index import PlaylistIndex
+from spotify_playlist_additions.playlists.autoadd import AutoAddPlaylist
+from spotify_playlist_additions.spotify_playlist_additions import SpotifyPlaylistEngine
+from spotify_playlist_additions.state import StateStore
+
+PLAYLIST = {"id": "playlist", "name": "Playlist"}
+
+
+class OfflineSpotify:
+    """A client that fails the test if it is ever used."""
+    def __getattr__(self, name):
+        raise AssertionError("%s was requested" % name)
+
+
+def test_values_survive_reopening(tmp_path):
+    """Values are kept as JSON on disk, so a new store on the same path reads them back."""
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    store.set("playlist", PLAYLIST)
+    store.set("user_id", "user")
+    store.close()
+
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    assert store.get("playlist") == PLAYLIST
+    assert store.get("user_id") == "user"
+    assert store.get("missing") is None
+
+
+def test_index_restores_without_requests(tmp_path):
+    """A restored index has the same members and snapshot_id as the one that was saved, without touching the API."""
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    saved = PlaylistIndex(AsyncSpotify(OfflineSpotify()), PLAYLIST)
+    saved.update([{"id": "id1", "uri": "spotify:track:id1"}, {"id": None, "uri": "spotify:local:song"}])
+    saved.snapshot_id = "snapshot-1"
+    saved.save(store)
+
+    restored = PlaylistIndex(AsyncSpotify(OfflineSpotify()), PLAYLIST)
+    assert restored.restore(store)
+
+    assert restored.snapshot_id == "snapshot-1"
+    assert len(restored) == 2
+    assert restored.contains({"id": "id1"})
+    assert restored.contains({"uri": "spotify:local:song"})
+
+
+def test_index_without_checkpoint_is_not_restored(tmp_path):
+    """A playlist that was never saved has nothing to restore, so it has to be loaded."""
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+
+    assert not PlaylistIndex(AsyncSpotify(OfflineSpotify()), PLAYLIST).restore(store)
+
+
+def test_engine_only_restores_a_recent_track(tmp_path):
+    """The last observed track is only trusted if it was observed shortly before the restart."""
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    store.set("playlists", [PLAYLIST])
+    track = {
+        "is_playing": True,
+        "progress_ms": 1000,
+        "item": {"id": "id1", "uri": "spotify:track:id1", "name": "Track", "duration_ms": 2000}
+    }
+
+    engine = SpotifyPlaylistEngine(search_wait=200,
+                                   spotify_client=AsyncSpotify(OfflineSpotify()),
+                                   addons=[AutoAddPlaylist],
+                                   state_store=store)
+    assert engine.playlists == [PLAYLIST]
+
+    store.set("last_track", {"track": track, "remaining_duration": 10000, "observed_at": time.time() - 5})
+    restored, remaining_duration = engine._restore_track_state()
+    assert restored.to_dict() == track
+    assert 4000 < remaining_duration <= 5000
+
+    track["is_playing"] = False
+    store.set("last_track", {"track": track, "remaining_duration": 10000, "observed_at": time.time() - 5})
+    assert engine._restore_track_state()[1] == 10000
+
+    store.set("last_track", {"track": track, "remaining_duration": 1000, "observed_at": time.time() - 3600})
+    assert engine._restore_track_state() == (None, 201)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Tests for `spotify_playlist_additions.supervisor`."""
+
+import json
+import time
+
+from spotify_playlist_additions.supervisor import HashRing, Supervisor
+
+SESSIONS = ["user%d" % number for number in range(200)]
+
+
+def test_ring_spreads_keys_evenly():
+    """Every node ends up with a fair share of the keys."""
+    assignment = HashRing(["a", "b", "c", "d"]).assign(SESSIONS)
+
+    assert sum(len(keys) for keys in assignment.values()) == len(SESSIONS)
+    assert all(25 <= len(keys) <= 75 for keys in assignment.values())
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    """Keys either stay where they were or move to the new node, never between the old nodes."""
+    ring = HashRing(["a", "b", "c"])
+    before = {key: ring.node_for(key) for key in SESSIONS}
+
+    ring.add("d")
+    moved = {key for key in SESSIONS if ring.node_for(key) != before[key]}
+
+    assert moved
+    assert all(ring.node_for(key) == "d" for key in moved)
+
+
+def test_removing_a_node_only_moves_its_keys():
+    """Only the keys of the removed node move."""
+    ring = HashRing(["a", "b", "c"])
+    before = {key: ring.node_for(key) for key in SESSIONS}
+
+    ring.remove("b")
+
+    assert all(ring.node_for(key) == before[key] for key in SESSIONS if before[key] != "b")
+    assert "b" not in ring.assign(SESSIONS)
+
+
+class ScriptedConnection:
+    """The supervisor's end of a pipe to a worker that answers with the replies it was given, or acknowledges every
+    assignment straight away if echo is set."""
+    def __init__(self, replies=(), echo=False):
+        self.replies = list(replies)
+        self.echo = echo
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+        if self.echo:
+            self.replies.append(("assigned", message[1], message[2]))
+
+    def poll(self, timeout=0):
+        return bool(self.replies)
+
+    def recv(self):
+        return self.replies.pop(0)
+
+
+def _supervisor(tmp_path, workers):
+    config = tmp_path / "host.json"
+    config.write_text(json.dumps({"sessions": [{"name": name, "playlists": []} for name in SESSIONS[:20]]}))
+    return Supervisor(str(config), workers=workers, rate=12, ack_timeout=0.1)
+
+
+def test_late_acknowledgements_are_dropped(tmp_path):
+    """An acknowledgement of an earlier assignment is never taken for the answer to the current one."""
+    supervisor = _supervisor(tmp_path, 1)
+    worker = supervisor._workers["worker-0"]
+    worker.connection = ScriptedConnection([("assigned", 0, ["user1"]), ("assigned", 1, ["user2"])])
+
+    supervisor._assign(worker, {"user2"})
+
+    assert worker.sessions == {"user2"}
+    assert worker.connection.sent == [("assign", 1, ["user2"], 12)]
+
+
+def test_unreleased_sessions_are_not_handed_on(tmp_path):
+    """A session whose old worker did not acknowledge its release is not started by the new one."""
+    supervisor = _supervisor(tmp_path, 2)
+    old, new = supervisor._workers["worker-0"], supervisor._workers["worker-1"]
+    supervisor._ring.add("worker-0")
+    supervisor._ring.add("worker-1")
+    old.sessions = set(SESSIONS[:20])
+    old.rate = 6
+    old.connection = ScriptedConnection([])
+    new.connection = ScriptedConnection(echo=True)
+
+    supervisor._rebalance()
+
+    assert [message[2:] for message in new.connection.sent] == [([], 6)]
+    assert old.sessions == set(SESSIONS[:20])
+    assert supervisor._unsettled
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_sessions_of_a_crashed_worker_move_and_come_back(tmp_path, monkeypatch):
+    """A crashed worker's sessions are taken over by the other worker, and handed back once it has restarted."""
+    monkeypatch.setenv("SPOTIPY_CLIENT_ID", "client")
+    monkeypatch.setenv("SPOTIPY_CLIENT_SECRET", "secret")
+    config = tmp_path / "host.json"
+    config.write_text(json.dumps({"sessions": [{"name": name, "playlists": []} for name in SESSIONS[:20]]}))
+
+    supervisor = Supervisor(str(config), workers=2, check_interval=0.1)
+    supervisor.start()
+    try:
+        initial = supervisor.assignments
+        assert set().union(*initial.values()) == set(SESSIONS[:20])
+        assert all(initial.values())
+
+        supervisor._workers["worker-0"].process.kill()
+        supervisor._workers["worker-0"].process.join()
+        supervisor.check()
+        assert supervisor.assignments == {"worker-0": set(), "worker-1": set(SESSIONS[:20])}
+
+        def restored():
+            supervisor.check()
+            return supervisor.assignments == initial
+
+        _wait_for(restored)
+
+        supervisor.add_worker()
+        assert all(worker.rate == 10 / 3 for worker in supervisor._workers.values())
+        assert set().union(*supervisor.assignments.values()) == set(SESSIONS[:20])
+    finally:
+        supervisor.stop()